@@ -0,0 +1,6 @@
+"""
+Бенчмарки db.py и пути напоминаний на синтетической базе.
+
+    python -m bench.generate --db bench.db --users 100000 --events-per-user 50
+    python -m bench.run --db bench.db --out bench.json
+"""
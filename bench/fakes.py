@@ -0,0 +1,32 @@
+"""
+Заглушки Telegram для бенчмарков: бот и сообщение, которые только запоминают ответы.
+"""
+from dataclasses import dataclass, field
+from typing import Any, List, Tuple
+
+class FakeBot:
+    """
+    Вместо отправки в Telegram записывает сообщения в sent.
+    """
+    def __init__(self) -> None:
+        self.sent: List[Tuple[int, str]] = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs: Any) -> None:
+        self.sent.append((chat_id, text))
+
+@dataclass
+class FakeUser:
+    id: int
+
+@dataclass
+class FakeMessage:
+    """
+    Минимальное сообщение для вызова обработчиков команд из bot.py.
+    """
+    from_user: FakeUser
+    text: str
+    answers: List[str] = field(default_factory=list)
+
+    async def answer(self, text: str, **kwargs: Any) -> "FakeMessage":
+        self.answers.append(text)
+        return self
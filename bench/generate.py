@@ -0,0 +1,125 @@
+"""
+Генератор синтетической events.db с воспроизводимым (seed) набором пользователей и событий.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+
+import db  # noqa: E402
+
+DEFAULT_TAGS = "учеба=4,досуг=2,спорт=2,важное=1,=4"  # только теги, которые принимает /add
+DEFAULT_REMIND_BEFORE = "60=6,30=2,15=1,off=1"
+INSERT_CHUNK = 50_000
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """
+    Разбирает распределение вида "учеба=5,спорт=2,=3" в словарь значение -> вес.
+    """
+    weights = {}
+    for item in spec.split(","):
+        value, _, weight = item.rpartition("=")
+        weights[value.strip()] = float(weight)
+    return weights
+
+async def create_schema(path: str) -> None:
+    # Схему создают те же миграции, что и у бота
+    await db.open_pool(path, readers=1)
+    try:
+        await db.init_db()
+    finally:
+        await db.close_pool()
+
+def _choices(rng: random.Random, weights: Dict[str, float], count: int) -> List[str]:
+    return rng.choices(list(weights), weights=list(weights.values()), k=count)
+
+def generate_rows(
+    rng: random.Random,
+    users: int,
+    events_per_user: int,
+    tags: Dict[str, float],
+    remind_before: Dict[str, float],
+    days_back: int,
+    days_ahead: int,
+    now: int
+) -> Tuple[List[Tuple[int, int, int]], Iterator[Tuple[int, str, int, str, str, Optional[int]]]]:
+    """
+    Возвращает настройки пользователей и генератор строк events.
+    Число событий пользователя равномерно в [0, 2 * events_per_user], время — с шагом 5 минут
+    в окне [now - days_back, now + days_ahead]. Прошедшие события помечены done или reminded.
+    """
+    settings = []
+    for user_id, value in zip(range(1, users + 1), _choices(rng, remind_before, users)):
+        enabled = value != "off"
+        settings.append((user_id, int(enabled), int(value) if enabled else db.DEFAULT_REMIND_BEFORE))
+    first_slot = (now - days_back * 86400) // 300
+    last_slot = (now + days_ahead * 86400) // 300
+
+    def rows() -> Iterator[Tuple[int, str, int, str, str, Optional[int]]]:
+        for user_id, enabled, minutes in settings:
+            count = rng.randint(0, 2 * events_per_user)
+            for number, tag in enumerate(_choices(rng, tags, count)):
+                starts_at = rng.randint(first_slot, last_slot) * 300
+                if starts_at > now:
+                    status = "active"
+                else:
+                    status = "done" if rng.random() < 0.7 else "reminded"
+                remind_at = starts_at - minutes * 60 if enabled and status == "active" else None
+                yield user_id, f"Событие {number}", starts_at, tag, status, remind_at
+
+    return settings, rows()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Генерация синтетической базы для бенчмарков")
+    parser.add_argument("--db", default="bench.db", help="Путь к создаваемой базе")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--events-per-user", type=int, default=50, help="Среднее число событий на пользователя")
+    parser.add_argument("--tags", default=DEFAULT_TAGS, help="Распределение тегов: тег=вес,...")
+    parser.add_argument("--remind-before", default=DEFAULT_REMIND_BEFORE,
+                        help="Распределение remind_before в минутах: минуты=вес,...; off — уведомления выключены")
+    parser.add_argument("--days-back", type=int, default=30)
+    parser.add_argument("--days-ahead", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    asyncio.run(create_schema(args.db))
+
+    started = time.perf_counter()
+    rng = random.Random(args.seed)
+    settings, rows = generate_rows(
+        rng, args.users, args.events_per_user, parse_weights(args.tags),
+        parse_weights(args.remind_before), args.days_back, args.days_ahead, int(time.time())
+    )
+    conn = sqlite3.connect(args.db)
+    conn.create_function("fts_document", 2, db.fts_document, deterministic=True)
+    conn.execute("PRAGMA synchronous=OFF")
+    with conn:
+        conn.executemany(
+            "INSERT INTO user_settings (user_id, notifications_enabled, remind_before) VALUES (?, ?, ?)", settings
+        )
+        total = 0
+        while True:
+            chunk = [row for _, row in zip(range(INSERT_CHUNK), rows)]
+            if not chunk:
+                break
+            conn.executemany(
+                "INSERT INTO events (user_id, title, starts_at, tag, status, remind_at) VALUES (?, ?, ?, ?, ?, ?)", chunk
+            )
+            total += len(chunk)
+        # Полнотекстовый индекс пишет приложение, а не триггеры — строим его для всей базы сразу
+        conn.execute("INSERT INTO events_fts (rowid, body) SELECT id, fts_document(user_id, title) FROM events")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    print(f"{args.db}: {args.users} пользователей, {total} событий за {time.perf_counter() - started:.1f} с")
+
+if __name__ == "__main__":
+    main()
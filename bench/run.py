@@ -0,0 +1,325 @@
+"""
+Запуск бенчмарков: время каждой функции db.py, команды /week и полного тика send_reminders
+на копии синтетической базы. Результат (p50/p95/p99, запросов на вызов, прирост RSS) — JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+
+import logging  # noqa: E402
+import db  # noqa: E402
+import bot  # noqa: E402
+from bench.fakes import FakeBot, FakeMessage, FakeUser  # noqa: E402
+from config import REMINDER_HORIZON_SECONDS, REMINDER_PARTITIONS, TZ  # noqa: E402
+from delivery import DeliveryPipeline  # noqa: E402
+from schedule import send_reminders  # noqa: E402
+
+Call = Callable[[random.Random], Awaitable[Any]]
+
+class QueryCounter:
+    """
+    Считает SQL-выражения, выполненные всеми соединениями пула (через trace callback sqlite3).
+    """
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, statement: str) -> None:
+        self.count += 1
+
+    async def attach(self) -> None:
+        for conn in db._get_pool()._connections:
+            await conn.set_trace_callback(self)
+
+def percentile(values: List[float], pct: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+# Размеры пачек для add_events, archive_events и ежедневных сводок
+ADD_EVENTS_BATCH = 100
+ARCHIVE_BATCH = 200
+DIGEST_BATCH = 50
+BENCH_ZONES = ("Europe/Moscow", "Asia/Yekaterinburg", "Europe/Kaliningrad")
+
+def peak_rss_kb() -> int:
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def current_rss_kb() -> Optional[int]:
+    # Текущий RSS из /proc (только Linux); на других системах — None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+async def measure(counter: QueryCounter, call: Call, rng: random.Random, iterations: int,
+                  before: Optional[Callable[[], Awaitable[None]]] = None) -> Dict[str, Any]:
+    """
+    Вызывает call iterations раз; before выполняется перед каждым вызовом и не входит в замер.
+    Память — приросты за время замера: rss_delta_kb — текущего RSS, peak_rss_growth_kb — пикового
+    RSS процесса (0, если замер не превысил пик предыдущих).
+    """
+    timings, queries = [], 0
+    rss_before, peak_before = current_rss_kb(), peak_rss_kb()
+    for _ in range(iterations):
+        if before is not None:
+            await before()
+        start_queries = counter.count
+        started = time.perf_counter()
+        await call(rng)
+        timings.append((time.perf_counter() - started) * 1000)
+        queries += counter.count - start_queries
+    return {
+        "calls": iterations,
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "p50_ms": round(percentile(timings, 50), 4),
+        "p95_ms": round(percentile(timings, 95), 4),
+        "p99_ms": round(percentile(timings, 99), 4),
+        "queries_per_call": round(queries / iterations, 2),
+        "rss_delta_kb": None if rss_before is None else current_rss_kb() - rss_before,
+        "peak_rss_growth_kb": peak_rss_kb() - peak_before,
+    }
+
+async def drain(rows: AsyncIterator[Any]) -> int:
+    # Выгрузочные функции — асинхронные генераторы: замеряется полный перебор
+    count = 0
+    async for _ in rows:
+        count += 1
+    return count
+
+def dataset_info(path: str) -> Dict[str, Any]:
+    conn = sqlite3.connect(path)
+    try:
+        users, events, first, last = conn.execute(
+            "SELECT (SELECT COUNT(*) FROM user_settings), COUNT(*), MIN(starts_at), MAX(starts_at) FROM events"
+        ).fetchone()
+    finally:
+        conn.close()
+    return {"users": users, "events": events, "first_starts_at": first, "last_starts_at": last}
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run_benchmarks(path: str, iterations: int, seed: int, readers: int) -> Dict[str, Any]:
+    info = dataset_info(path)
+    users = info["users"]
+    await db.open_pool(path, readers=readers)
+    counter = QueryCounter()
+    await counter.attach()
+    fake_bot = FakeBot()
+    pipeline = DeliveryPipeline(fake_bot, rate=1_000_000, chat_interval=0)
+    pipeline.start()
+    results: Dict[str, Any] = {}
+    try:
+        rng = random.Random(seed)
+        today = datetime.now(TZ).date()
+        now = int(time.time())
+        week_start, week_end = db.day_bounds(today.strftime("%Y-%m-%d"), days=7)
+
+        def user(r: random.Random) -> int:
+            return r.randint(1, users)
+
+        def day(r: random.Random) -> str:
+            return (today + timedelta(days=r.randint(-7, 7))).strftime("%Y-%m-%d")
+
+        async with db._reader() as conn:
+            cursor = await conn.execute("SELECT id, user_id FROM events ORDER BY random() LIMIT ?", (iterations * 3,))
+            sample = [tuple(row) for row in await cursor.fetchall()]
+        deletions = iter(sample[:iterations])
+        status_targets = sample[iterations:]
+
+        async def clear_settings() -> None:
+            db._settings_cache.clear()
+
+        async def clear_render() -> None:
+            bot._render_cache.clear()
+
+        async def week(r: random.Random) -> None:
+            await bot.week_cmd(FakeMessage(FakeUser(user(r)), "/week"))
+
+        async def week_same_user(r: random.Random) -> None:
+            await bot.week_cmd(FakeMessage(FakeUser(1), "/week"))
+
+        reads: Dict[str, Call] = {
+            "get_user_settings": lambda r: db.get_user_settings(user(r)),
+            "get_notifications_enabled": lambda r: db.get_notifications_enabled(user(r)),
+            "get_remind_before": lambda r: db.get_remind_before(user(r)),
+            "get_events_for_reminder": lambda r: db.get_events_for_reminder(until=now + REMINDER_HORIZON_SECONDS),
+            "get_events_for_reminder_user": lambda r: db.get_events_for_reminder(
+                until=now + REMINDER_HORIZON_SECONDS, user_id=user(r)),
+            "get_events_for_reminder_partitions": lambda r: db.get_events_for_reminder(
+                until=now + REMINDER_HORIZON_SECONDS, partitions=range(0, REMINDER_PARTITIONS, 2)),
+            "get_events_for_date": lambda r: db.get_events_for_date(day(r), user(r)),
+            "get_events_for_date_with_id": lambda r: db.get_events_for_date_with_id(day(r), user(r)),
+            "get_events_in_range_week": lambda r: db.get_events_in_range(user(r), week_start, week_end),
+            "get_events_page": lambda r: db.get_events_page(user(r)),
+            "get_all_events_for_user": lambda r: db.get_all_events_for_user(user(r)),
+            "get_event_status": lambda r: db.get_event_status(*r.choice(sample)),
+            "search_events": lambda r: db.search_events(user(r), f"событ {r.randint(1, 99)}"),
+            "get_user_tz": lambda r: db.get_user_tz(user(r)),
+            "get_data_version": lambda r: db.get_data_version(user(r)),
+            "iter_events": lambda r: drain(db.iter_events(user(r))),
+            "iter_digest_events": lambda r: drain(db.iter_digest_events(
+                [(user(r), None, now) for _ in range(DIGEST_BATCH)])),
+        }
+        settings_reads = ("get_user_settings", "get_notifications_enabled", "get_remind_before", "get_user_tz")
+        for name, call in reads.items():
+            before = clear_settings if name in settings_reads else None
+            results[name] = await measure(counter, call, rng, iterations, before)
+        results["iter_digest_events"]["users_per_call"] = DIGEST_BATCH
+        # Пока процесс с базой один, версия данных берётся из памяти; с соседями — запросом к базе
+        db._set_settings_cache_enabled(False)
+        try:
+            results["get_data_version_shared"] = await measure(
+                counter, lambda r: db.get_data_version(user(r)), rng, iterations)
+        finally:
+            db._set_settings_cache_enabled(True)
+        results["week_cmd"] = await measure(counter, week, rng, iterations, clear_render)
+        results["week_cmd_cached"] = await measure(counter, week_same_user, rng, iterations)
+
+        # Полный тик напоминаний: события горизонта перед каждым замером возвращаются в 'active'
+        due = await db.get_events_for_reminder(until=now + REMINDER_HORIZON_SECONDS)
+        tick = [(user_id, event_id, title) for user_id, event_id, title, _ in due]
+
+        async def reset_tick() -> None:
+            fake_bot.sent.clear()
+            async with db._writer() as conn:
+                await conn.executemany("UPDATE events SET status='active' WHERE id=?", [(e,) for _, e, _ in tick])
+
+        results["send_reminders_tick"] = await measure(
+            counter, lambda r: send_reminders(pipeline, tick), rng, max(iterations // 10, 1), reset_tick
+        )
+        results["send_reminders_tick"]["messages_per_tick"] = len(fake_bot.sent)
+
+        writes: Dict[str, Call] = {
+            "add_event": lambda r: db.add_event(user(r), "Бенчмарк", now + r.randint(1, 30 * 86400), "учеба"),
+            "set_event_status": lambda r: db.set_event_status(*r.choice(status_targets), "done"),
+            "delete_event": lambda r: db.delete_event(*next(deletions)),
+            "set_remind_before": lambda r: db.set_remind_before(user(r), r.choice((15, 30, 60))),
+            "set_notifications_enabled": lambda r: db.set_notifications_enabled(user(r), True),
+            "set_events_reminded": lambda r: db.set_events_reminded([r.choice(sample)[0] for _ in range(20)]),
+            "claim_partitions": lambda r: db.claim_partitions("bench", 30),
+            "add_events": lambda r: db.add_events(
+                user(r), [("Импорт", now + r.randint(1, 30 * 86400), "учеба") for _ in range(ADD_EVENTS_BATCH)]),
+            "set_user_tz": lambda r: db.set_user_tz(user(r), r.choice(BENCH_ZONES)),
+            "set_digest_hour": lambda r: db.set_digest_hour(user(r), r.randint(6, 10)),
+            # Ежедневное правило с началом в ближайшую неделю: его вхождения — start + N суток
+            "add_rule": lambda r: db.add_rule(user(r), "Бенчмарк", now + r.randint(1, 7) * 86400, "учеба",
+                                              freq="daily", tz="Europe/Moscow"),
+        }
+        for name, call in writes.items():
+            results[name] = await measure(counter, call, rng, iterations)
+        results["add_events"]["events_per_call"] = ADD_EVENTS_BATCH
+
+        # Правила повторения: в синтетической базе их нет, замеры идут по созданным add_rule
+        async with db._reader() as conn:
+            cursor = await conn.execute("SELECT id, user_id, starts_at FROM event_rules")
+            rules = [tuple(row) for row in await cursor.fetchall()]
+        rule_reads: Dict[str, Call] = {
+            "get_rules": lambda r: db.get_rules(r.choice(rules)[1]),
+            "iter_rules": lambda r: drain(db.iter_rules(r.choice(rules)[1])),
+        }
+        for name, call in rule_reads.items():
+            results[name] = await measure(counter, call, rng, iterations)
+
+        def set_occurrence(r: random.Random) -> Awaitable[bool]:
+            rule_id, owner, starts_at = r.choice(rules)
+            return db.set_occurrence(rule_id, owner, starts_at + r.randint(0, 6) * 86400, status="done")
+
+        results["set_occurrence"] = await measure(counter, set_occurrence, rng, iterations)
+
+        # Сводки: перед каждым вызовом DIGEST_BATCH случайных пользователей получают наступившую сводку
+        async def due_digests() -> None:
+            async with db._writer() as conn:
+                await conn.executemany(
+                    "INSERT INTO user_settings (user_id, digest_hour, digest_at) VALUES (?, 9, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET digest_hour=9, digest_at=excluded.digest_at",
+                    [(user(rng), now - 60) for _ in range(DIGEST_BATCH)]
+                )
+
+        results["claim_digests"] = await measure(
+            counter, lambda r: db.claim_digests(now, DIGEST_BATCH), rng, iterations, due_digests
+        )
+
+        # Архивирование: уже прошедшие события базы переносятся до замера, а перед каждым вызовом
+        # добавляется пачка ARCHIVE_BATCH старых событий — её и переносит archive_events
+        cutoff = now - 365 * 86400
+        await db.archive_events(cutoff)
+
+        async def add_old_events() -> None:
+            async with db._writer() as conn:
+                await conn.executemany(
+                    "INSERT INTO events (user_id, title, starts_at, tag, status) VALUES (?, 'Архив', ?, '', 'done')",
+                    [(user(rng), cutoff - rng.randint(1, 30 * 86400)) for _ in range(ARCHIVE_BATCH)]
+                )
+
+        results["archive_events"] = await measure(
+            counter, lambda r: db.archive_events(cutoff), rng, max(iterations // 10, 1), add_old_events
+        )
+        results["archive_events"]["events_per_call"] = ARCHIVE_BATCH
+        results["vacuum_db"] = await measure(counter, lambda r: db.vacuum_db(), rng, max(iterations // 10, 1))
+    finally:
+        await pipeline.stop()
+        await db.close_pool()
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "iterations": iterations,
+            "seed": seed,
+            "readers": readers,
+            "dataset": info,
+            "peak_rss_kb": peak_rss_kb(),
+        },
+        "results": results,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарки db.py и пути напоминаний")
+    parser.add_argument("--db", default="bench.db", help="База, созданная bench.generate (не изменяется)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--readers", type=int, default=db.DB_READERS)
+    parser.add_argument("--out", help="Файл для JSON (по умолчанию stdout)")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Записывающие бенчмарки меняют базу, поэтому работаем с копией
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "events.db")
+        shutil.copyfile(args.db, path)
+        report = asyncio.run(run_benchmarks(path, args.iterations, args.seed, args.readers))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,38 @@
 import logging
-from datetime import datetime, timedelta
-from typing import Final
-from aiogram import Router, types
+import os
+import re
+import tempfile
+import time
+from datetime import date, datetime, timedelta, tzinfo
+from html import escape
+from itertools import groupby
+from typing import Dict, Final, Iterator, List, Optional, Sequence, Tuple
+from aiogram import F, Router, types
 from aiogram.filters.command import Command
+from aiogram.types import FSInputFile
+from aiogram.utils.keyboard import InlineKeyboardBuilder
 from db import (
-    add_event, set_notifications_enabled, get_notifications_enabled,
-    set_remind_before, get_remind_before, delete_event, get_events_for_date_with_id,
-    get_all_events_for_user, set_event_status
+    add_event, add_events, set_notifications_enabled, get_notifications_enabled,
+    set_remind_before, get_remind_before, delete_event, get_events_in_range,
+    get_events_page, set_event_status, day_bounds, on_events_changed,
+    add_rule, get_rule, get_rules, delete_rule, set_occurrence, search_events,
+    get_user_tz, set_user_tz, get_digest_hour, set_digest_hour, get_data_version
 )
-from pytz import timezone
+from cache import LRUCache
+from config import TZ, RENDER_CACHE_SIZE, RENDER_CACHE_TTL, IMPORT_MAX_BYTES, IMPORT_MAX_ROWS
+from exporter import EXPORT_FORMATS, export_events
+from importer import RawRule, iter_file_events
+from logging_setup import LoggingContextMiddleware
+from metrics import MetricsMiddleware, register_cache
+from recurrence import MAX_COUNT, WEEKDAY_NAMES, Rule, occurrence_on
+from zones import get_zone, parse_zone
 
 router = Router()
+# Время и ошибки обработчиков для /metrics, user_id и команда в записях журнала
+router.message.middleware(MetricsMiddleware())
+router.callback_query.middleware(MetricsMiddleware())
+router.message.middleware(LoggingContextMiddleware())
+router.callback_query.middleware(LoggingContextMiddleware())
 
 TAG_COLORS = {
     "учеба": "🟦",
@@ -33,12 +55,55 @@ ABOUT_TEXT: Final[str] = (
 NO_EVENTS_TODAY: Final[str] = "📭 Сегодня у вас нет событий."
 NO_EVENTS_TOMORROW: Final[str] = "📭 Завтра у вас нет событий."
 NO_EVENTS_WEEK: Final[str] = "📭 На этой неделе у вас нет событий."
+NO_EVENTS_RANGE: Final[str] = "📭 В выбранном периоде у вас нет событий."
 UNKNOWN_COMMAND: Final[str] = "❓ Неизвестная команда. Используйте /help для списка команд."
 ONLY_COMMANDS: Final[str] = "Я понимаю только команды. Для справки — /help."
 ALLTASKS_ERROR: Final[str] = "Произошла ошибка при получении всех задач."
 TODAY_ERROR: Final[str] = "Произошла ошибка при получении задач на сегодня."
 TOMORROW_ERROR: Final[str] = "Произошла ошибка при получении задач на завтра."
 WEEK_ERROR: Final[str] = "Произошла ошибка при получении задач на неделю."
+RANGE_ERROR: Final[str] = "Произошла ошибка при получении задач за период."
+WEEK_USAGE: Final[str] = "Используйте: /week [N] [фильтр] — события на N недель вперёд (от 1 до {max_weeks})"
+RANGE_USAGE: Final[str] = "Используйте: /range YYYY-MM-DD YYYY-MM-DD [фильтр] — события за период (не больше {max_days} дн.)"
+FILTER_ERROR: Final[str] = (
+    "Неизвестный фильтр. Фильтр — тег (учеба, досуг, спорт, важное) "
+    "или статус (active — предстоящие, done — выполненные, overdue — просроченные)."
+)
+NO_EVENTS_FILTERED: Final[str] = "📭 Нет событий с фильтром «{filter}»."
+MAX_WEEKS: Final[int] = 8
+MAX_RANGE_DAYS: Final[int] = 366
+MAX_MESSAGE_LENGTH: Final[int] = 4096  # лимит Telegram на длину сообщения
+
+# Фильтры списков по статусу (ключи db.STATUS_FILTERS) и их русские названия
+STATUS_FILTER_NAMES = {
+    "active": "active", "активные": "active",
+    "done": "done", "выполненные": "done",
+    "overdue": "overdue", "просроченные": "overdue",
+}
+STATUS_FILTER_LABELS = {
+    "active": "предстоящие",
+    "done": "выполненные",
+    "overdue": "просроченные",
+}
+
+def parse_filter(args: Sequence[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Необязательный фильтр списка — тег или статус. Возвращает (tag, status);
+    ValueError, если аргументов больше одного или это не тег и не статус.
+    """
+    if not args:
+        return None, None
+    token = args[0].lower()
+    if len(args) > 1 or (token not in TAG_COLORS and token not in STATUS_FILTER_NAMES):
+        raise ValueError(FILTER_ERROR)
+    if token in TAG_COLORS:
+        return token, None
+    return None, STATUS_FILTER_NAMES[token]
+
+def filter_label(tag: Optional[str], status: Optional[str]) -> str:
+    if tag is not None:
+        return TAG_LABELS[tag]
+    return STATUS_FILTER_LABELS[status] if status is not None else ""
 
 # --- СТАТУСНЫЕ СМАЙЛИКИ ---
 STATUS_ICONS = {
@@ -47,26 +112,181 @@ STATUS_ICONS = {
     'active': '⏳',
 }
 
-def get_status_icon(status: str, event_date: str, event_time: str) -> str:
+def get_status_icon(status: str, starts_at: int, now: Optional[int] = None) -> str:
     """
-    Возвращает смайлик-статус для задачи в зависимости от её статуса и времени.
+    Возвращает смайлик-статус для задачи в зависимости от её статуса и времени начала (UTC-таймстемп).
     """
     if status == 'done':
         return STATUS_ICONS['done']
-    dt = datetime.strptime(f"{event_date} {event_time}", "%Y-%m-%d %H:%M").replace(tzinfo=timezone("Europe/Moscow"))
-    if status == 'overdue' or (status == 'active' and dt < datetime.now(timezone("Europe/Moscow"))):
+    if now is None:
+        now = int(time.time())
+    if status == 'overdue' or (status in ('active', 'reminded') and starts_at < now):
         return STATUS_ICONS['overdue']
     return STATUS_ICONS['active']
 
-DONE_USAGE: Final[str] = "Используйте: /done [id] (id можно узнать в списке событий)"
+def format_event_time(starts_at: int, fmt: str = "%H:%M", tz: tzinfo = TZ) -> str:
+    """
+    Форматирует время начала события (UTC-таймстемп) в часовом поясе tz (по умолчанию — бота).
+    """
+    return datetime.fromtimestamp(starts_at, tz).strftime(fmt)
+
+def format_event_line(event: Tuple[int, str, int, str, str], now_ts: int, tz: tzinfo = TZ) -> str:
+    """
+    Строка события для списков на день/неделю: (id, title, starts_at, tag, status).
+    У вхождения повторяющегося события id — строка r<id правила>-<YYYYMMDD>.
+    """
+    event_id, title, starts_at, tag, status = event
+    repeat = "🔁" if isinstance(event_id, str) else ""
+    return f"{get_status_icon(status, starts_at, now_ts)}{repeat} #{event_id} {TAG_COLORS.get(tag, '')} {format_event_time(starts_at, tz=tz)} — {title}{f' [{TAG_LABELS[tag]}]' if tag else ''}"
+
+def render_day_blocks(events: List[Tuple[int, str, int, str, str]], now_ts: int, tz: tzinfo = TZ) -> List[str]:
+    """
+    Группирует упорядоченные события по дням (в часовом поясе tz) и возвращает строки
+    с заголовком каждого дня.
+    """
+    blocks = []
+    for day, items in groupby(events, key=lambda event: datetime.fromtimestamp(event[2], tz).date()):
+        blocks.append("")
+        blocks.append(f"📅 {day.strftime('%A %d.%m')}:")
+        blocks.extend(format_event_line(event, now_ts, tz) for event in items)
+    return blocks
+
+def split_blocks(blocks: List[str]) -> Iterator[str]:
+    """
+    Склеивает строки в тексты сообщений, не превышая лимит Telegram
+    и не разрывая строки (HTML-теги внутри строки остаются целыми).
+    """
+    chunk: List[str] = []
+    size = 0
+    for block in blocks:
+        block_size = len(block.encode("utf-16-le")) // 2 + 1  # Telegram считает длину в UTF-16
+        if chunk and size + block_size > MAX_MESSAGE_LENGTH:
+            yield "\n".join(chunk)
+            chunk, size = [], 0
+        chunk.append(block)
+        size += block_size
+    if chunk:
+        yield "\n".join(chunk)
+
+async def answer_blocks(message: types.Message, blocks: List[str], **kwargs) -> None:
+    """
+    Отправляет строки одним или несколькими сообщениями (см. split_blocks).
+    """
+    for text in split_blocks(blocks):
+        await message.answer(text, **kwargs)
+
+# Кэш отрисованных расписаний: (user_id, view, first_day, days, tag, status, версия данных) -> строки событий.
+# Версия данных (db.get_data_version) в ключе отсекает записи, устаревшие из-за изменений в других процессах;
+# пока процесс с базой один, она берётся из памяти без запроса.
+# Для точной инвалидации по каждому пользователю хранятся границы [start, end) его записей;
+# границы удаляются вместе с записью кэша, поэтому их не больше RENDER_CACHE_SIZE.
+_render_ranges: Dict[int, Dict[tuple, Tuple[int, int]]] = {}
+
+def _forget_render_range(key: tuple) -> None:
+    ranges = _render_ranges.get(key[0])
+    if ranges is None:
+        return
+    ranges.pop(key, None)
+    if not ranges:
+        del _render_ranges[key[0]]
+
+_render_cache = LRUCache(RENDER_CACHE_SIZE, RENDER_CACHE_TTL, on_remove=_forget_render_range)
+register_cache("render", _render_cache.stats)
+EMPTY_RENDER_TTL: Final[int] = 60  # пустой список может быть и следствием ошибки чтения
+
+async def invalidate_rendered(user_id: int, starts: Sequence[int]) -> None:
+    """
+    Сбрасывает отрисованные расписания пользователя, в период которых попадает
+    хотя бы одно изменённое событие. Пустой starts (изменились настройки или правило
+    повторения целиком) сбрасывает все расписания пользователя.
+    """
+    # Даже без записей в кэше: чтение, начатое до изменения, не должно сохранить старый список
+    _render_cache.invalidate()
+    for key, (start, end) in list(_render_ranges.get(user_id, {}).items()):
+        if not starts or any(start <= ts < end for ts in starts):
+            _render_cache.pop(key)
+
+on_events_changed(invalidate_rendered)
+
+async def get_rendered_events(user_id: int, view: str, first_day: date, days: int, by_day: bool,
+                              tag: Optional[str] = None, status: Optional[str] = None,
+                              tz: tzinfo = TZ) -> List[str]:
+    """
+    Строки событий пользователя за days суток начиная с first_day (с фильтром по тегу или статусу,
+    сутки — в часовом поясе пользователя tz) — из кэша или одним запросом к базе. Запись живёт
+    до ближайшего начала незавершённого события (когда ⏳ сменится на ❌; с фильтром по статусу —
+    до начала следующей минуты) или до изменения данных пользователя в любом процессе;
+    смена часового пояса сбрасывает записи пользователя.
+    """
+    # Версия данных читается до событий: запись из другого процесса между двумя чтениями
+    # даст более новую версию, и сохранённый список при следующем чтении не подойдёт
+    key = (user_id, view, first_day, days, tag, status, await get_data_version(user_id))
+    blocks = _render_cache.get(key)
+    if blocks is not None:
+        return blocks
+    version = _render_cache.version
+    start, end = day_bounds(first_day.strftime("%Y-%m-%d"), days, tz)
+    events = await get_events_in_range(user_id, start, end, tag, status)
+    now_ts = int(time.time())
+    if by_day:
+        blocks = render_day_blocks(events, now_ts, tz)
+    else:
+        blocks = [format_event_line(event, now_ts, tz) for event in events]
+    flips = [starts_at for _, _, starts_at, _, status in events if status != 'done' and starts_at >= now_ts]
+    ttl = min(flips) - now_ts if flips else RENDER_CACHE_TTL
+    ttl = min(ttl, RENDER_CACHE_TTL if events else EMPTY_RENDER_TTL)
+    if status is not None:
+        # В отфильтрованном списке нет событий, которые перейдут в него с началом (⏳ -> overdue),
+        # поэтому ближайшая смена по нему не видна. События начинаются в начале минуты —
+        # запись живёт до начала следующей.
+        ttl = min(ttl, 60 - now_ts % 60)
+    if ttl > 0:
+        _render_cache.set(key, blocks, ttl=ttl, version=version)
+        if key in _render_cache:
+            _render_ranges.setdefault(user_id, {})[key] = (start, end)
+    return blocks
+
+async def answer_events(message: types.Message, view: str, first_day: date, days: int, header: str,
+                        empty_text: str, by_day: bool, tag: Optional[str] = None,
+                        status: Optional[str] = None, tz: tzinfo = TZ) -> None:
+    """
+    Отправляет события пользователя за days суток начиная с first_day (с фильтром по тегу или статусу).
+    """
+    blocks = await get_rendered_events(message.from_user.id, view, first_day, days, by_day, tag, status, tz)
+    label = filter_label(tag, status)
+    if label:
+        header = f"{header.rstrip(':')} — {label}:"
+        empty_text = NO_EVENTS_FILTERED.format(filter=label)
+    if not blocks:
+        await message.answer(empty_text)
+        return
+    await answer_blocks(message, [header] + blocks + ["", DONE_HINT, DELETE_HINT], parse_mode="HTML")
+
+def render_digest(events: List[Tuple[int, str, int, str, str]], day: date, tz: tzinfo) -> List[str]:
+    """
+    Тексты сообщений ежедневной сводки: расписание на день в том же виде, что и /today.
+    """
+    now_ts = int(time.time())
+    lines = [format_event_line(event, now_ts, tz) for event in events]
+    return list(split_blocks([DIGEST_HEADER.format(day=f"{day:%Y-%m-%d}")] + lines + ["", DONE_HINT, DELETE_HINT]))
+
+DONE_USAGE: Final[str] = "Используйте: /done [id] (id можно узнать в списке событий, для повторяющихся — вида r12-20250101)"
 DONE_OK: Final[str] = "✅ Задача #{id} отмечена как выполненная!"
 DONE_FAIL: Final[str] = "Ошибка: не удалось отметить задачу как выполненную."
 ALLTASKS_EMPTY: Final[str] = "📭 У вас нет ни одной задачи за всё время."
 ALLTASKS_HEADER: Final[str] = "🗂️ Все ваши задачи:\n"
+ALLTASKS_FILTER_HEADER: Final[str] = "🗂️ Ваши задачи — {filter}:\n"
+OVERDUE_EMPTY: Final[str] = "🎉 Просроченных задач нет."
 ALLTASKS_HINT: Final[str] = "<b>-Чтобы отметить задачу выполненной: /done [id]\n</b>"
+ALLTASKS_PAGE_SIZE: Final[int] = 20
+ALLTASKS_PREV: Final[str] = "◀️ Назад"
+ALLTASKS_NEXT: Final[str] = "Вперёд ▶️"
 DONE_HINT: Final[str] = "<b>-Чтобы отметить задачу выполненной: /done [id]\n</b>"
 DELETE_HINT: Final[str] = "<b>-Чтобы удалить событие, используйте: /delete [id]</b>"
-DELETE_USAGE: Final[str] = "Используйте: /delete [id] (id можно узнать в списке событий)"
+DELETE_USAGE: Final[str] = (
+    "Используйте: /delete [id] (id можно узнать в списке событий)\n"
+    "/delete r12 — удалить повторяющееся событие целиком, /delete r12-20250101 — одно его вхождение"
+)
 DELETE_OK: Final[str] = "🗑️ Событие #{id} удалено."
 DELETE_FAIL: Final[str] = "Ошибка удаления или нет доступа к событию."
 NOTIFY_ON: Final[str] = "🔔 Напоминания включены. Чтобы отключить — /notify off"
@@ -75,12 +295,59 @@ NOTIFY_USAGE: Final[str] = "Используйте /notify on или /notify off
 REMIND_STATUS: Final[str] = "⏰ Сейчас напоминания приходят за {minutes} мин. до события.\nИзменить: /remind N"
 REMIND_OK: Final[str] = "⏰ Теперь напоминания будут приходить за {minutes} мин. до события."
 REMIND_FAIL: Final[str] = "Введите число минут от 1 до 1440. Пример: /remind 30"
+TZ_STATUS: Final[str] = "🌍 Ваш часовой пояс: {tz} (сейчас {now}).\nИзменить: /tz Europe/Berlin или /tz +5"
+TZ_OK: Final[str] = "🌍 Часовой пояс изменён на {tz} (сейчас {now}). Время событий теперь показывается в нём."
+TZ_FAIL: Final[str] = "Неизвестный часовой пояс «{tz}». Укажите название (Europe/Moscow, Asia/Yekaterinburg) или смещение от UTC (+5, -3)."
+TZ_ERROR: Final[str] = "Не удалось изменить часовой пояс, попробуйте позже."
+DIGEST_HEADER: Final[str] = "☀️ Ваше расписание на сегодня ({day}):"
+DIGEST_STATUS_ON: Final[str] = "📬 Сводка на день приходит в {hour:02d}:00. Отключить — /digest off"
+DIGEST_STATUS_OFF: Final[str] = "📭 Сводка на день отключена. Включить — /digest 8 (час по вашему времени)"
+DIGEST_OK: Final[str] = "📬 Каждый день в {hour:02d}:00 ({tz}) буду присылать расписание на день (если в нём есть события)."
+DIGEST_USAGE: Final[str] = "Используйте: /digest N (час от 0 до 23 по вашему времени) или /digest off"
+DIGEST_ERROR: Final[str] = "Не удалось изменить настройки сводки, попробуйте позже."
 ADD_FORMAT_ERROR: Final[str] = "❗ Формат команды: /add Название YYYY-MM-DD HH:MM [тег]\nОшибка: {error}"
 ADD_UNKNOWN_ERROR: Final[str] = "❗ Ошибка. Проверьте формат команды."
 ADD_PAST_ERROR: Final[str] = "Нельзя добавлять событие в прошлом."
 ADD_TITLE_ERROR: Final[str] = "Укажите название события."
 ADD_DATA_ERROR: Final[str] = "Недостаточно данных"
 ADD_OK: Final[str] = "✅ Задача успешно добавлена!"
+ADD_TAG_ERROR: Final[str] = "Неизвестный тег «{tag}». Доступные теги: учеба, досуг, спорт, важное."
+IMPORT_USAGE: Final[str] = (
+    "📎 Пришлите файл .csv или .ics, чтобы импортировать расписание.\n"
+    "CSV: колонки Название, YYYY-MM-DD, HH:MM и необязательный тег (через запятую или точку с запятой)."
+)
+IMPORT_TOO_LARGE: Final[str] = "Файл слишком большой: не больше {max_kb} КБ."
+IMPORT_OK: Final[str] = "📥 Импорт завершён: добавлено {added}, отклонено {rejected}."
+IMPORT_TRUNCATED: Final[str] = "Импортированы только первые {max_rows} событий файла."
+IMPORT_ROW_ERROR: Final[str] = "строка {line}: {error}"
+IMPORT_ERROR: Final[str] = "Произошла ошибка при импорте файла."
+IMPORT_ERRORS_SHOWN: Final[int] = 5
+EXPORT_USAGE: Final[str] = "Используйте: /export ics или /export csv — выгрузить все события файлом"
+EXPORT_EMPTY: Final[str] = "📭 Выгружать нечего: у вас нет событий."
+EXPORT_CAPTION: Final[str] = "📤 Ваши события: {count}"
+EXPORT_ERROR: Final[str] = "Произошла ошибка при выгрузке событий."
+REPEAT_FORMAT_ERROR: Final[str] = (
+    "❗ Формат команды: /repeat Повтор [до:YYYY-MM-DD | раз:N] Название YYYY-MM-DD HH:MM [тег]\n"
+    "Повтор: daily, weekly или дни недели через запятую (пн,ср,пт).\nОшибка: {error}"
+)
+REPEAT_SPEC_ERROR: Final[str] = "Неизвестный повтор «{spec}»."
+REPEAT_UNTIL_ERROR: Final[str] = "Дата окончания должна быть в формате до:YYYY-MM-DD и не раньше первого события."
+REPEAT_COUNT_ERROR: Final[str] = "Число повторений — от 1 до {max_count}: раз:N."
+REPEAT_OK: Final[str] = "✅ Повторяющееся событие добавлено:\n{rule}"
+REPEAT_FAIL: Final[str] = "Ошибка: не удалось добавить повторяющееся событие."
+REPEAT_HEADER: Final[str] = "🔁 Повторяющиеся события:"
+MOVE_USAGE: Final[str] = "Используйте: /move r12-20250101 YYYY-MM-DD HH:MM — перенести одно вхождение повторяющегося события"
+MOVE_OK: Final[str] = "🕑 Вхождение #{id} перенесено на {when}."
+MOVE_FAIL: Final[str] = "Ошибка переноса или нет такого вхождения."
+FIND_USAGE: Final[str] = "Используйте: /find слова — поиск событий по названию (можно начало слова: /find матан)"
+FIND_EMPTY: Final[str] = "🔍 Ничего не найдено."
+FIND_HEADER: Final[str] = "🔍 Найдено по запросу «{query}»:"
+FIND_ERROR: Final[str] = "Произошла ошибка при поиске событий."
+FIND_LIMIT: Final[int] = 20
+# Идентификатор повторяющегося события (r12) или его вхождения (r12-20250101)
+OCCURRENCE_REF = re.compile(r"^r(\d+)(?:-(\d{8}))?$", re.IGNORECASE)
+REPEAT_DAILY = ("daily", "ежедневно")
+REPEAT_WEEKLY = ("weekly", "еженедельно")
 
 @router.message(Command("start"))
 async def about_cmd(message: types.Message) -> None:
@@ -94,19 +361,29 @@ async def help_cmd(message: types.Message) -> None:
     """
     Отправляет пользователю справку по доступным командам.
     """
-    today = datetime.now(timezone("Europe/Moscow")).strftime("%Y-%m-%d")
+    today = datetime.now(TZ).strftime("%Y-%m-%d")
     help_text = (
         "🧭 Доступные команды:\n"
         "/today — расписание на сегодня\n"
         "/tomorrow — на завтра\n"
-        "/week — на неделю\n"
+        "/week [N] — на неделю (или на N недель)\n"
+        "/range Дата Дата — за произвольный период\n"
+        "  к спискам можно добавить фильтр: тег или статус (active, done, overdue), например /today спорт\n"
+        "/overdue — просроченные задачи\n"
         f"/add Название Дата Время [тег] — добавить событие\n"
+        "/repeat Повтор Название Дата Время [тег] — повторяющееся событие\n"
+        "/move [id] Дата Время — перенести вхождение повторяющегося события\n"
         "/schedule — пример добавления события\n"
         "/notify on|off — включить/отключить напоминания\n"
         "/remind N — за сколько минут до события напоминать\n"
+        "/tz Пояс — часовой пояс (Europe/Berlin или +5), в нём вводится и показывается время\n"
+        "/digest N|off — присылать расписание на день каждый день в N часов\n"
         "/alltasks - выводит все события которые пользователь вводил в бота\n"
+        "/find слова — найти события по названию\n"
         "/done [id] - отмечает событие выполненным\n"
-        "/delete [id] - удаляет событие"
+        "/delete [id] - удаляет событие\n"
+        "/export ics|csv — выгрузить все события файлом\n"
+        "📎 Пришлите файл .csv или .ics — импорт расписания целиком"
         "\n\n🎨 Поддерживаются теги: учеба, досуг, спорт, важное (цветовая маркировка)."
     )
     await message.answer(help_text)
@@ -116,17 +393,49 @@ async def schedule_info(message: types.Message) -> None:
     """
     Отправляет пример добавления задачи и формат команды /add.
     """
-    now = datetime.now(timezone("Europe/Moscow"))
+    now = datetime.now(await get_user_tz(message.from_user.id))
     today = now.strftime("%Y-%m-%d")
-    time = (now + timedelta(hours=2)).strftime("%H:%M")
+    example_time = (now + timedelta(hours=2)).strftime("%H:%M")
     schedule_text = (
         "Формат: /add Название YYYY-MM-DD HH:MM [тег]\n\n"
         "Пример добавления задачи:\n"
-        f"\n/add Встреча {today} {time} досуг\n\n"
-        "Теги: учеба🟦, досуг🟩, спорт🟧, важное🟥 (цветовая маркировка)"
+        f"\n/add Встреча {today} {example_time} досуг\n\n"
+        "Теги: учеба🟦, досуг🟩, спорт🟧, важное🟥 (цветовая маркировка)\n\n"
+        "Повторяющееся событие: /repeat Повтор [до:YYYY-MM-DD | раз:N] Название YYYY-MM-DD HH:MM [тег]\n"
+        f"\n/repeat пн,ср до:{now.year}-12-31 Тренировка {today} {example_time} спорт\n"
+        f"/repeat daily раз:10 Зарядка {today} {example_time}"
     )
     await message.answer(schedule_text)
 
+def parse_event(title: str, date_str: str, time_str: str, tag: str = "", allow_past: bool = False,
+                tz: tzinfo = TZ) -> Tuple[str, int, str]:
+    """
+    Проверяет поля события по правилам /add и возвращает (название, starts_at, тег).
+    Дата и время — местные в часовом поясе пользователя tz. allow_past разрешает время
+    в прошлом (первое вхождение импортированного правила повторения).
+    При ошибке выбрасывает ValueError с текстом для пользователя.
+    """
+    title = title.strip()
+    if not title:
+        raise ValueError(ADD_TITLE_ERROR)
+    tag = tag.strip().lower()
+    if tag and tag not in TAG_COLORS:
+        raise ValueError(ADD_TAG_ERROR.format(tag=tag))
+    dt = tz.localize(datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M"))
+    if dt < datetime.now(tz) and not allow_past:
+        raise ValueError(ADD_PAST_ERROR)
+    return title, int(dt.timestamp()), tag
+
+def split_event_args(parts: List[str]) -> Tuple[str, str, str, str]:
+    """
+    Делит аргументы «Название YYYY-MM-DD HH:MM [тег]» на (название, дата, время, тег).
+    """
+    if len(parts) < 3:
+        raise ValueError(ADD_DATA_ERROR)
+    if len(parts) >= 4 and parts[-1].lower() in TAG_COLORS:
+        return " ".join(parts[:-3]), parts[-3], parts[-2], parts[-1].lower()
+    return " ".join(parts[:-2]), parts[-2], parts[-1], ""
+
 @router.message(Command("add"))
 async def add_cmd(message: types.Message) -> None:
     """
@@ -136,50 +445,212 @@ async def add_cmd(message: types.Message) -> None:
     text = message.text
     try:
         _, content = text.split(maxsplit=1)
-        parts = content.strip().split()
-        if len(parts) < 3:
-            raise ValueError(ADD_DATA_ERROR)
-        tag = ""
-        if len(parts) >= 4 and parts[-1].lower() in TAG_COLORS:
-            tag = parts[-1].lower()
-            time_str = parts[-2]
-            date_str = parts[-3]
-            title = " ".join(parts[:-3])
-        else:
-            time_str = parts[-1]
-            date_str = parts[-2]
-            title = " ".join(parts[:-2])
-        if not title.strip():
-            raise ValueError(ADD_TITLE_ERROR)
-        dt = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M").replace(tzinfo=timezone("Europe/Moscow"))
-        if dt < datetime.now(timezone("Europe/Moscow")):
-            raise ValueError(ADD_PAST_ERROR)
+        tz = await get_user_tz(user_id)
+        title, starts_at, tag = parse_event(*split_event_args(content.strip().split()), tz=tz)
     except ValueError as e:
         logging.warning(f"Ошибка валидации команды /add: {e}")
         return await message.answer(ADD_FORMAT_ERROR.format(error=e))
     except Exception as e:
         logging.error(f"Неизвестная ошибка в команде /add: {e}")
         return await message.answer(ADD_UNKNOWN_ERROR)
-    await add_event(user_id, title.strip(), date_str, time_str, tag)
+    await add_event(user_id, title, starts_at, tag)
     await message.answer(ADD_OK)
 
+def parse_repeat(spec: str) -> Tuple[str, Tuple[int, ...]]:
+    """
+    Повтор из /repeat: daily, weekly (в день недели первого события) или дни недели
+    через запятую. Возвращает (freq, weekdays).
+    """
+    spec = spec.lower()
+    if spec in REPEAT_DAILY:
+        return "daily", ()
+    if spec in REPEAT_WEEKLY:
+        return "weekly", ()
+    try:
+        return "weekly", tuple(WEEKDAY_NAMES.index(day) for day in spec.split(","))
+    except ValueError:
+        raise ValueError(REPEAT_SPEC_ERROR.format(spec=spec))
+
+def format_rule(rule: Rule) -> str:
+    """
+    Строка правила повторения для /alltasks и ответа /repeat (время — в часовом поясе правила).
+    """
+    tz = get_zone(rule.tz)
+    first = datetime.fromtimestamp(rule.starts_at, tz)
+    if rule.freq == "daily":
+        when = "каждый день" if rule.interval == 1 else f"каждые {rule.interval} дн."
+    else:
+        days = ", ".join(WEEKDAY_NAMES[day] for day in rule.weekdays or (first.weekday(),))
+        when = f"по {days}" if rule.interval == 1 else f"раз в {rule.interval} нед. по {days}"
+    text = f"🔁 #r{rule.id} {TAG_COLORS.get(rule.tag, '')} {rule.title} — {when} в {first:%H:%M}, с {first:%d.%m.%Y}"
+    if rule.count is not None:
+        text += f", {rule.count} раз"
+    elif rule.until is not None:
+        text += f", до {datetime.fromtimestamp(rule.until, tz):%d.%m.%Y}"
+    return text + (f" [{TAG_LABELS[rule.tag]}]" if rule.tag else "")
+
+@router.message(Command("repeat"))
+async def repeat_cmd(message: types.Message) -> None:
+    """
+    Обрабатывает команду /repeat — добавляет повторяющееся событие одним правилом.
+    """
+    user_id = message.from_user.id
+    tz = await get_user_tz(user_id)
+    try:
+        parts = message.text.split()[1:]
+        if len(parts) < 4:
+            raise ValueError(ADD_DATA_ERROR)
+        freq, weekdays = parse_repeat(parts[0])
+        until = count = None
+        rest = parts[1:]
+        while rest and rest[0].lower().startswith(("до:", "раз:")):
+            key, value = rest.pop(0).lower().split(":", 1)
+            if key == "до":
+                try:
+                    until = day_bounds(value, tz=tz)[1] - 1
+                except ValueError:
+                    raise ValueError(REPEAT_UNTIL_ERROR)
+            elif not value.isdigit() or not (1 <= int(value) <= MAX_COUNT):
+                raise ValueError(REPEAT_COUNT_ERROR.format(max_count=MAX_COUNT))
+            else:
+                count = int(value)
+        title, starts_at, tag = parse_event(*split_event_args(rest), tz=tz)
+        if until is not None and until < starts_at:
+            raise ValueError(REPEAT_UNTIL_ERROR)
+    except ValueError as e:
+        logging.warning(f"Ошибка валидации команды /repeat: {e}")
+        return await message.answer(REPEAT_FORMAT_ERROR.format(error=e))
+    rule_id = await add_rule(user_id, title, starts_at, tag, freq, weekdays, until=until, count=count, tz=tz.zone)
+    rule = await get_rule(rule_id, user_id) if rule_id is not None else None
+    if rule is None:
+        return await message.answer(REPEAT_FAIL)
+    await message.answer(REPEAT_OK.format(rule=format_rule(rule)))
+
+async def resolve_occurrence(user_id: int, ref: str) -> Optional[Tuple[int, int]]:
+    """
+    Находит вхождение повторяющегося события по идентификатору r<id>-<YYYYMMDD>.
+    Возвращает (id правила, время начала вхождения) или None.
+    """
+    match = OCCURRENCE_REF.match(ref)
+    if not match or not match.group(2):
+        return None
+    try:
+        day = datetime.strptime(match.group(2), "%Y%m%d").date()
+    except ValueError:
+        return None
+    rule = await get_rule(int(match.group(1)), user_id)
+    occurrence_at = occurrence_on(rule, day) if rule is not None else None
+    return (rule.id, occurrence_at) if occurrence_at is not None else None
+
+@router.message(Command("move"))
+async def move_cmd(message: types.Message) -> None:
+    """
+    Переносит одно вхождение повторяющегося события на другое время.
+    """
+    user_id = message.from_user.id
+    args = message.text.split()
+    if len(args) != 4:
+        return await message.answer(MOVE_USAGE)
+    tz = await get_user_tz(user_id)
+    try:
+        _, moved_to, _ = parse_event(args[1], args[2], args[3], tz=tz)
+    except ValueError as e:
+        return await message.answer(f"{MOVE_USAGE}\nОшибка: {e}")
+    occurrence = await resolve_occurrence(user_id, args[1])
+    if occurrence is None or not await set_occurrence(occurrence[0], user_id, occurrence[1], moved_to=moved_to):
+        return await message.answer(MOVE_FAIL)
+    await message.answer(MOVE_OK.format(id=args[1].lower(), when=format_event_time(moved_to, "%d.%m.%Y %H:%M", tz)))
+
+@router.message(Command("export"))
+async def export_cmd(message: types.Message) -> None:
+    """
+    Выгружает все события пользователя (включая архив) файлом .ics или .csv.
+    """
+    args = message.text.split()
+    if len(args) != 2 or args[1].lower() not in EXPORT_FORMATS:
+        return await message.answer(EXPORT_USAGE)
+    fmt = args[1].lower()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"schedule.{fmt}")
+            count = await export_events(path, fmt, message.from_user.id, await get_user_tz(message.from_user.id))
+            if not count:
+                return await message.answer(EXPORT_EMPTY)
+            await message.answer_document(FSInputFile(path), caption=EXPORT_CAPTION.format(count=count))
+    except Exception as e:
+        logging.error(f"Ошибка в команде /export: {e}")
+        await message.answer(EXPORT_ERROR)
+
+@router.message(F.document)
+async def import_cmd(message: types.Message) -> None:
+    """
+    Импортирует события из присланного файла .csv или .ics: файл разбирается построчно,
+    каждая строка проверяется как /add, подходящие события добавляются одной транзакцией.
+    Повторяющиеся события iCalendar сохраняются правилами (по строке на правило).
+    """
+    document = message.document
+    kind = os.path.splitext(document.file_name or "")[1].lower().lstrip(".")
+    if kind not in ("csv", "ics"):
+        return await message.answer(IMPORT_USAGE)
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        return await message.answer(IMPORT_TOO_LARGE.format(max_kb=IMPORT_MAX_BYTES // 1024))
+    errors: List[str] = []
+    stats = {"rejected": 0, "truncated": False}
+    rules: List[Tuple[Tuple[str, int, str], RawRule]] = []
+    tz = await get_user_tz(message.from_user.id)
+
+    def valid_events(path: str) -> Iterator[Tuple[str, int, str]]:
+        accepted = 0
+        for raw in iter_file_events(path, kind, tz):
+            if accepted >= IMPORT_MAX_ROWS:
+                stats["truncated"] = True
+                return
+            try:
+                if raw.error:
+                    raise ValueError(raw.error)
+                event = parse_event(raw.title, raw.date, raw.time, raw.tag, allow_past=raw.rule is not None, tz=tz)
+            except ValueError as e:
+                stats["rejected"] += 1
+                if len(errors) < IMPORT_ERRORS_SHOWN:
+                    errors.append(IMPORT_ROW_ERROR.format(line=raw.line, error=escape(str(e), quote=False)))
+                continue
+            accepted += 1
+            if raw.rule is not None:
+                rules.append((event, raw.rule))
+                continue
+            yield event
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"import.{kind}")
+            await message.bot.download(document, destination=path)
+            added = await add_events(message.from_user.id, valid_events(path))
+        for (title, starts_at, tag), rule in rules:
+            if await add_rule(message.from_user.id, title, starts_at, tag, tz=tz.zone, **rule._asdict()) is not None:
+                added += 1
+    except Exception as e:
+        logging.error(f"Ошибка импорта файла: {e}")
+        return await message.answer(IMPORT_ERROR)
+    lines = [IMPORT_OK.format(added=added, rejected=stats["rejected"])]
+    if stats["truncated"]:
+        lines.append(IMPORT_TRUNCATED.format(max_rows=IMPORT_MAX_ROWS))
+    lines += errors
+    await message.answer("\n".join(lines))
+
 @router.message(Command("today"))
 async def today_cmd(message: types.Message) -> None:
     """
     Показывает список задач пользователя на сегодня.
     """
     try:
-        date_str = datetime.now(timezone("Europe/Moscow")).strftime("%Y-%m-%d")
-        events = await get_events_for_date_with_id(date_str, message.from_user.id)
-        if not events:
-            await message.answer(NO_EVENTS_TODAY)
-        else:
-            text = "\n".join([
-                f"{get_status_icon(status, date_str, t)} #{event_id} {TAG_COLORS.get(tag, '')} {t} — {title}{f' [{TAG_LABELS[tag]}]' if tag else ''}"
-                for event_id, title, t, tag, status in events
-            ])
-            text += f"\n\n{DONE_HINT}\n{DELETE_HINT}"
-            await message.answer(f"📅 Сегодня ({date_str}):\n" + text, parse_mode="HTML")
+        tag, status = parse_filter(message.text.split()[1:])
+    except ValueError as e:
+        return await message.answer(str(e))
+    try:
+        tz = await get_user_tz(message.from_user.id)
+        today = datetime.now(tz).date()
+        await answer_events(message, "today", today, 1, f"📅 Сегодня ({today:%Y-%m-%d}):", NO_EVENTS_TODAY, by_day=False,
+                            tag=tag, status=status, tz=tz)
     except Exception as e:
         logging.error(f"Ошибка в команде /today: {e}")
         await message.answer(TODAY_ERROR)
@@ -190,17 +661,14 @@ async def tomorrow_cmd(message: types.Message) -> None:
     Показывает список задач пользователя на завтра.
     """
     try:
-        date_str = (datetime.now(timezone("Europe/Moscow")) + timedelta(days=1)).strftime("%Y-%m-%d")
-        events = await get_events_for_date_with_id(date_str, message.from_user.id)
-        if not events:
-            await message.answer(NO_EVENTS_TOMORROW)
-        else:
-            text = "\n".join([
-                f"{get_status_icon(status, date_str, t)} #{event_id} {TAG_COLORS.get(tag, '')} {t} — {title}{f' [{TAG_LABELS[tag]}]' if tag else ''}"
-                for event_id, title, t, tag, status in events
-            ])
-            text += f"\n\n{DONE_HINT}\n{DELETE_HINT}"
-            await message.answer(f"📅 Завтра ({date_str}):\n" + text, parse_mode="HTML")
+        tag, status = parse_filter(message.text.split()[1:])
+    except ValueError as e:
+        return await message.answer(str(e))
+    try:
+        tz = await get_user_tz(message.from_user.id)
+        tomorrow = datetime.now(tz).date() + timedelta(days=1)
+        await answer_events(message, "tomorrow", tomorrow, 1, f"📅 Завтра ({tomorrow:%Y-%m-%d}):", NO_EVENTS_TOMORROW, by_day=False,
+                            tag=tag, status=status, tz=tz)
     except Exception as e:
         logging.error(f"Ошибка в команде /tomorrow: {e}")
         await message.answer(TOMORROW_ERROR)
@@ -208,32 +676,59 @@ async def tomorrow_cmd(message: types.Message) -> None:
 @router.message(Command("week"))
 async def week_cmd(message: types.Message) -> None:
     """
-    Показывает задачи пользователя на ближайшую неделю.
+    Показывает задачи пользователя на ближайшую неделю (или на N недель: /week N),
+    с необязательным фильтром: /week [N] спорт.
     """
+    args = message.text.split()[1:]
+    weeks = 1
+    if args and args[0].isdigit():
+        weeks = int(args.pop(0))
+        if not (1 <= weeks <= MAX_WEEKS):
+            await message.answer(WEEK_USAGE.format(max_weeks=MAX_WEEKS))
+            return
     try:
-        today = datetime.now(timezone("Europe/Moscow"))
-        found = False
-        week_text = "📆 События на неделю:\n"
-        for i in range(7):
-            d = today + timedelta(days=i)
-            date_str = d.strftime("%Y-%m-%d")
-            events = await get_events_for_date_with_id(date_str, message.from_user.id)
-            if events:
-                found = True
-                day_text = f"\n📅 {d.strftime('%A %d.%m')}:\n" + "\n".join([
-                    f"{get_status_icon(status, date_str, t)} #{event_id} {TAG_COLORS.get(tag, '')} {t} — {title}{f' [{TAG_LABELS[tag]}]' if tag else ''}"
-                    for event_id, title, t, tag, status in events
-                ])
-                week_text += day_text + "\n"
-        if not found:
-            await message.answer(NO_EVENTS_WEEK)
-        else:
-            week_text += f"\n{DONE_HINT}\n{DELETE_HINT}"
-            await message.answer(week_text, parse_mode="HTML")
+        tag, status = parse_filter(args)
+    except ValueError as e:
+        return await message.answer(f"{e}\n{WEEK_USAGE.format(max_weeks=MAX_WEEKS)}")
+    try:
+        header = "📆 События на неделю:" if weeks == 1 else f"📆 События на {weeks} нед.:"
+        empty_text = NO_EVENTS_WEEK if weeks == 1 else NO_EVENTS_RANGE
+        tz = await get_user_tz(message.from_user.id)
+        await answer_events(message, "week", datetime.now(tz).date(), 7 * weeks, header, empty_text, by_day=True,
+                            tag=tag, status=status, tz=tz)
     except Exception as e:
         logging.error(f"Ошибка в команде /week: {e}")
         await message.answer(WEEK_ERROR)
 
+@router.message(Command("range"))
+async def range_cmd(message: types.Message) -> None:
+    """
+    Показывает задачи пользователя за произвольный период: /range YYYY-MM-DD YYYY-MM-DD [фильтр].
+    """
+    args = message.text.split()
+    try:
+        if len(args) not in (3, 4):
+            raise ValueError
+        first_day = datetime.strptime(args[1], "%Y-%m-%d").date()
+        last_day = datetime.strptime(args[2], "%Y-%m-%d").date()
+        days = (last_day - first_day).days + 1
+        if not (1 <= days <= MAX_RANGE_DAYS):
+            raise ValueError
+    except ValueError:
+        await message.answer(RANGE_USAGE.format(max_days=MAX_RANGE_DAYS))
+        return
+    try:
+        tag, status = parse_filter(args[3:])
+    except ValueError as e:
+        return await message.answer(str(e))
+    try:
+        header = f"📆 События с {first_day:%d.%m.%Y} по {last_day:%d.%m.%Y}:"
+        await answer_events(message, "range", first_day, days, header, NO_EVENTS_RANGE, by_day=True,
+                            tag=tag, status=status, tz=await get_user_tz(message.from_user.id))
+    except Exception as e:
+        logging.error(f"Ошибка в команде /range: {e}")
+        await message.answer(RANGE_ERROR)
+
 @router.message(Command("delete"))
 async def delete_cmd(message: types.Message) -> None:
     """
@@ -241,11 +736,20 @@ async def delete_cmd(message: types.Message) -> None:
     """
     user_id = message.from_user.id
     args = message.text.split()
-    if len(args) != 2 or not args[1].isdigit():
+    if len(args) != 2 or not (args[1].isdigit() or OCCURRENCE_REF.match(args[1])):
         await message.answer(DELETE_USAGE)
         return
-    event_id = int(args[1])
-    ok = await delete_event(event_id, user_id)
+    if args[1].isdigit():
+        event_id = int(args[1])
+        ok = await delete_event(event_id, user_id)
+    else:
+        event_id = args[1].lower()
+        rule_match = OCCURRENCE_REF.match(event_id)
+        if rule_match.group(2) is None:
+            ok = await delete_rule(int(rule_match.group(1)), user_id)
+        else:
+            occurrence = await resolve_occurrence(user_id, event_id)
+            ok = occurrence is not None and await set_occurrence(occurrence[0], user_id, occurrence[1], status='deleted')
     if ok:
         await message.answer(DELETE_OK.format(id=event_id))
     else:
@@ -258,11 +762,16 @@ async def done_cmd(message: types.Message) -> None:
     """
     user_id = message.from_user.id
     args = message.text.split()
-    if len(args) != 2 or not args[1].isdigit():
+    if len(args) != 2 or not (args[1].isdigit() or OCCURRENCE_REF.match(args[1])):
         await message.answer(DONE_USAGE)
         return
-    event_id = int(args[1])
-    ok = await set_event_status(event_id, user_id, 'done')
+    if args[1].isdigit():
+        event_id = int(args[1])
+        ok = await set_event_status(event_id, user_id, 'done')
+    else:
+        event_id = args[1].lower()
+        occurrence = await resolve_occurrence(user_id, event_id)
+        ok = occurrence is not None and await set_occurrence(occurrence[0], user_id, occurrence[1], status='done')
     if ok:
         await message.answer(DONE_OK.format(id=event_id))
     else:
@@ -311,35 +820,191 @@ async def remind_cmd(message: types.Message) -> None:
     except Exception:
         await message.answer(REMIND_FAIL)
 
+@router.message(Command("tz"))
+async def tz_cmd(message: types.Message) -> None:
+    """
+    Показывает или устанавливает часовой пояс пользователя: /tz Europe/Berlin, /tz +5.
+    """
+    user_id = message.from_user.id
+    args = message.text.split()
+    if len(args) == 1:
+        tz = await get_user_tz(user_id)
+        await message.answer(TZ_STATUS.format(tz=tz.zone, now=f"{datetime.now(tz):%H:%M}"))
+        return
+    try:
+        tz_name = parse_zone(args[1])
+    except ValueError:
+        return await message.answer(TZ_FAIL.format(tz=escape(args[1], quote=False)))
+    if not await set_user_tz(user_id, tz_name):
+        return await message.answer(TZ_ERROR)
+    await message.answer(TZ_OK.format(tz=tz_name, now=f"{datetime.now(get_zone(tz_name)):%H:%M}"))
+
+@router.message(Command("digest"))
+async def digest_cmd(message: types.Message) -> None:
+    """
+    Показывает, включает (/digest 8 — в 08:00 по времени пользователя) или отключает
+    (/digest off) ежедневную сводку расписания.
+    """
+    user_id = message.from_user.id
+    args = message.text.split()
+    if len(args) == 1:
+        hour = await get_digest_hour(user_id)
+        await message.answer(DIGEST_STATUS_ON.format(hour=hour) if hour is not None else DIGEST_STATUS_OFF)
+        return
+    if args[1].lower() == "off":
+        hour = None
+    elif args[1].isdigit() and 0 <= int(args[1]) <= 23:
+        hour = int(args[1])
+    else:
+        return await message.answer(DIGEST_USAGE)
+    if not await set_digest_hour(user_id, hour):
+        return await message.answer(DIGEST_ERROR)
+    if hour is None:
+        await message.answer(DIGEST_STATUS_OFF)
+    else:
+        await message.answer(DIGEST_OK.format(hour=hour, tz=(await get_user_tz(user_id)).zone))
+
+def format_dated_event_line(event: Tuple[int, str, int, str, str], now_ts: int, tz: tzinfo = TZ) -> str:
+    """
+    Строка события с датой для /alltasks и /find: (id, title, starts_at, tag, status).
+    """
+    event_id, title, starts_at, tag, status = event
+    repeat = "🔁" if isinstance(event_id, str) else ""
+    return f"{get_status_icon(status, starts_at, now_ts)}{repeat} #{event_id} {format_event_time(starts_at, '%Y-%m-%d %H:%M', tz)} {TAG_COLORS.get(tag, '')} {title}{f' [{TAG_LABELS[tag]}]' if tag else ''}"
+
+def render_alltasks_page(events: List[Tuple[int, str, int, str, str]], has_prev: bool,
+                         has_next: bool, filter_token: str = "",
+                         tz: tzinfo = TZ) -> Tuple[str, Optional[types.InlineKeyboardMarkup]]:
+    """
+    Текст страницы /alltasks и клавиатура навигации; в кнопках — ключи (starts_at, id)
+    первой и последней задачи страницы и фильтр списка.
+    """
+    now_ts = int(time.time())
+    text = "\n".join(format_dated_event_line(event, now_ts, tz) for event in events)
+    text += f"\n\n{DONE_HINT}\n{DELETE_HINT}"
+    builder = InlineKeyboardBuilder()
+    if has_prev:
+        first_id, _, first_starts_at, _, _ = events[0]
+        builder.button(text=ALLTASKS_PREV, callback_data=f"alltasks:prev:{first_starts_at}:{first_id}:{filter_token}")
+    if has_next:
+        last_id, _, last_starts_at, _, _ = events[-1]
+        builder.button(text=ALLTASKS_NEXT, callback_data=f"alltasks:next:{last_starts_at}:{last_id}:{filter_token}")
+    markup = builder.as_markup() if has_prev or has_next else None
+    tag, status = parse_filter([filter_token] if filter_token else [])
+    header = ALLTASKS_FILTER_HEADER.format(filter=filter_label(tag, status)) if filter_token else ALLTASKS_HEADER
+    return header + text, markup
+
+async def answer_alltasks(message: types.Message, filter_token: str, empty_text: str) -> None:
+    """
+    Отправляет первую страницу задач пользователя с фильтром filter_token (тег, статус или пусто).
+    Правила повторения (по строке на каждое) идут перед ней отдельными сообщениями: их число
+    не ограничено, а страница должна помещаться в одно сообщение, чтобы её можно было листать.
+    """
+    user_id = message.from_user.id
+    tag, status = parse_filter([filter_token] if filter_token else [])
+    events, has_next = await get_events_page(user_id, limit=ALLTASKS_PAGE_SIZE, tag=tag, status=status)
+    rules = await get_rules(user_id, tag) if status is None else []
+    if not events and not rules:
+        await message.answer(empty_text)
+        return
+    if rules:
+        hints = [] if events else ["", DONE_HINT, DELETE_HINT]
+        await answer_blocks(message, [REPEAT_HEADER, *map(format_rule, rules), *hints], parse_mode="HTML")
+    if events:
+        text, markup = render_alltasks_page(events, has_prev=False, has_next=has_next, filter_token=filter_token,
+                                            tz=await get_user_tz(user_id))
+        await message.answer(text, parse_mode="HTML", reply_markup=markup)
 
 @router.message(Command("alltasks"))
 async def alltasks_cmd(message: types.Message) -> None:
     """
-    Показывает все задачи пользователя за всё время.
+    Показывает задачи пользователя за всё время постранично (первая страница),
+    с необязательным фильтром: /alltasks спорт, /alltasks active.
     """
+    args = message.text.split()[1:]
     try:
-        user_id = message.from_user.id
-        events = await get_all_events_for_user(user_id)
-        if not events:
-            await message.answer(ALLTASKS_EMPTY)
-            return
-        text = "\n".join([
-            f"{get_status_icon(status, date, time)} #{event_id} {date} {time} {TAG_COLORS.get(tag, '')} {title}{f' [{TAG_LABELS[tag]}]' if tag else ''}"
-            for event_id, title, date, time, tag, status in events
-        ])
-        text += f"\n\n{DONE_HINT}\n{DELETE_HINT}"
-        await message.answer(ALLTASKS_HEADER + text, parse_mode="HTML")
+        tag, status = parse_filter(args)
+    except ValueError as e:
+        return await message.answer(str(e))
+    try:
+        filter_token = tag or status or ""
+        empty_text = NO_EVENTS_FILTERED.format(filter=filter_label(tag, status)) if filter_token else ALLTASKS_EMPTY
+        await answer_alltasks(message, filter_token, empty_text)
     except Exception as e:
         logging.error(f"Ошибка в команде /alltasks: {e}")
         await message.answer(ALLTASKS_ERROR)
 
+@router.message(Command("overdue"))
+async def overdue_cmd(message: types.Message) -> None:
+    """
+    Показывает просроченные задачи пользователя (начались, но не выполнены) постранично.
+    """
+    try:
+        await answer_alltasks(message, "overdue", OVERDUE_EMPTY)
+    except Exception as e:
+        logging.error(f"Ошибка в команде /overdue: {e}")
+        await message.answer(ALLTASKS_ERROR)
+
+@router.message(Command("find"))
+async def find_cmd(message: types.Message) -> None:
+    """
+    Ищет события пользователя по словам названия (/find слова) — лучшие FIND_LIMIT совпадений.
+    """
+    args = message.text.split(maxsplit=1)
+    query = args[1].strip() if len(args) > 1 else ""
+    if not query:
+        return await message.answer(FIND_USAGE)
+    try:
+        events = await search_events(message.from_user.id, query, limit=FIND_LIMIT)
+        if not events:
+            return await message.answer(FIND_EMPTY)
+        now_ts = int(time.time())
+        tz = await get_user_tz(message.from_user.id)
+        lines = [FIND_HEADER.format(query=escape(query, quote=False))]
+        lines += [format_dated_event_line(event, now_ts, tz) for event in events]
+        await answer_blocks(message, lines + ["", DONE_HINT, DELETE_HINT], parse_mode="HTML")
+    except Exception as e:
+        logging.error(f"Ошибка в команде /find: {e}")
+        await message.answer(FIND_ERROR)
+
+@router.callback_query(F.data.startswith("alltasks:"))
+async def alltasks_page_cb(callback: types.CallbackQuery) -> None:
+    """
+    Листает /alltasks: редактирует то же сообщение следующей или предыдущей страницей.
+    """
+    try:
+        # Кнопки, отправленные до появления фильтров, несут только четыре поля
+        _, direction, starts_at, event_id, *rest = callback.data.split(":")
+        filter_token = rest[0] if rest else ""
+        tag, status = parse_filter([filter_token] if filter_token else [])
+        key = (int(starts_at), int(event_id))
+        if direction == "next":
+            events, has_next = await get_events_page(callback.from_user.id, after=key, limit=ALLTASKS_PAGE_SIZE,
+                                                     tag=tag, status=status)
+            has_prev = True
+        else:
+            events, has_prev = await get_events_page(callback.from_user.id, before=key, limit=ALLTASKS_PAGE_SIZE,
+                                                     tag=tag, status=status)
+            has_next = True
+        if not events:
+            await callback.answer(ALLTASKS_EMPTY)
+            return
+        text, markup = render_alltasks_page(events, has_prev=has_prev, has_next=has_next, filter_token=filter_token,
+                                            tz=await get_user_tz(callback.from_user.id))
+        await callback.message.edit_text(text, parse_mode="HTML", reply_markup=markup)
+        await callback.answer()
+    except Exception as e:
+        logging.error(f"Ошибка листания /alltasks: {e}")
+        await callback.answer(ALLTASKS_ERROR)
+
 @router.message()
 async def unknown_cmd(message: types.Message) -> None:
     """
     Обрабатывает неизвестные команды и обычные сообщения.
     """
     if message.text and message.text.startswith("/"):
-        logging.info(f"Неизвестная команда: {message.text}")
+        # Неизвестных команд может быть очень много — такие записи прореживаются (LOG_SAMPLE_LIMIT)
+        logging.info(f"Неизвестная команда: {message.text}", extra={"sample_key": "unknown_command"})
         await message.answer(UNKNOWN_COMMAND)
     else:
         await message.answer(ONLY_COMMANDS)
@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+class LRUCache:
+    """
+    Кэш в памяти процесса с вытеснением давно не использованных записей (LRU)
+    и сроком жизни записи (TTL). Считает попадания и промахи. on_remove вызывается с ключом
+    каждой удалённой записи — вытесненной, истёкшей или сброшенной.
+    """
+    def __init__(self, max_size: int, ttl: Optional[float] = None,
+                 on_remove: Optional[Callable[[Hashable], None]] = None) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_remove = on_remove
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.version = 0  # растёт при каждой инвалидации
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is not None:
+            value, expires_at = item
+            if expires_at is None or expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+            self._removed(key)
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, version: Optional[int] = None) -> None:
+        """
+        Сохраняет значение. Если передан version и с тех пор была инвалидация,
+        значение считается устаревшим и не сохраняется.
+        """
+        if version is not None and version != self.version:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            evicted, _ = self._data.popitem(last=False)
+            self.evictions += 1
+            self._removed(evicted)
+
+    def pop(self, key: Hashable) -> None:
+        self.version += 1
+        if self._data.pop(key, None) is not None:
+            self._removed(key)
+
+    def invalidate(self) -> None:
+        """
+        Отмечает изменение данных, не удаляя записей: значения, прочитанные
+        до вызова, уже не сохранятся (см. version в set).
+        """
+        self.version += 1
+
+    def clear(self) -> None:
+        self.version += 1
+        keys = list(self._data)
+        self._data.clear()
+        for key in keys:
+            self._removed(key)
+
+    def _removed(self, key: Hashable) -> None:
+        if self.on_remove is not None:
+            self.on_remove(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
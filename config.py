@@ -1,23 +1,76 @@
-import logging
 import os
+import socket
 from aiogram import Bot
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from pytz import timezone
+from logging_setup import setup_logging
 
-BOT_TOKEN = ""
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+# Режим получения обновлений: "polling" (по умолчанию) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный адрес бота, например https://example.com; пусто — setWebhook не вызывается
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token; обязателен в режиме вебхука
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
 DB_NAME = "events.db"  # Имя файла базы данных
+TZ = timezone("Europe/Moscow")  # Часовой пояс по умолчанию (пользователь выбирает свой командой /tz) и планировщика
+DB_READERS = 4  # Количество соединений на чтение в пуле
+DB_STATEMENT_CACHE = 128  # Размер кэша подготовленных выражений на соединение
+WRITE_BATCH_SIZE = 64  # Сколько операций записи объединять в одну транзакцию
+WRITE_BATCH_DELAY = 0.003  # Сколько ждать попутные записи перед коммитом, сек.
+SETTINGS_CACHE_SIZE = 10000  # Сколько пользователей держать в кэше настроек
+SETTINGS_CACHE_TTL = 600  # Срок жизни записи кэша настроек, сек.
+RENDER_CACHE_SIZE = 5000  # Сколько отрисованных расписаний держать в кэше
+RENDER_CACHE_TTL = 3600  # Наибольший срок жизни отрисованного расписания, сек.
+REMINDER_HORIZON_SECONDS = 600  # На сколько вперёд напоминания держатся в памяти
+REMINDER_RECONCILE_SECONDS = 300  # Как часто очередь напоминаний сверяется с базой
+REMINDER_CATCHUP_SECONDS = 3600  # Напоминания, пропущенные при простое, досылаются, если опоздали не больше чем на столько
+ARCHIVE_AFTER_DAYS = 30  # События, начавшиеся раньше, переносятся в events_archive
+ARCHIVE_BATCH_SIZE = 2000  # Событий за одну транзакцию переноса
+MAINTENANCE_HOUR = 4  # Час (по TZ) ночного обслуживания базы: архив, incremental_vacuum, ANALYZE
+IMPORT_MAX_BYTES = 2 * 1024 * 1024  # Максимальный размер импортируемого файла .csv/.ics
+IMPORT_MAX_ROWS = 10000  # Максимум событий из одного файла
+IMPORT_CHUNK_SIZE = 500  # Строк на один executemany при импорте
+DELIVERY_WORKERS = 8  # Сколько сообщений отправляется параллельно
+DELIVERY_RATE = 25  # Глобальный лимит сообщений в секунду (у Telegram ~30)
+DELIVERY_CHAT_INTERVAL = 1.0  # Минимальный интервал между сообщениями в один чат, сек.
+DELIVERY_MAX_ATTEMPTS = 3  # Попыток доставки при временных ошибках
+DIGEST_CHECK_SECONDS = 60  # Как часто проверять, не пора ли отправлять ежедневные сводки
+DIGEST_BATCH_SIZE = 200  # Сводок за одну выборку: после сбоя теряется не больше одной пачки
+DIGEST_CATCHUP_SECONDS = 2 * 3600  # Сводки, опоздавшие больше чем на столько (простой бота), не отправляются
 
-# Создать папку logs, если нет
-os.makedirs("logs", exist_ok=True)
+# Несколько процессов бота делят напоминания по разделам user_id % REMINDER_PARTITIONS
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"  # Уникальное имя процесса
+REMINDER_PARTITIONS = int(os.getenv("REMINDER_PARTITIONS", "16"))  # Одинаково во всех процессах
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", "30"))  # Срок аренды раздела; за него чужие разделы переходят к живым процессам
 
-# Настройка логгирования: в файл и в консоль
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("logs/bot.log", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
+# Метрики Prometheus: отдельный HTTP-сервер с /metrics, по умолчанию только на localhost; порт 0 — выключить
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Логирование: запись в файл и консоль в отдельном потоке (QueueHandler/QueueListener)
+LOG_FILE = os.getenv("LOG_FILE", "logs/bot.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" или "json" (с полями user_id и command)
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size")  # "size" — по LOG_MAX_BYTES, "time" — по LOG_ROTATE_WHEN
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "14"))  # Сколько сжатых архивов (.gz) хранить
+LOG_SAMPLE_LIMIT = int(os.getenv("LOG_SAMPLE_LIMIT", "20"))  # Частые записи (неизвестные команды): не больше N за окно; 0 — без ограничения
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+
+setup_logging(
+    LOG_FILE,
+    level=LOG_LEVEL,
+    fmt=LOG_FORMAT,
+    rotation=LOG_ROTATION,
+    max_bytes=LOG_MAX_BYTES,
+    when=LOG_ROTATE_WHEN,
+    backup_count=LOG_BACKUP_COUNT,
+    sample_limit=LOG_SAMPLE_LIMIT,
+    sample_window=LOG_SAMPLE_WINDOW,
 )
 
 # Экземпляр Telegram-бота
@@ -1,65 +1,768 @@
+import asyncio
 import aiosqlite
 import logging
-from datetime import datetime, timedelta
-from pytz import timezone
-from config import DB_NAME
-from typing import List, Tuple, Optional
+import re
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time as dtime, timedelta, tzinfo
+from itertools import islice
+from pathlib import Path
+from cache import LRUCache
+from config import (
+    ARCHIVE_BATCH_SIZE, DB_NAME, DB_READERS, DB_STATEMENT_CACHE, IMPORT_CHUNK_SIZE, REMINDER_PARTITIONS,
+    SETTINGS_CACHE_SIZE, SETTINGS_CACHE_TTL, TZ, WRITE_BATCH_SIZE, WRITE_BATCH_DELAY
+)
+from metrics import register_cache, timed_query
+from recurrence import Rule, last_occurrence, occurrence_key, occurrence_ref, occurrences, split_occurrence_key
+from zones import get_zone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Sequence, Tuple, Optional
 
-# Инициализация базы данных (user_settings: добавлено remind_before)
-async def init_db() -> None:
+# Прагмы для всех соединений пула (WAL и synchronous=FULL задаёт соединение на запись)
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA mmap_size=67108864",
+)
+
+# Операция записи для группового коммита: получает соединение на запись внутри общей транзакции
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+class ConnectionPool:
     """
-    Инициализирует базу данных и необходимые таблицы.
+    Пул долгоживущих соединений с SQLite: одно соединение на запись и несколько на чтение.
+    Мелкие записи, поставленные через submit(), объединяются в одну транзакцию (group commit).
+    С read_only=True файл базы открывается только на чтение (mode=ro), без соединения на запись.
     """
-    try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    title TEXT,
-                    date TEXT,
-                    time TEXT,
-                    tag TEXT DEFAULT ''
-                )
-                """
-            )
+    def __init__(self, db_name: str, readers: int, batch_size: int = WRITE_BATCH_SIZE,
+                 batch_delay: float = WRITE_BATCH_DELAY, read_only: bool = False) -> None:
+        self.db_name = db_name
+        self.readers_count = readers
+        self.read_only = read_only
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._readers: "asyncio.Queue[aiosqlite.Connection]" = asyncio.Queue()
+        self._connections: List[aiosqlite.Connection] = []
+        self._pending: "asyncio.Queue[Optional[Tuple[WriteOp, asyncio.Future]]]" = asyncio.Queue()
+        self._batcher: Optional[asyncio.Task] = None
+
+    async def _connect(self, read_only: bool) -> aiosqlite.Connection:
+        # cached_statements — повторное использование подготовленных выражений sqlite3
+        if self.read_only:
+            # Файл не создаётся и не меняется: ни журнала WAL, ни миграций
+            uri = f"{Path(self.db_name).absolute().as_uri()}?mode=ro"
+            db = await aiosqlite.connect(uri, uri=True, cached_statements=DB_STATEMENT_CACHE)
+        else:
+            db = await aiosqlite.connect(self.db_name, cached_statements=DB_STATEMENT_CACHE)
+        for pragma in CONNECTION_PRAGMAS:
+            await db.execute_fetchall(pragma)
+        if read_only:
+            await db.execute_fetchall("PRAGMA query_only=1")
+        else:
+            # При NORMAL в WAL зафиксированная транзакция может пропасть при отключении питания,
+            # а submit() подтверждает запись только после фиксации — синхронизируем каждый коммит
+            await db.execute_fetchall("PRAGMA synchronous=FULL")
+        # Нужна миграции полнотекстового индекса (см. _migration_events_fts)
+        await db.create_function("fts_document", 2, fts_document, deterministic=True)
+        self._connections.append(db)
+        return db
+
+    async def open(self) -> None:
+        """
+        Открывает соединение на запись и соединения на чтение.
+        """
+        if self.read_only:
+            for _ in range(self.readers_count):
+                self._readers.put_nowait(await self._connect(read_only=True))
+            return
+        self._writer = await self._connect(read_only=False)
+        # Для новой базы — освобождение страниц по PRAGMA incremental_vacuum (на существующую не действует)
+        await self._writer.execute_fetchall("PRAGMA auto_vacuum=INCREMENTAL")
+        await self._writer.execute_fetchall("PRAGMA journal_mode=WAL")
+        for _ in range(self.readers_count):
+            self._readers.put_nowait(await self._connect(read_only=True))
+        self._batcher = asyncio.create_task(self._batch_loop())
+
+    async def close(self) -> None:
+        """
+        Дожидается записи уже поставленных операций и закрывает все соединения пула.
+        """
+        if self._batcher is not None:
+            self._pending.put_nowait(None)
+            await self._batcher
+            self._batcher = None
+        for db in self._connections:
             try:
-                await db.execute("ALTER TABLE events ADD COLUMN tag TEXT DEFAULT ''")
-            except Exception:
-                pass
-            # user_settings с remind_before
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS user_settings (
-                    user_id INTEGER PRIMARY KEY,
-                    notifications_enabled INTEGER DEFAULT 1,
-                    remind_before INTEGER DEFAULT 60
-                )
-                """
-            )
+                await db.close()
+            except Exception as e:
+                logging.error(f"Ошибка закрытия соединения с базой: {e}")
+        self._connections.clear()
+        self._writer = None
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Выдаёт свободное соединение на чтение и возвращает его в пул после использования.
+        """
+        db = await self._readers.get()
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Выдаёт единственное соединение на запись; фиксирует транзакцию при успехе и откатывает при ошибке.
+        """
+        if self._writer is None:
+            raise RuntimeError("Пул соединений открыт только для чтения")
+        async with self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+    async def submit(self, op: WriteOp) -> Any:
+        """
+        Ставит операцию записи в очередь группового коммита. Возвращает результат операции,
+        когда транзакция с ней зафиксирована и сброшена на диск; ошибка операции откатывает только её.
+        """
+        if self._batcher is None:
+            raise RuntimeError("Пул соединений не открыт")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.put_nowait((op, future))
+        return await future
+
+    async def _batch_loop(self) -> None:
+        closing = False
+        while not closing:
+            item = await self._pending.get()
+            if item is None:
+                break
+            batch = [item]
+            # Даём соседним запросам несколько миллисекунд присоединиться к транзакции
+            if self.batch_delay > 0 and self._pending.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.batch_delay)
+            while len(batch) < self.batch_size and not self._pending.empty():
+                item = self._pending.get_nowait()
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: List[Tuple[WriteOp, asyncio.Future]]) -> None:
+        results = []
+        async with self._write_lock:
+            db = self._writer
             try:
-                await db.execute("ALTER TABLE user_settings ADD COLUMN remind_before INTEGER DEFAULT 60")
-            except Exception:
-                pass
-            await db.commit()
+                await db.execute("BEGIN")
+                for op, future in batch:
+                    # Каждая операция в своей точке сохранения: её ошибка не откатывает соседей
+                    await db.execute("SAVEPOINT write_op")
+                    try:
+                        results.append((future, await op(db), None))
+                        await db.execute("RELEASE write_op")
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO write_op")
+                        await db.execute("RELEASE write_op")
+                        results.append((future, None, e))
+                await db.commit()
+            except Exception as e:
+                logging.error(f"Ошибка групповой записи ({len(batch)} операций): {e}")
+                try:
+                    await db.rollback()
+                except Exception:
+                    pass
+                results = [(future, None, e) for _, future in batch]
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+# Общий пул соединений процесса (открывается в main.main())
+_pool: Optional[ConnectionPool] = None
+
+async def open_pool(db_name: str = DB_NAME, readers: int = DB_READERS, read_only: bool = False) -> None:
+    """
+    Открывает общий пул соединений с базой данных. read_only — только чтение существующей
+    базы (офлайн-выгрузка): запись и миграции недоступны.
+    """
+    global _pool
+    pool = ConnectionPool(db_name, readers, read_only=read_only)
+    await pool.open()
+    _pool = pool
+    logging.info(f"Пул соединений с базой открыт (читателей: {readers}).")
+
+async def close_pool() -> None:
+    """
+    Закрывает общий пул соединений.
+    """
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+        logging.info("Пул соединений с базой закрыт.")
+
+def _get_pool() -> ConnectionPool:
+    if _pool is None:
+        raise RuntimeError("Пул соединений не открыт: вызовите open_pool()")
+    return _pool
+
+def _reader():
+    return _get_pool().read()
+
+def _writer():
+    return _get_pool().write()
+
+async def _submit(op: WriteOp) -> Any:
+    return await _get_pool().submit(op)
+
+# Подписчики на изменения событий пользователя (движок напоминаний, кэш расписаний).
+# Обработчик получает user_id и время начала изменённых событий; пустой список — изменились настройки.
+EventsChangedHook = Callable[[int, Sequence[int]], Awaitable[None]]
+_change_hooks: List[EventsChangedHook] = []
+
+def on_events_changed(hook: EventsChangedHook) -> None:
+    """
+    Регистрирует обработчик, вызываемый после фиксации изменений событий или настроек пользователя.
+    """
+    _change_hooks.append(hook)
+
+# Версии данных, которые процесс ведёт сам, пока работает с базой один (см. get_data_version):
+# каждое изменение получает следующее значение общего счётчика, поэтому версия не повторяется
+# и после сброса словаря при смене режима. Пользователь без изменений — версия начала режима.
+_version_counter = 0
+_local_versions: Dict[int, int] = {}
+_local_base = 0
+
+async def _emit_events_changed(user_id: int, starts: Sequence[int] = ()) -> None:
+    global _version_counter
+    _version_counter += 1
+    _local_versions[user_id] = _version_counter
+    for hook in _change_hooks:
+        try:
+            await hook(user_id, starts)
+        except Exception as e:
+            logging.error(f"Ошибка обработчика изменений событий пользователя {user_id}: {e}")
+
+DEFAULT_REMIND_BEFORE = 60  # минут
+REMIND_GRACE_SECONDS = 120  # нижняя граница поиска напоминаний для разделов без водяного знака
+
+def _event_timestamp(date_str: str, time_str: str) -> int:
+    """
+    Переводит дату и время события (по МСК) в UTC-таймстемп.
+    """
+    return int(TZ.localize(datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")).timestamp())
+
+def next_digest_at(hour: int, tz: tzinfo, after: int) -> int:
+    """
+    Ближайший после after (UTC-таймстемп) момент hour:00 по местному времени tz — время
+    следующей ежедневной сводки.
+    """
+    day = datetime.fromtimestamp(after, tz).date()
+    while True:
+        ts = int(tz.localize(datetime.combine(day, dtime(hour))).timestamp())
+        if ts > after:
+            return ts
+        day += timedelta(days=1)
+
+def day_bounds(date: str, days: int = 1, tz: tzinfo = TZ) -> Tuple[int, int]:
+    """
+    Возвращает границы периода из days суток, начиная с date, — [начало, конец) в часовом
+    поясе tz (по умолчанию — поясе бота) в виде UTC-таймстемпов.
+    """
+    day = datetime.strptime(date, "%Y-%m-%d")
+    return (int(tz.localize(day).timestamp()),
+            int(tz.localize(day + timedelta(days=days)).timestamp()))
+
+async def _refresh_remind_at(db: aiosqlite.Connection, user_id: int) -> None:
+    """
+    Пересчитывает remind_at активных событий пользователя по его текущим настройкам.
+    Вызывается внутри транзакции на запись.
+    """
+    cursor = await db.execute(
+        "SELECT notifications_enabled, remind_before FROM user_settings WHERE user_id=?",
+        (user_id,)
+    )
+    row = await cursor.fetchone()
+    enabled = bool(row[0]) if row else True
+    remind_before = int(row[1]) if row and row[1] is not None else DEFAULT_REMIND_BEFORE
+    await db.execute(
+        "UPDATE events SET remind_at = CASE WHEN ? THEN starts_at - ? END WHERE user_id=? AND status='active'",
+        (int(enabled), remind_before * 60, user_id)
+    )
+
+# --- МИГРАЦИИ СХЕМЫ ---
+# Каждая миграция применяется один раз в своей транзакции; номер последней
+# применённой хранится в PRAGMA user_version.
+
+async def _table_columns(db: aiosqlite.Connection, table: str) -> set:
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in await cursor.fetchall()}
+
+async def _migration_base_schema(db: aiosqlite.Connection) -> None:
+    """
+    Базовая схема: таблицы events и user_settings. Для баз, созданных до появления
+    миграций, добавляет недостающие колонки (tag, status, remind_at, remind_before).
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            title TEXT,
+            date TEXT,
+            time TEXT,
+            tag TEXT DEFAULT '',
+            status TEXT DEFAULT 'active',
+            remind_at INTEGER
+        )
+        """
+    )
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_settings (
+            user_id INTEGER PRIMARY KEY,
+            notifications_enabled INTEGER DEFAULT 1,
+            remind_before INTEGER DEFAULT 60
+        )
+        """
+    )
+    columns = await _table_columns(db, "events")
+    if "tag" not in columns:
+        await db.execute("ALTER TABLE events ADD COLUMN tag TEXT DEFAULT ''")
+    if "status" not in columns:
+        await db.execute("ALTER TABLE events ADD COLUMN status TEXT DEFAULT 'active'")
+    # remind_at — абсолютное время напоминания (UTC-таймстемп), NULL если напоминать не нужно
+    if "remind_at" not in columns:
+        await db.execute("ALTER TABLE events ADD COLUMN remind_at INTEGER")
+    if "remind_before" not in await _table_columns(db, "user_settings"):
+        await db.execute("ALTER TABLE user_settings ADD COLUMN remind_before INTEGER DEFAULT 60")
+    await db.execute("UPDATE events SET status='active' WHERE status IS NULL")
+    # Заполняем remind_at для событий, созданных до появления колонки
+    cursor = await db.execute(
+        "SELECT e.id, e.date, e.time, COALESCE(s.remind_before, ?) FROM events e "
+        "LEFT JOIN user_settings s ON s.user_id = e.user_id "
+        "WHERE e.status='active' AND e.remind_at IS NULL AND COALESCE(s.notifications_enabled, 1) = 1",
+        (DEFAULT_REMIND_BEFORE,)
+    )
+    rows = await cursor.fetchall()
+    await db.executemany(
+        "UPDATE events SET remind_at=? WHERE id=?",
+        [(_event_timestamp(date_str, time_str) - remind_before * 60, event_id)
+         for event_id, date_str, time_str, remind_before in rows]
+    )
+
+async def _migration_event_indexes(db: aiosqlite.Connection) -> None:
+    """
+    Составные индексы под запросы db.py:
+    - (status, remind_at) — поиск наступивших напоминаний;
+    - (user_id, date, time) — события пользователя на дату и за всё время, уже в нужном порядке.
+    """
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_events_status_remind_at ON events(status, remind_at)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_events_user_date_time ON events(user_id, date, time)")
+
+async def _migration_starts_at(db: aiosqlite.Connection) -> None:
+    """
+    Переводит время события с пары TEXT date/time на starts_at INTEGER (UTC-таймстемп):
+    заполняет новую колонку, меняет индекс пользователя и удаляет старые колонки.
+    """
+    await db.execute("ALTER TABLE events ADD COLUMN starts_at INTEGER")
+    cursor = await db.execute("SELECT id, date, time FROM events")
+    rows = await cursor.fetchall()
+    await db.executemany(
+        "UPDATE events SET starts_at=? WHERE id=?",
+        [(_event_timestamp(date_str, time_str), event_id) for event_id, date_str, time_str in rows]
+    )
+    await db.execute("DROP INDEX IF EXISTS idx_events_user_date_time")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_events_user_starts_at ON events(user_id, starts_at)")
+    await db.execute("ALTER TABLE events DROP COLUMN date")
+    await db.execute("ALTER TABLE events DROP COLUMN time")
+
+async def _migration_reminder_leases(db: aiosqlite.Connection) -> None:
+    """
+    Таблицы аренды разделов напоминаний (какой процесс и до какого времени владеет разделом)
+    и живых процессов, между которыми делятся разделы.
+    """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS reminder_leases (
+            partition INTEGER PRIMARY KEY,
+            owner TEXT,
+            expires_at INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS reminder_workers (
+            worker_id TEXT PRIMARY KEY,
+            expires_at INTEGER NOT NULL
+        )
+    """)
+
+async def _migration_reminder_watermark(db: aiosqlite.Connection) -> None:
+    """
+    Водяной знак раздела: до какого remind_at напоминания раздела уже разосланы.
+    """
+    await db.execute("ALTER TABLE reminder_leases ADD COLUMN scanned_until INTEGER")
+
+async def _migration_events_archive(db: aiosqlite.Connection) -> None:
+    """
+    Архив прошедших событий: туда обслуживание переносит события старше ARCHIVE_AFTER_DAYS,
+    чтобы в events оставались только текущие и будущие.
+    """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS events_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            title TEXT,
+            starts_at INTEGER,
+            tag TEXT DEFAULT '',
+            status TEXT,
+            archived_at INTEGER
+        )
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_archive_user_starts_at ON events_archive(user_id, starts_at)"
+    )
+
+async def _migration_event_rules(db: aiosqlite.Connection) -> None:
+    """
+    Повторяющиеся события: одно правило вместо строки на каждое вхождение, и редкие
+    исключения для отдельных вхождений (выполнено, удалено, перенесено).
+    reminded_until — время начала последнего вхождения, о котором напомнили.
+    """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS event_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            title TEXT,
+            tag TEXT DEFAULT '',
+            starts_at INTEGER,
+            freq TEXT,
+            interval INTEGER DEFAULT 1,
+            weekdays TEXT DEFAULT '',
+            until INTEGER,
+            count INTEGER,
+            reminded_until INTEGER DEFAULT 0,
+            created_at INTEGER
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_event_rules_user ON event_rules(user_id)")
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS rule_overrides (
+            rule_id INTEGER,
+            occurrence_at INTEGER,
+            status TEXT,
+            moved_to INTEGER,
+            reminded INTEGER DEFAULT 0,
+            PRIMARY KEY (rule_id, occurrence_at)
+        ) WITHOUT ROWID
+    """)
+
+# Документ полнотекстового индекса: каждое слово названия с префиксом владельца u<user_id>x,
+# так что префиксный поиск перебирает только термы одного пользователя. «ё» индексируется как «е».
+def fts_document(user_id: int, title: Optional[str]) -> str:
+    return " ".join(f"u{user_id}x{word}" for word in _fts_words(title or ""))
+
+def _fts_words(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower().replace("ё", "е"))
+
+FTS_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON events BEGIN
+        INSERT INTO events_fts (rowid, body) VALUES (new.id, fts_document(new.user_id, new.title));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS events_fts_update AFTER UPDATE OF title ON events BEGIN
+        UPDATE events_fts SET body = fts_document(new.user_id, new.title) WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON events
+    WHEN NOT EXISTS (SELECT 1 FROM events_archive WHERE id = old.id) BEGIN
+        DELETE FROM events_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS events_archive_fts_delete AFTER DELETE ON events_archive BEGIN
+        DELETE FROM events_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS event_rules_fts_insert AFTER INSERT ON event_rules BEGIN
+        INSERT INTO events_fts (rowid, body) VALUES (-new.id, fts_document(new.user_id, new.title));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS event_rules_fts_delete AFTER DELETE ON event_rules BEGIN
+        DELETE FROM events_fts WHERE rowid = -old.id;
+    END""",
+)
+
+async def _migration_events_fts(db: aiosqlite.Connection) -> None:
+    """
+    Полнотекстовый индекс FTS5 по названиям событий, архива и правил повторения.
+    rowid — id события (у правила — минус id правила), body — fts_document. Индекс ведут
+    триггеры (функция fts_document регистрируется на каждом соединении пула); перенос
+    в архив (вставка в архив, затем удаление из events) строку индекса не трогает.
+    С миграции 13 вставки в индекс пишет приложение (см. FTS_TRIGGERS_BUILTIN).
+    """
+    await db.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(body, tokenize='unicode61 remove_diacritics 2')"
+    )
+    # Триггеры создаются по одному: executescript зафиксировал бы транзакцию миграции
+    for trigger in FTS_TRIGGERS:
+        await db.execute(trigger)
+    await db.execute("""
+        INSERT INTO events_fts (rowid, body)
+        SELECT id, fts_document(user_id, title) FROM events
+        UNION ALL SELECT id, fts_document(user_id, title) FROM events_archive
+        UNION ALL SELECT -id, fts_document(user_id, title) FROM event_rules
+    """)
+
+async def _migration_filter_indexes(db: aiosqlite.Connection) -> None:
+    """
+    Индексы для выборок с фильтром по тегу или статусу: срез одного тега или статуса
+    пользователя читается диапазоном по времени начала, без просмотра остальных событий.
+    """
+    for table in ("events", "events_archive"):
+        await db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_tag_starts_at ON {table}(user_id, tag, starts_at)")
+        await db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_status_starts_at ON {table}(user_id, status, starts_at)")
+
+async def _migration_user_timezones(db: aiosqlite.Connection) -> None:
+    """
+    Часовые пояса: tz пользователя (в нём вводится и показывается время) и tz правила
+    повторения (в нём повторяется местное время вхождений). NULL — часовой пояс бота,
+    в котором до этой миграции создавались все события. Время событий и так хранится
+    в UTC, поэтому поиск напоминаний от часовых поясов не зависит.
+    """
+    await db.execute("ALTER TABLE user_settings ADD COLUMN tz TEXT")
+    await db.execute("ALTER TABLE event_rules ADD COLUMN tz TEXT")
+
+async def _migration_daily_digest(db: aiosqlite.Connection) -> None:
+    """
+    Ежедневная сводка: digest_hour — местный час отправки (NULL — сводка выключена),
+    digest_at — UTC-время следующей отправки. Частичный индекс по digest_at содержит только
+    подписанных пользователей, так что поиск сводок к отправке не читает остальных.
+    """
+    await db.execute("ALTER TABLE user_settings ADD COLUMN digest_hour INTEGER")
+    await db.execute("ALTER TABLE user_settings ADD COLUMN digest_at INTEGER")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_settings_digest_at ON user_settings(digest_at) WHERE digest_at IS NOT NULL"
+    )
+
+# Вставки в индекс пишет приложение (документ fts_document считается в Python), а триггеры —
+# только встроенный SQL, так что базу можно править и из других соединений (sqlite3 и т. п.):
+# строки, добавленные там, в поиск не попадают, а смена названия убирает строку из индекса.
+FTS_TRIGGERS_BUILTIN = (
+    """CREATE TRIGGER IF NOT EXISTS events_fts_title_update AFTER UPDATE OF title ON events BEGIN
+        DELETE FROM events_fts WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS events_archive_fts_title_update AFTER UPDATE OF title ON events_archive BEGIN
+        DELETE FROM events_fts WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS event_rules_fts_title_update AFTER UPDATE OF title ON event_rules BEGIN
+        DELETE FROM events_fts WHERE rowid = -new.id;
+    END""",
+)
+
+async def _migration_fts_builtin_triggers(db: aiosqlite.Connection) -> None:
+    """
+    Триггеры индекса без функции fts_document: она зарегистрирована только на соединениях бота,
+    и с ней вставка событий из любого другого соединения завершалась ошибкой.
+    """
+    for trigger in ("events_fts_insert", "events_fts_update", "event_rules_fts_insert"):
+        await db.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for trigger in FTS_TRIGGERS_BUILTIN:
+        await db.execute(trigger)
+
+# Версию данных пользователя поднимают триггеры, поэтому её видят все процессы и соединения.
+# Служебные поля (remind_at, reminded_until, reminded) на вид расписаний не влияют и версию не меняют.
+DATA_VERSION_BUMP = "ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + 1;"
+DATA_VERSION_TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS events_data_version_insert AFTER INSERT ON events BEGIN
+        INSERT INTO user_settings (user_id, data_version) VALUES (new.user_id, 1) {DATA_VERSION_BUMP}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS events_data_version_update
+    AFTER UPDATE OF title, tag, status, starts_at ON events BEGIN
+        INSERT INTO user_settings (user_id, data_version) VALUES (new.user_id, 1) {DATA_VERSION_BUMP}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS events_data_version_delete AFTER DELETE ON events BEGIN
+        INSERT INTO user_settings (user_id, data_version) VALUES (old.user_id, 1) {DATA_VERSION_BUMP}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS events_archive_data_version_update
+    AFTER UPDATE OF title, tag, status, starts_at ON events_archive BEGIN
+        INSERT INTO user_settings (user_id, data_version) VALUES (new.user_id, 1) {DATA_VERSION_BUMP}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS event_rules_data_version_insert AFTER INSERT ON event_rules BEGIN
+        INSERT INTO user_settings (user_id, data_version) VALUES (new.user_id, 1) {DATA_VERSION_BUMP}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS event_rules_data_version_update
+    AFTER UPDATE OF title, tag, starts_at, freq, interval, weekdays, until, count, tz ON event_rules BEGIN
+        INSERT INTO user_settings (user_id, data_version) VALUES (new.user_id, 1) {DATA_VERSION_BUMP}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS event_rules_data_version_delete AFTER DELETE ON event_rules BEGIN
+        INSERT INTO user_settings (user_id, data_version) VALUES (old.user_id, 1) {DATA_VERSION_BUMP}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rule_overrides_data_version_insert AFTER INSERT ON rule_overrides BEGIN
+        INSERT INTO user_settings (user_id, data_version)
+        SELECT user_id, 1 FROM event_rules WHERE id = new.rule_id {DATA_VERSION_BUMP}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rule_overrides_data_version_update
+    AFTER UPDATE OF status, moved_to ON rule_overrides BEGIN
+        INSERT INTO user_settings (user_id, data_version)
+        SELECT user_id, 1 FROM event_rules WHERE id = new.rule_id {DATA_VERSION_BUMP}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rule_overrides_data_version_delete AFTER DELETE ON rule_overrides BEGIN
+        INSERT INTO user_settings (user_id, data_version)
+        SELECT user_id, 1 FROM event_rules WHERE id = old.rule_id {DATA_VERSION_BUMP}
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_settings_data_version_update
+    AFTER UPDATE OF notifications_enabled, remind_before, tz ON user_settings BEGIN
+        UPDATE user_settings SET data_version = data_version + 1 WHERE user_id = new.user_id;
+    END""",
+)
+
+async def _migration_data_version(db: aiosqlite.Connection) -> None:
+    """
+    Версия данных пользователя (user_settings.data_version) для кэшей в памяти процесса:
+    запись, сохранённая при одной версии, после изменения из любого процесса не используется.
+    """
+    await db.execute("ALTER TABLE user_settings ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0")
+    for trigger in DATA_VERSION_TRIGGERS:
+        await db.execute(trigger)
+
+MIGRATIONS: List[Callable[[aiosqlite.Connection], Awaitable[None]]] = [
+    _migration_base_schema,
+    _migration_event_indexes,
+    _migration_starts_at,
+    _migration_reminder_leases,
+    _migration_reminder_watermark,
+    _migration_events_archive,
+    _migration_event_rules,
+    _migration_events_fts,
+    _migration_filter_indexes,
+    _migration_user_timezones,
+    _migration_daily_digest,
+    _migration_data_version,
+    _migration_fts_builtin_triggers,
+]
+
+async def get_schema_version() -> int:
+    """
+    Возвращает номер последней применённой миграции (PRAGMA user_version).
+    """
+    async with _reader() as db:
+        cursor = await db.execute("PRAGMA user_version")
+        row = await cursor.fetchone()
+        return int(row[0])
+
+# Инициализация базы данных: применение недостающих миграций
+async def init_db() -> None:
+    """
+    Инициализирует базу данных: применяет ещё не применённые миграции по порядку.
+    """
+    try:
+        version = await get_schema_version()
+        if version >= len(MIGRATIONS):
+            logging.info(f"Схема базы данных актуальна (версия {version}).")
+            return
+        for number in range(version + 1, len(MIGRATIONS) + 1):
+            async with _writer() as db:
+                await db.execute("BEGIN")
+                await MIGRATIONS[number - 1](db)
+                await db.execute(f"PRAGMA user_version={number}")
+            logging.info(f"Применена миграция базы данных {number}: {MIGRATIONS[number - 1].__name__}.")
         logging.info("База данных инициализирована.")
     except Exception as e:
         logging.error(f"Ошибка инициализации базы данных: {e}")
+        raise
+
+# Кэш настроек пользователей: user_id -> (notifications_enabled, remind_before, часовой пояс).
+# Изменения из других процессов до него не доходят, поэтому кэш работает, только пока процесс
+# с базой один (число живых процессов отмечает claim_partitions). Проверка data_version
+# стоила бы того же запроса, что и чтение самих настроек.
+_settings_cache = LRUCache(SETTINGS_CACHE_SIZE, SETTINGS_CACHE_TTL)
+_settings_cache_enabled = True
+
+def _set_settings_cache_enabled(enabled: bool) -> None:
+    global _settings_cache_enabled, _local_base, _version_counter
+    if not enabled and _settings_cache_enabled:
+        _settings_cache.clear()
+        logging.info("Кэш настроек отключён: с базой работают несколько процессов.")
+    if enabled and not _settings_cache_enabled:
+        # Пока процессов было несколько, изменения шли мимо локальных версий
+        _local_versions.clear()
+        _version_counter += 1
+        _local_base = _version_counter
+    _settings_cache_enabled = enabled
+
+def settings_cache_stats() -> Dict[str, int]:
+    """
+    Счётчики кэша настроек: размер, попадания, промахи, вытеснения.
+    """
+    return _settings_cache.stats()
+
+register_cache("settings", settings_cache_stats)
+
+# Получить настройки пользователя (через кэш)
+@timed_query
+async def get_user_settings(user_id: int) -> Tuple[bool, int, tzinfo]:
+    """
+    Получает настройки пользователя: (напоминания включены, за сколько минут напоминать,
+    часовой пояс). Читает из кэша; при промахе — из базы.
+    """
+    settings = _settings_cache.get(user_id) if _settings_cache_enabled else None
+    if settings is not None:
+        return settings
+    version = _settings_cache.version
+    async with _reader() as db:
+        cursor = await db.execute(
+            "SELECT notifications_enabled, remind_before, tz FROM user_settings WHERE user_id=?",
+            (user_id,)
+        )
+        row = await cursor.fetchone()
+    settings = (
+        bool(row[0]) if row else True,  # По умолчанию True
+        int(row[1]) if row and row[1] is not None else DEFAULT_REMIND_BEFORE,
+        get_zone(row[2] if row else None),
+    )
+    # Не кэшируем, если настройки успели измениться во время чтения
+    if _settings_cache_enabled:
+        _settings_cache.set(user_id, settings, version=version)
+    return settings
+
+# Версия данных пользователя (для кэшей в памяти процесса)
+@timed_query
+async def get_data_version(user_id: int) -> int:
+    """
+    Версия данных пользователя: меняется при каждом изменении его событий, правил повторения
+    и настроек. Пока процесс с базой один, её ведёт сам процесс (без запроса; значения
+    отрицательные, ниже -1); иначе она читается из базы, где её ведут триггеры для любого
+    процесса или соединения. -1 — данных ещё не было.
+    """
+    if _settings_cache_enabled:
+        return -2 - _local_versions.get(user_id, _local_base)
+    async with _reader() as db:
+        cursor = await db.execute("SELECT data_version FROM user_settings WHERE user_id=?", (user_id,))
+        row = await cursor.fetchone()
+    return row[0] if row else -1
 
 # Включить/отключить напоминания для пользователя
+@timed_query
 async def set_notifications_enabled(user_id: int, enabled: bool) -> None:
     """
     Включает или отключает напоминания для пользователя.
     """
     try:
-        async with aiosqlite.connect(DB_NAME) as db:
+        async with _writer() as db:
             await db.execute(
                 "INSERT INTO user_settings (user_id, notifications_enabled) VALUES (?, ?) "
                 "ON CONFLICT(user_id) DO UPDATE SET notifications_enabled=excluded.notifications_enabled",
                 (user_id, int(enabled))
             )
-            await db.commit()
+            await _refresh_remind_at(db, user_id)
+        _settings_cache.pop(user_id)
+        await _emit_events_changed(user_id)
     except Exception as e:
         logging.error(f"Ошибка обновления статуса напоминаний: {e}")
 
@@ -69,30 +772,28 @@ async def get_notifications_enabled(user_id: int) -> bool:
     Получает статус напоминаний пользователя.
     """
     try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            cursor = await db.execute(
-                "SELECT notifications_enabled FROM user_settings WHERE user_id=?",
-                (user_id,)
-            )
-            row = await cursor.fetchone()
-            return bool(row[0]) if row else True  # По умолчанию True
+        enabled, _, _ = await get_user_settings(user_id)
+        return enabled
     except Exception as e:
         logging.error(f"Ошибка получения статуса напоминаний: {e}")
         return True
 
 # Установить время напоминания (в минутах)
+@timed_query
 async def set_remind_before(user_id: int, minutes: int) -> None:
     """
     Устанавливает время напоминания (в минутах) для пользователя.
     """
     try:
-        async with aiosqlite.connect(DB_NAME) as db:
+        async with _writer() as db:
             await db.execute(
                 "INSERT INTO user_settings (user_id, remind_before) VALUES (?, ?) "
                 "ON CONFLICT(user_id) DO UPDATE SET remind_before=excluded.remind_before",
                 (user_id, minutes)
             )
-            await db.commit()
+            await _refresh_remind_at(db, user_id)
+        _settings_cache.pop(user_id)
+        await _emit_events_changed(user_id)
     except Exception as e:
         logging.error(f"Ошибка обновления времени напоминания: {e}")
 
@@ -102,209 +803,1032 @@ async def get_remind_before(user_id: int) -> int:
     Получает время напоминания пользователя (в минутах).
     """
     try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            cursor = await db.execute(
-                "SELECT remind_before FROM user_settings WHERE user_id=?",
-                (user_id,)
+        _, remind_before, _ = await get_user_settings(user_id)
+        return remind_before
+    except Exception as e:
+        logging.error(f"Ошибка получения времени напоминания: {e}")
+        return DEFAULT_REMIND_BEFORE
+
+# Установить часовой пояс пользователя
+@timed_query
+async def set_user_tz(user_id: int, tz_name: str) -> bool:
+    """
+    Устанавливает часовой пояс пользователя (название IANA, см. zones.parse_zone).
+    Время событий хранится в UTC, поэтому пересчитывать ничего не нужно — меняется только
+    то, как время вводится и показывается.
+    """
+    try:
+        async with _writer() as db:
+            await db.execute(
+                "INSERT INTO user_settings (user_id, tz) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET tz=excluded.tz",
+                (user_id, tz_name)
             )
+            # Сводка приходит в тот же местный час, но уже по новому поясу
+            cursor = await db.execute("SELECT digest_hour FROM user_settings WHERE user_id=?", (user_id,))
             row = await cursor.fetchone()
-            return int(row[0]) if row and row[0] is not None else 60
+            if row and row[0] is not None:
+                await db.execute(
+                    "UPDATE user_settings SET digest_at=? WHERE user_id=?",
+                    (next_digest_at(row[0], get_zone(tz_name), int(time.time())), user_id)
+                )
+        _settings_cache.pop(user_id)
+        await _emit_events_changed(user_id)
+        return True
     except Exception as e:
-        logging.error(f"Ошибка получения времени напоминания: {e}")
-        return 60
+        logging.error(f"Ошибка обновления часового пояса: {e}")
+        return False
 
-# Добавить событие в базу (с поддержкой тега)
-async def add_event(user_id: int, title: str, date: str, time: str, tag: str = "") -> None:
+# Получить часовой пояс пользователя
+async def get_user_tz(user_id: int) -> tzinfo:
+    """
+    Получает часовой пояс пользователя (по умолчанию — пояс бота).
+    """
+    try:
+        _, _, tz = await get_user_settings(user_id)
+        return tz
+    except Exception as e:
+        logging.error(f"Ошибка получения часового пояса: {e}")
+        return TZ
+
+# --- ЕЖЕДНЕВНАЯ СВОДКА ---
+# Установить час ежедневной сводки (None — отключить)
+@timed_query
+async def set_digest_hour(user_id: int, hour: Optional[int]) -> bool:
     """
-    Добавляет событие в базу данных.
+    Подписывает пользователя на ежедневную сводку в hour:00 по его местному времени
+    (hour=None — отписывает). Время следующей отправки считается сразу.
     """
     try:
-        async with aiosqlite.connect(DB_NAME) as db:
+        digest_at = next_digest_at(hour, await get_user_tz(user_id), int(time.time())) if hour is not None else None
+        async with _writer() as db:
             await db.execute(
-                "INSERT INTO events (user_id, title, date, time, tag) VALUES (?, ?, ?, ?, ?)",
-                (user_id, title, date, time, tag)
+                "INSERT INTO user_settings (user_id, digest_hour, digest_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET digest_hour=excluded.digest_hour, digest_at=excluded.digest_at",
+                (user_id, hour, digest_at)
             )
-            await db.commit()
+        return True
     except Exception as e:
-        logging.error(f"Ошибка добавления события: {e}")
+        logging.error(f"Ошибка обновления ежедневной сводки: {e}")
+        return False
 
-# Получить события, пользователей которых надо напомнить о них (гибко по remind_before)
-async def get_events_for_reminder() -> List[Tuple[int, int, str]]:
+# Получить час ежедневной сводки пользователя
+@timed_query
+async def get_digest_hour(user_id: int) -> Optional[int]:
     """
-    Получает события, по которым нужно отправить напоминание (только один раз).
-    Возвращает: (user_id, event_id, title)
+    Получает местный час ежедневной сводки пользователя или None, если сводка отключена.
     """
     try:
-        now = datetime.now(timezone("Europe/Moscow"))
-        async with aiosqlite.connect(DB_NAME) as db:
-            # Получаем всех пользователей с напоминаниями
+        async with _reader() as db:
+            cursor = await db.execute("SELECT digest_hour FROM user_settings WHERE user_id=?", (user_id,))
+            row = await cursor.fetchone()
+            return row[0] if row else None
+    except Exception as e:
+        logging.error(f"Ошибка получения ежедневной сводки: {e}")
+        return None
+
+# Забрать наступившие сводки на отправку
+@timed_query
+async def claim_digests(now: int, limit: int) -> List[Tuple[int, Optional[str], int]]:
+    """
+    Забирает до limit сводок с digest_at не позже now: одной транзакцией сдвигает их digest_at
+    на следующий день, так что сводка за день забирается ровно одним процессом и один раз.
+    Отправка идёт после фиксации: после сбоя продолжаются ещё не забранные сводки, а повторов
+    не бывает. Возвращает: (user_id, часовой пояс, digest_at) по возрастанию digest_at.
+    """
+    async def op(db: aiosqlite.Connection) -> List[Tuple[int, Optional[str], int]]:
+        cursor = await db.execute(
+            "SELECT user_id, tz, digest_hour, digest_at FROM user_settings "
+            "WHERE digest_at IS NOT NULL AND digest_at <= ? ORDER BY digest_at LIMIT ?",
+            (now, limit)
+        )
+        claimed = []
+        for user_id, tz_name, hour, digest_at in await cursor.fetchall():
             cursor = await db.execute(
-                "SELECT user_id, remind_before FROM user_settings WHERE notifications_enabled = 1"
+                "UPDATE user_settings SET digest_at=? WHERE user_id=? AND digest_at=? RETURNING user_id",
+                (next_digest_at(hour, get_zone(tz_name), max(now, digest_at)), user_id, digest_at)
             )
-            users = await cursor.fetchall()
-            user_remind = {user_id: remind_before for user_id, remind_before in users}
-            # Для пользователей без user_settings — по умолчанию 60 минут
+            if await cursor.fetchall():
+                claimed.append((user_id, tz_name, digest_at))
+        return claimed
+    try:
+        return await _submit(op)
+    except Exception as e:
+        logging.error(f"Ошибка выбора ежедневных сводок: {e}")
+        return []
+
+async def iter_digest_events(
+    claims: Sequence[Tuple[int, Optional[str], int]]
+) -> AsyncIterator[Tuple[int, tzinfo, date, List[Tuple[Any, str, int, str, str]]]]:
+    """
+    Отдаёт события дня для пачки сводок из claim_digests: день — местные сутки, в которые
+    наступил digest_at пользователя. События всех пользователей пачки читаются одним запросом,
+    упорядоченным по user_id, и группируются на лету; вхождения правил повторения добавляются
+    к событиям своего пользователя. Пользователи без событий за день пропускаются.
+    Возвращает: (user_id, часовой пояс, день, события в формате get_events_in_range)
+    """
+    if not claims:
+        return
+    days: Dict[int, Tuple[tzinfo, date]] = {}
+    windows: Dict[int, Tuple[int, int]] = {}
+    for user_id, tz_name, digest_at in claims:
+        tz = get_zone(tz_name)
+        day = datetime.fromtimestamp(digest_at, tz).date()
+        days[user_id] = (tz, day)
+        windows[user_id] = day_bounds(day.strftime("%Y-%m-%d"), tz=tz)
+    values = ", ".join("(?, ?, ?)" for _ in windows)
+    params = tuple(value for user_id, bounds in windows.items() for value in (user_id, *bounds))
+    async with _reader() as db:
+        occurrence_rows = await _rule_occurrences_by_user(db, windows)
+        # Сегодняшние события ещё не в архиве: переносятся только события старше ARCHIVE_AFTER_DAYS
+        cursor = await db.execute(
+            f"WITH w(user_id, day_start, day_end) AS (VALUES {values}) "
+            "SELECT e.user_id, e.id, e.title, e.starts_at, e.tag, e.status FROM w "
+            "JOIN events e ON e.user_id = w.user_id AND e.starts_at >= w.day_start AND e.starts_at < w.day_end "
+            "ORDER BY e.user_id, e.starts_at, e.id",
+            params
+        )
+        cursor.arraysize = 500
+        current, rows = None, []
+        async for user_id, *event in cursor:
+            if user_id != current:
+                if rows:
+                    yield (current, *days[current], sorted(rows + occurrence_rows.pop(current, []), key=lambda row: row[2]))
+                current, rows = user_id, []
+            rows.append(tuple(event))
+        if rows:
+            yield (current, *days[current], sorted(rows + occurrence_rows.pop(current, []), key=lambda row: row[2]))
+    for user_id, rows in occurrence_rows.items():
+        if rows:
+            yield (user_id, *days[user_id], sorted(rows, key=lambda row: row[2]))
+
+# Добавить событие в базу (с поддержкой тега)
+@timed_query
+async def add_event(user_id: int, title: str, starts_at: int, tag: str = "") -> None:
+    """
+    Добавляет событие в базу данных. starts_at — время начала (UTC-таймстемп).
+    """
+    async def op(db: aiosqlite.Connection) -> None:
+        # remind_at считается по настройкам владельца; без записи в user_settings — 60 минут, напоминания включены
+        cursor = await db.execute(
+            "INSERT INTO events (user_id, title, starts_at, tag, remind_at) VALUES (?, ?, ?, ?, "
+            "(SELECT CASE WHEN COALESCE(MAX(notifications_enabled), 1) = 1 "
+            "THEN ? - 60 * COALESCE(MAX(remind_before), ?) END FROM user_settings WHERE user_id=?)) RETURNING id",
+            (user_id, title, starts_at, tag, starts_at, DEFAULT_REMIND_BEFORE, user_id)
+        )
+        event_id = (await cursor.fetchall())[0][0]
+        await db.execute("INSERT INTO events_fts (rowid, body) VALUES (?, ?)", (event_id, fts_document(user_id, title)))
+    try:
+        await _submit(op)
+        await _emit_events_changed(user_id, (starts_at,))
+    except Exception as e:
+        logging.error(f"Ошибка добавления события: {e}")
+
+# Массово добавить события пользователя (импорт файла): одна транзакция, executemany пачками
+@timed_query
+async def add_events(user_id: int, events: Iterable[Tuple[str, int, str]], chunk_size: int = IMPORT_CHUNK_SIZE) -> int:
+    """
+    Добавляет события (title, starts_at, tag) одной транзакцией, вставляя их пачками по chunk_size.
+    events может быть генератором — он читается по мере вставки. Возвращает число добавленных событий.
+    """
+    starts: List[int] = []
+    try:
+        async with _writer() as db:
+            # Как в add_event: пустые настройки (строка есть, поле NULL) — значения по умолчанию
             cursor = await db.execute(
-                "SELECT DISTINCT user_id FROM events"
+                "SELECT COALESCE(notifications_enabled, 1), COALESCE(remind_before, ?) FROM user_settings "
+                "WHERE user_id=?", (DEFAULT_REMIND_BEFORE, user_id)
             )
-            all_users = {row[0] for row in await cursor.fetchall()}
-            for user_id in all_users:
-                if user_id not in user_remind:
-                    user_remind[user_id] = 60
-            # Собираем события для напоминания (только те, у которых status='active')
-            result = []
-            for user_id, remind_before in user_remind.items():
-                target_time = now + timedelta(minutes=remind_before)
-                date_str = target_time.strftime("%Y-%m-%d")
-                time_from = (target_time - timedelta(minutes=1)).strftime("%H:%M")
-                time_to = (target_time + timedelta(minutes=1)).strftime("%H:%M")
-                cursor = await db.execute(
-                    "SELECT id, title, date, time FROM events WHERE user_id=? AND date=? AND time BETWEEN ? AND ? AND (status IS NULL OR status='active')",
-                    (user_id, date_str, time_from, time_to)
+            row = await cursor.fetchone()
+            enabled, remind_before = (bool(row[0]), row[1]) if row else (True, DEFAULT_REMIND_BEFORE)
+            events = iter(events)
+            while True:
+                chunk = [
+                    (user_id, title, starts_at, tag, starts_at - remind_before * 60 if enabled else None)
+                    for title, starts_at, tag in islice(events, chunk_size)
+                ]
+                if not chunk:
+                    break
+                cursor = await db.execute("SELECT COALESCE(MAX(id), 0) FROM events")
+                last_id = (await cursor.fetchone())[0]
+                await db.executemany(
+                    "INSERT INTO events (user_id, title, starts_at, tag, remind_at) VALUES (?, ?, ?, ?, ?)", chunk
+                )
+                # Запись идёт только через это соединение, так что новые строки пачки — все с id больше last_id
+                cursor = await db.execute("SELECT id, title FROM events WHERE id > ?", (last_id,))
+                await db.executemany(
+                    "INSERT INTO events_fts (rowid, body) VALUES (?, ?)",
+                    [(event_id, fts_document(user_id, title)) for event_id, title in await cursor.fetchall()]
                 )
-                for row in await cursor.fetchall():
-                    event_id, title, event_date, event_time = row
-                    # Парсим дату и время события как МСК
-                    event_dt = datetime.strptime(f"{event_date} {event_time}", "%Y-%m-%d %H:%M").replace(tzinfo=timezone("Europe/Moscow"))
-                    # Можно добавить дополнительные проверки, если нужно
-                    result.append((user_id, event_id, title))
-            return result
+                starts += [row[2] for row in chunk]
+    except Exception as e:
+        logging.error(f"Ошибка массового добавления событий: {e}")
+        return 0
+    if starts:
+        await _emit_events_changed(user_id, starts)
+    return len(starts)
+
+# Раздел напоминаний пользователя (Telegram user_id положительны, так что % совпадает с SQL)
+def reminder_partition(user_id: int) -> int:
+    return user_id % REMINDER_PARTITIONS
+
+# Получить события, о которых пора напомнить (один диапазонный запрос по индексу (status, remind_at))
+@timed_query
+async def get_events_for_reminder(
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    user_id: Optional[int] = None,
+    partitions: Optional[Sequence[int]] = None
+) -> List[Tuple[int, int, str, int]]:
+    """
+    Получает активные события с напоминанием в интервале (since, until]: по умолчанию
+    since — REMIND_GRACE_SECONDS назад, until — сейчас. Можно ограничить одним
+    пользователем и/или разделами напоминаний (user_id % REMINDER_PARTITIONS).
+    Вхождения повторяющихся событий разворачиваются только в этом интервале;
+    вместо event_id у них отрицательный ключ occurrence_key.
+    Возвращает: (user_id, event_id, title, remind_at)
+    """
+    if partitions is not None and not partitions:
+        return []
+    try:
+        now = int(time.time())
+        since = now - REMIND_GRACE_SECONDS if since is None else since
+        until = now if until is None else until
+        query = (
+            "SELECT user_id, id, title, remind_at FROM events "
+            "WHERE status='active' AND remind_at > ? AND remind_at <= ?"
+        )
+        params: Tuple = (since, until)
+        if user_id is not None:
+            query += " AND user_id=?"
+            params += (user_id,)
+        if partitions is not None:
+            query += f" AND user_id % ? IN ({','.join('?' * len(partitions))})"
+            params += (REMINDER_PARTITIONS, *partitions)
+        async with _reader() as db:
+            cursor = await db.execute(query + " ORDER BY remind_at", params)
+            rows = list(map(tuple, await cursor.fetchall()))
+            occurrence_rows = await _rule_reminders(db, since, until, user_id, partitions)
+        if occurrence_rows:
+            rows = sorted(rows + occurrence_rows, key=lambda row: row[3])
+        return rows
     except Exception as e:
         logging.error(f"Ошибка получения событий для напоминания: {e}")
         return []
 
-# Массово обновить статус событий на 'reminded'
-async def set_events_reminded(event_ids: list[int], user_id: int) -> None:
+# Перевести события в 'reminded' только из 'active' (одна транзакция на весь тик напоминаний)
+@timed_query
+async def set_events_reminded(event_ids: Sequence[int]) -> List[int]:
     """
-    Устанавливает статус 'reminded' для списка событий пользователя.
+    Устанавливает статус 'reminded' для тех событий списка, которые ещё активны
+    (для вхождений повторяющихся событий — отмечает напоминание в правиле или исключении),
+    и возвращает их id. Переход выполняется ровно один раз, поэтому при нескольких
+    процессах напоминание отправляет только тот, кто его перевёл.
     """
     if not event_ids:
-        return
+        return []
+    ids = [event_id for event_id in event_ids if event_id > 0]
+    keys = sorted((split_occurrence_key(key) + (key,) for key in event_ids if key < 0), key=lambda item: item[1])
     try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.executemany(
-                "UPDATE events SET status='reminded' WHERE id=? AND user_id=?",
-                [(eid, user_id) for eid in event_ids]
-            )
-            await db.commit()
+        claimed: List[int] = []
+        async with _writer() as db:
+            if ids:
+                cursor = await db.execute(
+                    f"UPDATE events SET status='reminded' "
+                    f"WHERE status='active' AND id IN ({','.join('?' * len(ids))}) RETURNING id",
+                    tuple(ids)
+                )
+                claimed += [row[0] for row in await cursor.fetchall()]
+            # Вхождения правила: у исключения — свой флаг, у остальных — reminded_until правила,
+            # который сдвигается только вперёд (поэтому вхождения идут по возрастанию времени)
+            for rule_id, occurrence_at, key in keys:
+                cursor = await db.execute(
+                    "SELECT 1 FROM rule_overrides WHERE rule_id=? AND occurrence_at=?", (rule_id, occurrence_at)
+                )
+                if await cursor.fetchone() is None:
+                    cursor = await db.execute(
+                        "UPDATE event_rules SET reminded_until=? WHERE id=? AND reminded_until < ? RETURNING id",
+                        (occurrence_at, rule_id, occurrence_at)
+                    )
+                else:
+                    cursor = await db.execute(
+                        "UPDATE rule_overrides SET reminded=1 WHERE rule_id=? AND occurrence_at=? "
+                        "AND reminded=0 AND status IS NULL RETURNING rule_id",
+                        (rule_id, occurrence_at)
+                    )
+                if await cursor.fetchall():
+                    claimed.append(key)
+        return claimed
     except Exception as e:
         logging.error(f"Ошибка массового обновления статуса событий: {e}")
+        return []
 
-# Получить все события пользователя на дату (теперь возвращает tag)
-async def get_events_for_date(date: str, user_id: int) -> List[Tuple[str, str, str]]:
+async def _save_watermarks(db: aiosqlite.Connection, owner: str, watermarks: Optional[Dict[int, int]]) -> None:
+    # Водяной знак только растёт и пишется лишь в разделы, которыми owner ещё владеет
+    if watermarks:
+        await db.executemany(
+            "UPDATE reminder_leases SET scanned_until=MAX(COALESCE(scanned_until, 0), ?) WHERE partition=? AND owner=?",
+            [(scanned_until, partition, owner) for partition, scanned_until in watermarks.items()]
+        )
+
+# Продлить свои аренды разделов напоминаний и добрать свободные до справедливой доли
+@timed_query
+async def claim_partitions(
+    owner: str,
+    lease_seconds: int,
+    watermarks: Optional[Dict[int, int]] = None
+) -> Dict[int, Optional[int]]:
     """
-    Получает события пользователя на определённую дату.
+    Отмечает owner живым, продлевает аренду его разделов и сохраняет их водяные знаки
+    (watermarks: раздел -> scanned_until), захватывает свободные и просроченные разделы
+    до доли REMINDER_PARTITIONS / число живых процессов, а излишек отпускает, чтобы его
+    забрали новые процессы. Возвращает разделы owner с их водяными знаками (None — ещё нет).
     """
     try:
-        async with aiosqlite.connect(DB_NAME) as db:
+        now = int(time.time())
+        async with _writer() as db:
+            await db.execute(
+                "INSERT INTO reminder_workers (worker_id, expires_at) VALUES (?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET expires_at=excluded.expires_at",
+                (owner, now + lease_seconds)
+            )
+            await db.execute("DELETE FROM reminder_workers WHERE expires_at <= ?", (now,))
+            await db.execute(
+                "WITH RECURSIVE p(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM p WHERE n + 1 < ?) "
+                "INSERT OR IGNORE INTO reminder_leases (partition, owner, expires_at) SELECT n, NULL, 0 FROM p",
+                (REMINDER_PARTITIONS,)
+            )
+            await db.execute(
+                "UPDATE reminder_leases SET expires_at=? WHERE owner=? AND expires_at > ?",
+                (now + lease_seconds, owner, now)
+            )
+            await _save_watermarks(db, owner, watermarks)
+            cursor = await db.execute("SELECT COUNT(*) FROM reminder_workers")
+            workers = (await cursor.fetchone())[0]
+            _set_settings_cache_enabled(workers == 1)
+            share = -(-REMINDER_PARTITIONS // workers)
             cursor = await db.execute(
-                "SELECT title, time, tag FROM events WHERE date=? AND user_id=? ORDER BY time",
-                (date, user_id)
+                "SELECT partition FROM reminder_leases WHERE owner=? AND expires_at > ? ORDER BY partition",
+                (owner, now)
             )
-            rows = await cursor.fetchall()
-            return list(map(tuple, rows))
+            owned = [row[0] for row in await cursor.fetchall()]
+            if len(owned) > share:
+                await db.executemany(
+                    "UPDATE reminder_leases SET owner=NULL, expires_at=0 WHERE partition=? AND owner=?",
+                    [(p, owner) for p in owned[share:]]
+                )
+                owned = owned[:share]
+            elif len(owned) < share:
+                cursor = await db.execute(
+                    "UPDATE reminder_leases SET owner=?, expires_at=? WHERE partition IN ("
+                    "SELECT partition FROM reminder_leases WHERE owner IS NULL OR expires_at <= ? "
+                    "ORDER BY partition LIMIT ?) RETURNING partition",
+                    (owner, now + lease_seconds, now, share - len(owned))
+                )
+                owned = sorted(owned + [row[0] for row in await cursor.fetchall()])
+            if not owned:
+                return {}
+            cursor = await db.execute(
+                f"SELECT partition, scanned_until FROM reminder_leases WHERE partition IN ({','.join('?' * len(owned))})",
+                tuple(owned)
+            )
+            return {partition: scanned_until for partition, scanned_until in await cursor.fetchall()}
     except Exception as e:
-        logging.error(f"Ошибка получения событий на дату: {e}")
-        return []
+        logging.error(f"Ошибка продления аренды разделов напоминаний: {e}")
+        return {}
 
-# --- ДОБАВЛЯЕМ ПОЛЕ status В ТАБЛИЦУ events ---
-async def migrate_add_status_to_events():
+# Отпустить все разделы процесса (при штатной остановке)
+@timed_query
+async def release_partitions(owner: str, watermarks: Optional[Dict[int, int]] = None) -> None:
     """
-    Добавляет поле status в таблицу events, если его нет.
+    Сохраняет водяные знаки и освобождает аренды owner, чтобы другие процессы забрали
+    разделы сразу, не дожидаясь истечения.
     """
     try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            try:
-                await db.execute("ALTER TABLE events ADD COLUMN status TEXT DEFAULT 'active'")
-                await db.commit()
-                logging.info("Поле status добавлено в таблицу events.")
-            except Exception:
-                pass  # Уже добавлено
+        async with _writer() as db:
+            await _save_watermarks(db, owner, watermarks)
+            await db.execute("UPDATE reminder_leases SET owner=NULL, expires_at=0 WHERE owner=?", (owner,))
+            await db.execute("DELETE FROM reminder_workers WHERE worker_id=?", (owner,))
     except Exception as e:
-        logging.error(f"Ошибка миграции поля status: {e}")
+        logging.error(f"Ошибка освобождения аренды разделов напоминаний: {e}")
+
+# Получить все события пользователя на дату (теперь возвращает tag)
+@timed_query
+async def get_events_for_date(date: str, user_id: int, tz: tzinfo = TZ) -> List[Tuple[str, int, str]]:
+    """
+    Получает события пользователя на определённую дату в часовом поясе tz (время — UTC-таймстемп).
+    """
+    try:
+        day_start, day_end = day_bounds(date, tz=tz)
+        async with _reader() as db:
+            cursor = await db.execute(
+                "SELECT title, starts_at, tag FROM events WHERE user_id=? AND starts_at >= ? AND starts_at < ? ORDER BY starts_at",
+                (user_id, day_start, day_end)
+            )
+            rows = await cursor.fetchall()
+            return list(map(tuple, rows))
+    except Exception as e:
+        logging.error(f"Ошибка получения событий на дату: {e}")
+        return []
 
 # --- УСТАНОВИТЬ СТАТУС ЗАДАЧИ ---
+@timed_query
 async def set_event_status(event_id: int, user_id: int, status: str) -> bool:
     """
-    Устанавливает статус задачи.
+    Устанавливает статус задачи (в том числе уже перенесённой в архив).
+    Возвращает False, если задачи с таким id у пользователя нет.
     """
-    try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute(
-                "UPDATE events SET status=? WHERE id=? AND user_id=?",
+    async def op(db: aiosqlite.Connection) -> List[int]:
+        starts: List[int] = []
+        for table in ("events", "events_archive"):
+            cursor = await db.execute(
+                f"UPDATE {table} SET status=? WHERE id=? AND user_id=? RETURNING starts_at",
                 (status, event_id, user_id)
             )
-            await db.commit()
-            return True
+            starts += [row[0] for row in await cursor.fetchall()]
+            if starts:
+                break
+        return starts
+    try:
+        starts = await _submit(op)
+        if starts:
+            await _emit_events_changed(user_id, starts)
+        return bool(starts)
     except Exception as e:
         logging.error(f"Ошибка установки статуса задачи: {e}")
         return False
 
 # --- ПОЛУЧИТЬ СТАТУС ЗАДАЧИ ---
+@timed_query
 async def get_event_status(event_id: int, user_id: int) -> str:
     """
     Получает статус задачи.
     """
     try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            cursor = await db.execute(
-                "SELECT status FROM events WHERE id=? AND user_id=?",
-                (event_id, user_id)
-            )
-            row = await cursor.fetchone()
-            return row[0] if row else 'active'
+        async with _reader() as db:
+            for table in ("events", "events_archive"):
+                cursor = await db.execute(
+                    f"SELECT status FROM {table} WHERE id=? AND user_id=?",
+                    (event_id, user_id)
+                )
+                row = await cursor.fetchone()
+                if row:
+                    return row[0]
+            return 'active'
     except Exception as e:
         logging.error(f"Ошибка получения статуса задачи: {e}")
         return 'active'
 
-# --- ОБНОВЛЯЕМ ВЫБОРКИ: ДОБАВЛЯЕМ status ---
-# Получить все события пользователя на дату (с id)
-async def get_events_for_date_with_id(date: str, user_id: int) -> List[Tuple[int, str, str, str, str]]:
+# --- ПОВТОРЯЮЩИЕСЯ СОБЫТИЯ ---
+# Правило хранится одной строкой и разворачивается во вхождения только для запрошенного окна;
+# исключения (выполнено, удалено, перенесено) хранятся лишь для затронутых вхождений.
+RULE_COLUMNS = ("id", "user_id", "title", "tag", "starts_at", "freq", "interval", "weekdays", "until", "count", "tz")
+OVERRIDES_CHUNK = 500
+
+def _rule_from_row(row: Sequence[Any]) -> Rule:
+    weekdays = tuple(int(day) for day in row[7].split(",") if day) if row[7] else ()
+    return Rule(row[0], row[1], row[2], row[3] or "", row[4], row[5], row[6] or 1, weekdays, row[8], row[9], row[10])
+
+def _rule_select(alias: str = "") -> str:
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(prefix + column for column in RULE_COLUMNS)
+
+async def _get_overrides(db: aiosqlite.Connection, rule_ids: Sequence[int]) -> Dict[Tuple[int, int], Tuple[Optional[str], Optional[int], int]]:
+    # Исключения правил по первичному ключу (rule_id, occurrence_at), пачками по OVERRIDES_CHUNK
+    overrides = {}
+    for i in range(0, len(rule_ids), OVERRIDES_CHUNK):
+        chunk = rule_ids[i:i + OVERRIDES_CHUNK]
+        cursor = await db.execute(
+            f"SELECT rule_id, occurrence_at, status, moved_to, reminded FROM rule_overrides "
+            f"WHERE rule_id IN ({','.join('?' * len(chunk))})",
+            tuple(chunk)
+        )
+        for rule_id, occurrence_at, status, moved_to, reminded in await cursor.fetchall():
+            overrides[(rule_id, occurrence_at)] = (status, moved_to, reminded)
+    return overrides
+
+async def _rule_occurrences_by_user(db: aiosqlite.Connection, windows: Dict[int, Tuple[int, int]],
+                                    tag: Optional[str] = None) -> Dict[int, List[Tuple[str, str, int, str, str]]]:
+    """
+    Вхождения повторяющихся событий нескольких пользователей, каждого — с началом в своём окне
+    [start, end) из windows, с учётом исключений: удалённые пропускаются, перенесённые
+    показываются в новое время. Правила всех пользователей читаются одним запросом.
+    Возвращает: user_id -> [(идентификатор вхождения, title, starts_at, tag, status)]
+    """
+    user_ids = list(windows)
+    query = f"SELECT {_rule_select()} FROM event_rules WHERE user_id IN ({','.join('?' * len(user_ids))})"
+    params: Tuple = tuple(user_ids)
+    if tag is not None:
+        query, params = query + " AND tag=?", params + (tag,)
+    cursor = await db.execute(query, params)
+    rules = {rule.id: rule for rule in map(_rule_from_row, await cursor.fetchall())}
+    if not rules:
+        return {}
+    overrides = await _get_overrides(db, list(rules))
+    rows: Dict[int, List[Tuple[str, str, int, str, str]]] = {}
+    for rule in rules.values():
+        start, end = windows[rule.user_id]
+        for ts in occurrences(rule, start, end):
+            override_status, moved_to, _ = overrides.get((rule.id, ts), (None, None, 0))
+            if override_status != 'deleted' and moved_to is None:
+                rows.setdefault(rule.user_id, []).append((occurrence_ref(rule.id, ts, get_zone(rule.tz)), rule.title, ts,
+                                                          rule.tag, override_status or 'active'))
+    for (rule_id, occurrence_at), (override_status, moved_to, _) in overrides.items():
+        rule = rules[rule_id]
+        start, end = windows[rule.user_id]
+        if moved_to is not None and start <= moved_to < end and override_status != 'deleted':
+            rows.setdefault(rule.user_id, []).append((occurrence_ref(rule_id, occurrence_at, get_zone(rule.tz)), rule.title,
+                                                      moved_to, rule.tag, override_status or 'active'))
+    return rows
+
+async def _rule_occurrences(db: aiosqlite.Connection, user_id: int, start: int, end: int, tag: Optional[str] = None,
+                            status: Optional[str] = None) -> List[Tuple[str, str, int, str, str]]:
+    """
+    Вхождения повторяющихся событий пользователя с началом в [start, end) (см. _rule_occurrences_by_user).
+    tag и status — как в get_events_in_range (статус вхождения вычисляется, поэтому он проверяется здесь же).
+    Возвращает: (идентификатор вхождения, title, starts_at, tag, status)
+    """
+    rows = (await _rule_occurrences_by_user(db, {user_id: (start, end)}, tag)).get(user_id, [])
+    if status is not None:
+        now = int(time.time())
+        statuses, _ = STATUS_FILTERS[status]
+        rows = [
+            row for row in rows
+            if row[4] in statuses and (status == "done" or (row[2] >= now) == (status == "active"))
+        ]
+    return rows
+
+async def _rule_reminders(
+    db: aiosqlite.Connection,
+    since: int,
+    until: int,
+    user_id: Optional[int],
+    partitions: Optional[Sequence[int]]
+) -> List[Tuple[int, int, str, int]]:
+    """
+    Напоминания по вхождениям правил с remind_at в (since, until]. Законченные и ещё не начавшиеся
+    правила отсекаются запросом, так что работа зависит от числа правил, а не вхождений.
+    """
+    remind_before = f"60 * COALESCE(s.remind_before, {DEFAULT_REMIND_BEFORE})"
+    query = (
+        f"SELECT {_rule_select('r')}, r.reminded_until, {remind_before} FROM event_rules r "
+        f"LEFT JOIN user_settings s ON s.user_id = r.user_id "
+        f"WHERE COALESCE(s.notifications_enabled, 1) = 1 AND r.starts_at - {remind_before} <= ? "
+        f"AND (r.until IS NULL OR r.until - {remind_before} > ?)"
+    )
+    params: Tuple = (until, since)
+    if user_id is not None:
+        query += " AND r.user_id=?"
+        params += (user_id,)
+    if partitions is not None:
+        query += f" AND r.user_id % ? IN ({','.join('?' * len(partitions))})"
+        params += (REMINDER_PARTITIONS, *partitions)
+    cursor = await db.execute(query, params)
+    candidates = [(_rule_from_row(row), row[-2] or 0, row[-1]) for row in await cursor.fetchall()]
+    if not candidates:
+        return []
+    overrides = await _get_overrides(db, [rule.id for rule, _, _ in candidates])
+    rows = []
+    for rule, reminded_until, offset in candidates:
+        for ts in occurrences(rule, since + offset + 1, until + offset + 1):
+            if ts > reminded_until and (rule.id, ts) not in overrides:
+                rows.append((rule.user_id, occurrence_key(rule.id, ts), rule.title, ts - offset))
+    offsets = {rule.id: (rule, offset) for rule, _, offset in candidates}
+    for (rule_id, occurrence_at), (status, moved_to, reminded) in overrides.items():
+        rule, offset = offsets[rule_id]
+        remind_at = (occurrence_at if moved_to is None else moved_to) - offset
+        if status is None and not reminded and since < remind_at <= until:
+            rows.append((rule.user_id, occurrence_key(rule_id, occurrence_at), rule.title, remind_at))
+    return rows
+
+@timed_query
+async def add_rule(
+    user_id: int,
+    title: str,
+    starts_at: int,
+    tag: str = "",
+    freq: str = "weekly",
+    weekdays: Sequence[int] = (),
+    interval: int = 1,
+    until: Optional[int] = None,
+    count: Optional[int] = None,
+    tz: Optional[str] = None
+) -> Optional[int]:
+    """
+    Добавляет повторяющееся событие одной строкой правила. Для правила с count в until
+    записывается начало последнего вхождения, чтобы законченные правила отсекались запросами.
+    tz — часовой пояс пользователя (название), в нём повторяется местное время вхождений.
+    Возвращает id правила или None при ошибке.
+    """
+    rule = Rule(0, user_id, title, tag, starts_at, freq, interval, tuple(sorted(set(weekdays))), until, count, tz)
+    if count is not None:
+        last = last_occurrence(rule)
+        rule = rule._replace(until=last if last is not None else starts_at)
+    async def op(db: aiosqlite.Connection) -> int:
+        cursor = await db.execute(
+            "INSERT INTO event_rules (user_id, title, tag, starts_at, freq, interval, weekdays, until, count, tz, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) RETURNING id",
+            (user_id, title, tag, starts_at, freq, interval, ",".join(map(str, rule.weekdays)),
+             rule.until, count, tz, int(time.time()))
+        )
+        rule_id = (await cursor.fetchall())[0][0]
+        await db.execute("INSERT INTO events_fts (rowid, body) VALUES (?, ?)", (-rule_id, fts_document(user_id, title)))
+        return rule_id
+    try:
+        rule_id = await _submit(op)
+        await _emit_events_changed(user_id)
+        return rule_id
+    except Exception as e:
+        logging.error(f"Ошибка добавления повторяющегося события: {e}")
+        return None
+
+@timed_query
+async def get_rules(user_id: int, tag: Optional[str] = None) -> List[Rule]:
+    """
+    Получает правила повторения пользователя (при tag — только с этим тегом) в порядке создания.
     """
-    Получает события пользователя на дату с id и статусом.
+    query, params = f"SELECT {_rule_select()} FROM event_rules WHERE user_id=?", (user_id,)
+    if tag is not None:
+        query, params = query + " AND tag=?", params + (tag,)
+    try:
+        async with _reader() as db:
+            cursor = await db.execute(query + " ORDER BY id", params)
+            return [_rule_from_row(row) for row in await cursor.fetchall()]
+    except Exception as e:
+        logging.error(f"Ошибка получения повторяющихся событий: {e}")
+        return []
+
+@timed_query
+async def get_rule(rule_id: int, user_id: int) -> Optional[Rule]:
+    """
+    Получает правило повторения по id, если оно принадлежит пользователю.
     """
     try:
-        async with aiosqlite.connect(DB_NAME) as db:
+        async with _reader() as db:
             cursor = await db.execute(
-                "SELECT id, title, time, tag, status FROM events WHERE date=? AND user_id=? ORDER BY time",
-                (date, user_id)
+                f"SELECT {_rule_select()} FROM event_rules WHERE id=? AND user_id=?", (rule_id, user_id)
             )
-            rows = await cursor.fetchall()
-            return list(map(tuple, rows))
+            row = await cursor.fetchone()
+            return _rule_from_row(row) if row else None
     except Exception as e:
-        logging.error(f"Ошибка получения событий на дату: {e}")
+        logging.error(f"Ошибка получения повторяющегося события: {e}")
+        return None
+
+@timed_query
+async def delete_rule(rule_id: int, user_id: int) -> bool:
+    """
+    Удаляет правило повторения вместе с исключениями его вхождений.
+    """
+    async def op(db: aiosqlite.Connection) -> bool:
+        cursor = await db.execute("DELETE FROM event_rules WHERE id=? AND user_id=? RETURNING id", (rule_id, user_id))
+        if not await cursor.fetchall():
+            return False
+        await db.execute("DELETE FROM rule_overrides WHERE rule_id=?", (rule_id,))
+        return True
+    try:
+        deleted = await _submit(op)
+        if deleted:
+            await _emit_events_changed(user_id)
+        return deleted
+    except Exception as e:
+        logging.error(f"Ошибка удаления повторяющегося события: {e}")
+        return False
+
+@timed_query
+async def set_occurrence(rule_id: int, user_id: int, occurrence_at: int, status: Optional[str] = None,
+                         moved_to: Optional[int] = None) -> bool:
+    """
+    Записывает исключение для одного вхождения правила: статус ('done' или 'deleted')
+    и/или новое время начала. После переноса напоминание о вхождении придёт заново.
+    """
+    async def op(db: aiosqlite.Connection) -> List[int]:
+        cursor = await db.execute(
+            "SELECT moved_to FROM rule_overrides WHERE rule_id=? AND occurrence_at=?", (rule_id, occurrence_at)
+        )
+        previous = await cursor.fetchone()
+        cursor = await db.execute(
+            "INSERT INTO rule_overrides (rule_id, occurrence_at, status, moved_to) "
+            "SELECT id, ?, ?, ? FROM event_rules WHERE id=? AND user_id=? "
+            "ON CONFLICT(rule_id, occurrence_at) DO UPDATE SET "
+            "status=COALESCE(excluded.status, status), moved_to=COALESCE(excluded.moved_to, moved_to), "
+            "reminded=CASE WHEN excluded.moved_to IS NULL THEN reminded ELSE 0 END RETURNING moved_to",
+            (occurrence_at, status, moved_to, rule_id, user_id)
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            return []
+        return [ts for ts in (occurrence_at, previous[0] if previous else None, rows[0][0]) if ts is not None]
+    try:
+        starts = await _submit(op)
+        if starts:
+            await _emit_events_changed(user_id, starts)
+        return bool(starts)
+    except Exception as e:
+        logging.error(f"Ошибка изменения вхождения повторяющегося события: {e}")
+        return False
+
+# --- ОБНОВЛЯЕМ ВЫБОРКИ: ДОБАВЛЯЕМ status ---
+# Фильтры по статусу: статусы в базе и условие на время начала. «Активные» — ещё не начавшиеся
+# невыполненные, «просроченные» — начавшиеся невыполненные (в архиве они уже со статусом overdue).
+STATUS_FILTERS: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    "active": (("active", "reminded"), "starts_at >= ?"),
+    "done": (("done",), ""),
+    "overdue": (("active", "reminded", "overdue"), "starts_at < ?"),
+}
+
+def _event_filters(tag: Optional[str], status: Optional[str]) -> Tuple[str, Tuple, Tuple[str, ...]]:
+    """
+    Условие (с ведущим AND), его параметры и статусы для _events_with_archive по фильтрам выборки.
+    """
+    where, params = "", ()
+    if tag is not None:
+        where += " AND tag=?"
+        params += (tag,)
+    statuses: Tuple[str, ...] = ()
+    if status is not None:
+        statuses, condition = STATUS_FILTERS[status]
+        if condition:
+            where += f" AND {condition}"
+            params += (int(time.time()),)
+    return where, params, statuses
+
+def _events_with_archive(where: str, params: Tuple, order: str, limit: Optional[int] = None,
+                         statuses: Sequence[str] = ()) -> Tuple[str, Tuple]:
+    """
+    Запрос к events и events_archive с одинаковым условием: каждая таблица — а при фильтре
+    по статусам каждый статус в каждой таблице — читается по своему индексу и при limit
+    не дальше LIMIT, затем части сливаются. Возвращает текст запроса и его параметры.
+    """
+    limit_sql = " LIMIT ?" if limit is not None else ""
+    limit_params = (limit,) if limit is not None else ()
+    parts, all_params = [], ()
+    for table in ("events", "events_archive"):
+        for status in statuses or (None,):
+            condition = where + (" AND status=?" if status else "")
+            parts.append(
+                f"SELECT * FROM (SELECT id, title, starts_at, tag, status FROM {table} "
+                f"WHERE {condition} ORDER BY {order}{limit_sql})"
+            )
+            all_params += params + ((status,) if status else ()) + limit_params
+    return " UNION ALL ".join(parts) + f" ORDER BY {order}{limit_sql}", all_params + limit_params
+
+# Получить события пользователя за период [start, end) (вместе с архивом) по индексам (user_id, starts_at)
+@timed_query
+async def get_events_in_range(user_id: int, start: int, end: int, tag: Optional[str] = None,
+                              status: Optional[str] = None) -> List[Tuple[int, str, int, str, str]]:
+    """
+    Получает события пользователя с началом в [start, end) (UTC-таймстемпы), по порядку,
+    включая перенесённые в архив и вхождения повторяющихся событий (их id — строка вида
+    r<id правила>-<YYYYMMDD>). tag и status (ключ STATUS_FILTERS) сужают выборку.
+    """
+    try:
+        filters, filter_params, statuses = _event_filters(tag, status)
+        async with _reader() as db:
+            cursor = await db.execute(*_events_with_archive(
+                "user_id=? AND starts_at >= ? AND starts_at < ?" + filters, (user_id, start, end) + filter_params,
+                "starts_at, id", statuses=statuses
+            ))
+            rows = list(map(tuple, await cursor.fetchall()))
+            occurrence_rows = await _rule_occurrences(db, user_id, start, end, tag, status)
+        if occurrence_rows:
+            rows = sorted(rows + occurrence_rows, key=lambda row: row[2])
+        return rows
+    except Exception as e:
+        logging.error(f"Ошибка получения событий за период: {e}")
         return []
 
+# Получить все события пользователя на дату (с id)
+async def get_events_for_date_with_id(date: str, user_id: int, tz: tzinfo = TZ) -> List[Tuple[int, str, int, str, str]]:
+    """
+    Получает события пользователя на дату в часовом поясе tz с id и статусом (время — UTC-таймстемп).
+    """
+    return await get_events_in_range(user_id, *day_bounds(date, tz=tz))
+
 # Удалить событие по id
+@timed_query
 async def delete_event(event_id: int, user_id: int) -> bool:
     """
-    Удаляет событие по id.
+    Удаляет событие по id (в том числе уже перенесённое в архив).
     """
-    try:
-        async with aiosqlite.connect(DB_NAME) as db:
+    async def op(db: aiosqlite.Connection) -> List[int]:
+        starts: List[int] = []
+        for table in ("events", "events_archive"):
             cursor = await db.execute(
-                "DELETE FROM events WHERE id=? AND user_id=?",
+                f"DELETE FROM {table} WHERE id=? AND user_id=? RETURNING starts_at",
                 (event_id, user_id)
             )
-            await db.commit()
-            return cursor.rowcount > 0
+            starts += [row[0] for row in await cursor.fetchall()]
+            if starts:
+                break
+        return starts
+    try:
+        starts = await _submit(op)
+        if starts:
+            await _emit_events_changed(user_id, starts)
+        return bool(starts)
     except Exception as e:
         logging.error(f"Ошибка удаления события: {e}")
         return False
 
+# Получить страницу событий пользователя (keyset-пагинация по (starts_at, id))
+@timed_query
+async def get_events_page(user_id: int, after: Optional[Tuple[int, int]] = None,
+                          before: Optional[Tuple[int, int]] = None,
+                          limit: int = 20, tag: Optional[str] = None,
+                          status: Optional[str] = None) -> Tuple[List[Tuple[int, str, int, str, str]], bool]:
+    """
+    Получает до limit событий пользователя, идущих после ключа after (или перед ключом before),
+    где ключ — (starts_at, id), с необязательным фильтром по тегу или статусу (ключ STATUS_FILTERS).
+    Страницы идут по events и архиву вместе; стоимость запроса не зависит от размера истории.
+    Возвращает: (события по возрастанию, есть ли ещё события в направлении листания)
+    """
+    try:
+        filters, params, statuses = _event_filters(tag, status)
+        where = "user_id=?" + filters
+        params = (user_id,) + params
+        order = "starts_at, id"
+        if before is not None:
+            where += " AND (starts_at, id) < (?, ?)"
+            params += before
+            order = "starts_at DESC, id DESC"
+        elif after is not None:
+            where += " AND (starts_at, id) > (?, ?)"
+            params += after
+        async with _reader() as db:
+            cursor = await db.execute(*_events_with_archive(where, params, order, limit + 1, statuses))
+            rows = list(map(tuple, await cursor.fetchall()))
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before is not None:
+            rows.reverse()
+        return rows, has_more
+    except Exception as e:
+        logging.error(f"Ошибка получения страницы событий пользователя: {e}")
+        return [], False
+
 # Получить все события пользователя за всё время (с id)
-async def get_all_events_for_user(user_id: int) -> List[Tuple[int, str, str, str, str, str]]:
+@timed_query
+async def get_all_events_for_user(user_id: int) -> List[Tuple[int, str, int, str, str]]:
     """
-    Получает все события пользователя за всё время.
+    Получает все события пользователя за всё время, включая архив (время — UTC-таймстемп).
     """
     try:
-        async with aiosqlite.connect(DB_NAME) as db:
-            cursor = await db.execute(
-                "SELECT id, title, date, time, tag, status FROM events WHERE user_id=? ORDER BY date, time",
-                (user_id,)
-            )
+        async with _reader() as db:
+            cursor = await db.execute(*_events_with_archive("user_id=?", (user_id,), "starts_at, id"))
             rows = await cursor.fetchall()
             return list(map(tuple, rows))
     except Exception as e:
         logging.error(f"Ошибка получения всех событий пользователя: {e}")
-        return []
\ No newline at end of file
+        return []
+
+# Полнотекстовый поиск по названиям событий пользователя (FTS5, ранжирование bm25)
+SEARCH_MAX_WORDS = 8
+# bm25 считается только для стольких самых новых совпадений: для частых слов это ограничивает работу
+SEARCH_CANDIDATES = 500
+
+def _fts_query(user_id: int, text: str) -> Optional[str]:
+    # Слова запроса — префиксы, все должны встретиться в названии; кавычки и операторы FTS5 отбрасываются
+    words = _fts_words(text)[:SEARCH_MAX_WORDS]
+    if not words:
+        return None
+    return " AND ".join(f'"u{user_id}x{word}"*' for word in words)
+
+@timed_query
+async def search_events(user_id: int, text: str, limit: int = 20) -> List[Tuple[Any, str, int, str, str]]:
+    """
+    Ищет события пользователя (включая архив и повторяющиеся) по словам названия: каждое слово
+    считается началом слова в названии. Возвращает до limit лучших по bm25 среди
+    SEARCH_CANDIDATES самых новых совпадений-событий и SEARCH_CANDIDATES самых новых правил:
+    правила отбираются отдельно, чтобы длинная история событий их не вытесняла.
+    Повторяющееся событие приходит с id вида r<id правила> и временем первого вхождения.
+    Возвращает: (id, title, starts_at, tag, status)
+    """
+    query = _fts_query(user_id, text)
+    if query is None:
+        return []
+    try:
+        async with _reader() as db:
+            cursor = await db.execute(
+                """
+                WITH candidates AS (
+                    SELECT * FROM (
+                        SELECT rowid AS id, bm25(events_fts) AS score
+                        FROM events_fts WHERE events_fts MATCH ? AND rowid > 0 ORDER BY rowid DESC LIMIT ?
+                    )
+                    UNION ALL
+                    SELECT * FROM (
+                        SELECT rowid AS id, bm25(events_fts) AS score
+                        FROM events_fts WHERE events_fts MATCH ? AND rowid < 0 ORDER BY rowid LIMIT ?
+                    )
+                ),
+                hits AS (SELECT id, score FROM candidates ORDER BY score, id DESC LIMIT ?)
+                SELECT e.id, e.title, e.starts_at, e.tag, e.status, hits.score FROM hits JOIN events e ON e.id = hits.id
+                UNION ALL
+                SELECT a.id, a.title, a.starts_at, a.tag, a.status, hits.score FROM hits JOIN events_archive a ON a.id = hits.id
+                UNION ALL
+                SELECT 'r' || r.id, r.title, r.starts_at, r.tag, 'active', hits.score FROM hits JOIN event_rules r ON r.id = -hits.id
+                ORDER BY 6
+                """,
+                (query, SEARCH_CANDIDATES, query, SEARCH_CANDIDATES, limit)
+            )
+            return [tuple(row[:5]) for row in await cursor.fetchall()]
+    except Exception as e:
+        logging.error(f"Ошибка поиска событий: {e}")
+        return []
+
+# Потоково перебрать события (выгрузка): строки читаются с курсора пачками, без fetchall
+async def iter_events(user_id: Optional[int] = None) -> AsyncIterator[Tuple[int, int, str, int, str, str]]:
+    """
+    Отдаёт события пользователя (или всей базы при user_id=None) вместе с архивом:
+    сначала архив, затем events, внутри — по времени начала (для всей базы — по id).
+    Пока перебор не закончен, одно соединение на чтение занято.
+    Возвращает: (id, user_id, title, starts_at, tag, status)
+    """
+    where, order, params = ("WHERE user_id=?", "starts_at, id", (user_id,)) if user_id is not None else ("", "id", ())
+    async with _reader() as db:
+        for table in ("events_archive", "events"):
+            cursor = await db.execute(
+                f"SELECT id, user_id, title, starts_at, tag, status FROM {table} {where} ORDER BY {order}", params
+            )
+            cursor.arraysize = 500
+            async for row in cursor:
+                yield tuple(row)
+
+async def iter_rules(user_id: Optional[int] = None) -> AsyncIterator[Tuple[Rule, List[Tuple[int, Optional[str], Optional[int]]]]]:
+    """
+    Отдаёт правила повторения пользователя (или всей базы при user_id=None) по id вместе
+    с их исключениями. Правила читаются пачками по OVERRIDES_CHUNK, исключения — одним
+    запросом на пачку. Пока перебор не закончен, одно соединение на чтение занято.
+    Возвращает: (правило, [(occurrence_at, status, moved_to)])
+    """
+    where, params = ("WHERE user_id=?", (user_id,)) if user_id is not None else ("", ())
+    async with _reader() as db:
+        cursor = await db.execute(f"SELECT {_rule_select()} FROM event_rules {where} ORDER BY id", params)
+        while True:
+            rules = [_rule_from_row(row) for row in await cursor.fetchmany(OVERRIDES_CHUNK)]
+            if not rules:
+                break
+            by_rule: Dict[int, List[Tuple[int, Optional[str], Optional[int]]]] = {}
+            overrides = await _get_overrides(db, [rule.id for rule in rules])
+            for (rule_id, occurrence_at), (status, moved_to, _) in sorted(overrides.items()):
+                by_rule.setdefault(rule_id, []).append((occurrence_at, status, moved_to))
+            for rule in rules:
+                yield rule, by_rule.get(rule.id, [])
+
+# Перенести прошедшие события в архив пачками (обслуживание по расписанию)
+@timed_query
+async def archive_events(before: int, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Переносит события с началом раньше before из events в events_archive пачками по batch_size,
+    каждую — отдельной транзакцией, чтобы между ними проходили обычные записи. Незавершённые
+    события попадают в архив со статусом 'overdue'. Возвращает число перенесённых событий.
+    """
+    moved, last_id = 0, 0
+    try:
+        while True:
+            async with _writer() as db:
+                # Обход по rowid с продолжением от последнего id: за всё время — один проход по таблице
+                cursor = await db.execute(
+                    "SELECT id FROM events WHERE id > ? AND starts_at < ? ORDER BY id LIMIT ?",
+                    (last_id, before, batch_size)
+                )
+                ids = [row[0] for row in await cursor.fetchall()]
+                if not ids:
+                    break
+                placeholders = ",".join("?" * len(ids))
+                await db.execute(
+                    "INSERT OR IGNORE INTO events_archive (id, user_id, title, starts_at, tag, status, archived_at) "
+                    "SELECT id, user_id, title, starts_at, tag, "
+                    "CASE WHEN status IN ('active', 'reminded') THEN 'overdue' ELSE status END, ? "
+                    f"FROM events WHERE id IN ({placeholders})",
+                    (int(time.time()), *ids)
+                )
+                await db.execute(f"DELETE FROM events WHERE id IN ({placeholders})", ids)
+            moved += len(ids)
+            last_id = ids[-1]
+            await asyncio.sleep(0)
+    except Exception as e:
+        logging.error(f"Ошибка переноса событий в архив: {e}")
+    return moved
+
+# Вернуть освободившиеся страницы файлу и обновить статистику планировщика запросов
+@timed_query
+async def vacuum_db() -> None:
+    """
+    Выполняет PRAGMA incremental_vacuum и ANALYZE. База, созданная без auto_vacuum=INCREMENTAL,
+    один раз переводится в этот режим полным VACUUM.
+    """
+    try:
+        async with _writer() as db:
+            (mode,), = await db.execute_fetchall("PRAGMA auto_vacuum")
+            if mode != 2:
+                await db.execute_fetchall("PRAGMA auto_vacuum=INCREMENTAL")
+                await db.execute_fetchall("VACUUM")
+                logging.info("База переведена в режим auto_vacuum=INCREMENTAL.")
+            else:
+                await db.execute_fetchall("PRAGMA incremental_vacuum")
+            # analysis_limit ограничивает ANALYZE выборкой строк индекса, чтобы он шёл быстро на большой базе
+            await db.execute_fetchall("PRAGMA analysis_limit=1000")
+            await db.execute_fetchall("ANALYZE")
+    except Exception as e:
+        logging.error(f"Ошибка обслуживания базы данных: {e}")
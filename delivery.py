@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from config import DELIVERY_WORKERS, DELIVERY_RATE, DELIVERY_CHAT_INTERVAL, DELIVERY_MAX_ATTEMPTS
+
+class TokenBucket:
+    """
+    Глобальный ограничитель скорости: rate токенов в секунду, запас не больше capacity.
+    Поддерживает паузу (например, по TelegramRetryAfter).
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Токены копятся только после паузы, иначе сразу за ней ушла бы пачка сообщений
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+@dataclass
+class _Job:
+    chat_id: int
+    text: str
+    done: asyncio.Future
+    attempts: int = 0
+
+@dataclass
+class DeliveryStats:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    flood_waits: int = 0
+    by_error: Dict[str, int] = field(default_factory=dict)
+
+class DeliveryPipeline:
+    """
+    Конвейер отправки сообщений: ограниченное число воркеров, общий token bucket под лимит
+    Telegram и интервал между сообщениями в один чат. TelegramRetryAfter приостанавливает
+    всю отправку и возвращает сообщение в очередь; блокировка бота пользователем — окончательная ошибка.
+    """
+    def __init__(self, bot: Bot, workers: int = DELIVERY_WORKERS, rate: float = DELIVERY_RATE,
+                 chat_interval: float = DELIVERY_CHAT_INTERVAL, max_attempts: int = DELIVERY_MAX_ATTEMPTS) -> None:
+        self.bot = bot
+        self.workers_count = workers
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.bucket = TokenBucket(rate)
+        self.stats = DeliveryStats()
+        self._queue: "asyncio.Queue[_Job]" = asyncio.Queue()
+        self._chat_next: Dict[int, float] = {}
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        for _ in range(self.workers_count):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def deliver(self, messages: List[Tuple[int, str]]) -> List[bool]:
+        """
+        Ставит сообщения (chat_id, text) в очередь и ждёт окончания их отправки.
+        Возвращает для каждого сообщения признак успешной доставки.
+        """
+        if not messages:
+            return []
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        jobs = [_Job(chat_id, text, loop.create_future()) for chat_id, text in messages]
+        for job in jobs:
+            self._queue.put_nowait(job)
+        logging.info(f"В очередь доставки поставлено {len(jobs)} сообщений, глубина очереди {self.queue_depth}.")
+        results = await asyncio.gather(*(job.done for job in jobs))
+        elapsed = max(time.monotonic() - started, 1e-6)
+        delivered = sum(results)
+        logging.info(
+            f"Доставлено {delivered}/{len(jobs)} сообщений за {elapsed:.2f} с "
+            f"({delivered / elapsed:.1f} сообщ./с), в очереди {self.queue_depth}."
+        )
+        return list(results)
+
+    async def _wait_chat_slot(self, chat_id: int) -> None:
+        # Сообщения в один чат не чаще одного в chat_interval секунд
+        now = time.monotonic()
+        slot = max(self._chat_next.get(chat_id, 0.0), now)
+        self._chat_next[chat_id] = slot + self.chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        if len(self._chat_next) > 10000:
+            self._chat_next = {cid: t for cid, t in self._chat_next.items() if t > now}
+
+    def _finish(self, job: _Job, ok: bool, error: Optional[Exception] = None) -> None:
+        if ok:
+            self.stats.sent += 1
+        else:
+            self.stats.failed += 1
+            name = type(error).__name__ if error else "Unknown"
+            self.stats.by_error[name] = self.stats.by_error.get(name, 0) + 1
+        if not job.done.done():
+            job.done.set_result(ok)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._wait_chat_slot(job.chat_id)
+                await self.bucket.acquire()
+                job.attempts += 1
+                await self.bot.send_message(job.chat_id, job.text)
+                self._finish(job, True)
+            except TelegramRetryAfter as e:
+                # Flood control: останавливаем всю отправку и повторяем сообщение позже
+                logging.warning(f"Flood control Telegram: пауза {e.retry_after} с.")
+                self.stats.flood_waits += 1
+                self.bucket.pause(e.retry_after)
+                self._queue.put_nowait(job)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Бот заблокирован, чат не найден и т.п. — повтор не поможет
+                logging.warning(f"Сообщение пользователю {job.chat_id} не доставлено: {e}")
+                self._finish(job, False, e)
+            except asyncio.CancelledError:
+                if not job.done.done():
+                    job.done.cancel()
+                raise
+            except Exception as e:
+                if job.attempts < self.max_attempts:
+                    self.stats.retried += 1
+                    await asyncio.sleep(job.attempts)
+                    self._queue.put_nowait(job)
+                else:
+                    logging.error(f"Ошибка отправки сообщения пользователю {job.chat_id}: {e}")
+                    self._finish(job, False, e)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import time
+from datetime import datetime, timezone, tzinfo
+from typing import List, Optional, TextIO, Tuple
+
+if __name__ == "__main__":
+    # Офлайн-выгрузке токен не нужен, но config при импорте создаёт экземпляр Bot
+    os.environ.setdefault("BOT_TOKEN", "0:offline")
+
+from config import TZ
+from db import close_pool, iter_events, iter_rules, open_pool
+from importer import ICS_WEEKDAYS
+from recurrence import Rule, occurrence_ref
+from zones import get_zone
+
+EXPORT_FORMATS = ("csv", "ics")
+# Колонки CSV: первые четыре совпадают с форматом импорта, так что выгрузку можно загрузить обратно.
+# Повтор — RRULE правила повторения; исключения правила идут строками с id вида r12-20250101.
+CSV_COLUMNS = ("Название", "Дата", "Время", "Тег", "Статус", "id", "user_id", "Повтор")
+ICS_LINE_OCTETS = 75
+
+Row = Tuple[int, int, str, int, str, str]
+Override = Tuple[int, Optional[str], Optional[int]]
+
+def _ics_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _ics_fold(line: str) -> str:
+    # RFC 5545: строки длиннее 75 байт переносятся, продолжение начинается с пробела
+    encoded = line.encode("utf-8")
+    if len(encoded) <= ICS_LINE_OCTETS:
+        return line + "\r\n"
+    parts, current, size = [], "", 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        if size + width > (ICS_LINE_OCTETS if not parts else ICS_LINE_OCTETS - 1):
+            parts.append(current)
+            current, size = "", 0
+        current += char
+        size += width
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+def _ics_time(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def _ics_local(ts: int, zone: tzinfo) -> str:
+    return datetime.fromtimestamp(ts, zone).strftime("%Y%m%dT%H%M%S")
+
+def _rrule(rule: Rule) -> str:
+    # Обратное к importer.parse_rrule: UNTIL в UTC, как требует RFC 5545 при DTSTART с TZID
+    parts = [f"FREQ={rule.freq.upper()}"]
+    if rule.interval > 1:
+        parts.append(f"INTERVAL={rule.interval}")
+    if rule.weekdays:
+        parts.append("BYDAY=" + ",".join(ICS_WEEKDAYS[day] for day in rule.weekdays))
+    if rule.until is not None:
+        parts.append(f"UNTIL={_ics_time(rule.until)}")
+    if rule.count is not None:
+        parts.append(f"COUNT={rule.count}")
+    return ";".join(parts)
+
+def _write_ics_event(f: TextIO, row: Row, stamp: str) -> None:
+    event_id, _, title, starts_at, tag, _ = row
+    f.write("BEGIN:VEVENT\r\n")
+    f.write(_ics_fold(f"UID:{event_id}@sirius-schedule-bot"))
+    f.write(f"DTSTAMP:{stamp}\r\n")
+    f.write(f"DTSTART:{_ics_time(starts_at)}\r\n")
+    f.write(_ics_fold(f"SUMMARY:{_ics_escape(title or '')}"))
+    if tag:
+        f.write(_ics_fold(f"CATEGORIES:{_ics_escape(tag)}"))
+    f.write("END:VEVENT\r\n")
+
+def _write_ics_rule(f: TextIO, rule: Rule, overrides: List[Override], stamp: str) -> None:
+    """
+    Правило повторения — VEVENT с RRULE в часовом поясе правила. Удалённые вхождения
+    попадают в EXDATE, перенесённые — отдельными VEVENT с тем же UID и RECURRENCE-ID.
+    """
+    zone = get_zone(rule.tz)
+    uid = _ics_fold(f"UID:r{rule.id}@sirius-schedule-bot")
+    summary = _ics_fold(f"SUMMARY:{_ics_escape(rule.title or '')}")
+    categories = _ics_fold(f"CATEGORIES:{_ics_escape(rule.tag)}") if rule.tag else ""
+    f.write("BEGIN:VEVENT\r\n")
+    f.write(uid)
+    f.write(f"DTSTAMP:{stamp}\r\n")
+    f.write(_ics_fold(f"DTSTART;TZID={zone.zone}:{_ics_local(rule.starts_at, zone)}"))
+    f.write(f"RRULE:{_rrule(rule)}\r\n")
+    for occurrence_at, status, _ in overrides:
+        if status == "deleted":
+            f.write(_ics_fold(f"EXDATE;TZID={zone.zone}:{_ics_local(occurrence_at, zone)}"))
+    f.write(summary)
+    f.write(categories)
+    f.write("END:VEVENT\r\n")
+    for occurrence_at, status, moved_to in overrides:
+        if moved_to is None or status == "deleted":
+            continue
+        f.write("BEGIN:VEVENT\r\n")
+        f.write(uid)
+        f.write(f"DTSTAMP:{stamp}\r\n")
+        f.write(_ics_fold(f"RECURRENCE-ID;TZID={zone.zone}:{_ics_local(occurrence_at, zone)}"))
+        f.write(f"DTSTART:{_ics_time(moved_to)}\r\n")
+        f.write(summary)
+        f.write(categories)
+        f.write("END:VEVENT\r\n")
+
+async def export_events(path: str, fmt: str, user_id: Optional[int] = None, tz: tzinfo = TZ) -> int:
+    """
+    Записывает события пользователя (или всей базы при user_id=None) и правила повторения
+    с их исключениями в файл path в формате csv или ics. Строки читаются с курсора и пишутся
+    по одной, так что память не зависит от размера истории. Дата и время в CSV — в часовом
+    поясе tz (в ics — UTC, у правил — их часовой пояс). Возвращает число выгруженных событий
+    и правил. Пул соединений должен быть открыт.
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS)
+            async for row in iter_events(user_id):
+                event_id, owner, title, starts_at, tag, status = row
+                local = datetime.fromtimestamp(starts_at, tz)
+                writer.writerow((title, f"{local:%Y-%m-%d}", f"{local:%H:%M}", tag or "", status, event_id, owner, ""))
+                count += 1
+            async for rule, overrides in iter_rules(user_id):
+                local = datetime.fromtimestamp(rule.starts_at, tz)
+                writer.writerow((rule.title, f"{local:%Y-%m-%d}", f"{local:%H:%M}", rule.tag, "", f"r{rule.id}",
+                                 rule.user_id, _rrule(rule)))
+                for occurrence_at, status, moved_to in overrides:
+                    local = datetime.fromtimestamp(moved_to or occurrence_at, tz)
+                    writer.writerow((rule.title, f"{local:%Y-%m-%d}", f"{local:%H:%M}", rule.tag, status or "active",
+                                     occurrence_ref(rule.id, occurrence_at, get_zone(rule.tz)), rule.user_id, ""))
+                count += 1
+        else:
+            stamp = _ics_time(int(time.time()))
+            f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//sirius-it-round//schedule-bot//RU\r\n")
+            async for row in iter_events(user_id):
+                _write_ics_event(f, row, stamp)
+                count += 1
+            async for rule, overrides in iter_rules(user_id):
+                _write_ics_rule(f, rule, overrides, stamp)
+                count += 1
+            f.write("END:VCALENDAR\r\n")
+    return count
+
+async def _dump(db_name: str, path: str, fmt: str, user_id: Optional[int]) -> int:
+    # Резервная копия не должна менять исходную базу: только чтение, без миграций
+    await open_pool(db_name, readers=1, read_only=True)
+    try:
+        return await export_events(path, fmt, user_id)
+    finally:
+        await close_pool()
+
+def main() -> None:
+    """
+    Офлайн-выгрузка без запуска бота, например для резервной копии всей базы:
+    python exporter.py --db events.db --format csv --out backup.csv
+    """
+    parser = argparse.ArgumentParser(description="Выгрузка событий в CSV или iCalendar")
+    parser.add_argument("--db", default="events.db", help="Путь к базе")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--out", required=True, help="Файл для выгрузки")
+    parser.add_argument("--user", type=int, help="Только события одного пользователя")
+    args = parser.parse_args()
+    count = asyncio.run(_dump(args.db, args.out, args.format, args.user))
+    print(f"{args.out}: выгружено событий — {count}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import csv
+import re
+from datetime import datetime, tzinfo
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import pytz
+from config import TZ
+from recurrence import FREQUENCIES, MAX_COUNT
+
+# Первая строка CSV считается заголовком, если в первой колонке одно из этих слов
+CSV_HEADER_WORDS = {"title", "name", "summary", "название", "событие"}
+ICS_WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+RRULE_PARTS = {"FREQ", "INTERVAL", "BYDAY", "UNTIL", "COUNT", "WKST"}
+# id исключения правила в выгрузке CSV (см. recurrence.occurrence_ref)
+OVERRIDE_REF = re.compile(r"r\d+-\d{8}")
+
+class RawRule(NamedTuple):
+    """
+    Правило повторения из RRULE в виде аргументов db.add_rule.
+    """
+    freq: str
+    interval: int = 1
+    weekdays: Tuple[int, ...] = ()
+    until: Optional[int] = None
+    count: Optional[int] = None
+
+class RawEvent(NamedTuple):
+    """
+    Событие из файла в том же виде, что и аргументы /add: название, дата YYYY-MM-DD,
+    время HH:MM, тег. error — причина, по которой строку не удалось разобрать;
+    rule — правило повторения, если событие повторяющееся.
+    """
+    line: int
+    title: str = ""
+    date: str = ""
+    time: str = ""
+    tag: str = ""
+    error: str = ""
+    rule: Optional[RawRule] = None
+
+def iter_csv(lines: Iterable[str]) -> Iterator[RawEvent]:
+    """
+    Разбирает CSV построчно: колонки название, дата, время и необязательный тег.
+    Разделитель (запятая или точка с запятой) определяется по первой строке.
+    Если в заголовке есть колонки «Повтор» и «id» (файл из /export), строка с RRULE
+    становится правилом повторения, а строки исключений правил (id вида r12-20250101) пропускаются.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    delimiter = ";" if first.count(";") > first.count(",") else ","
+    reader = csv.reader(chain([first], lines), delimiter=delimiter)
+    columns: Dict[str, int] = {}
+    for row in reader:
+        cells = [cell.strip() for cell in row]
+        if not any(cells):
+            continue
+        if reader.line_num == 1 and cells[0].lower() in CSV_HEADER_WORDS:
+            columns = {cell.lower(): index for index, cell in enumerate(cells)}
+            continue
+        if len(cells) < 3:
+            yield RawEvent(reader.line_num, error="нужны колонки: название, дата, время[, тег]")
+            continue
+        if OVERRIDE_REF.fullmatch(_cell(cells, columns.get("id"))):
+            yield RawEvent(reader.line_num, error="исключения повторяющихся событий не загружаются")
+            continue
+        repeat = _cell(cells, columns.get("повтор"))
+        yield RawEvent(reader.line_num, cells[0], cells[1], cells[2], cells[3] if len(cells) > 3 else "",
+                       rule=parse_rrule(repeat) if repeat else None)
+
+def _cell(cells: List[str], index: Optional[int]) -> str:
+    return cells[index] if index is not None and index < len(cells) else ""
+
+def _unfold(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    # RFC 5545: строка, начинающаяся с пробела или табуляции, продолжает предыдущую
+    current: Optional[str] = None
+    start = 0
+    for number, raw in enumerate(lines, start=1):
+        raw = raw.rstrip("\r\n")
+        if raw[:1] in (" ", "\t") and current is not None:
+            current += raw[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = raw, number
+    if current is not None:
+        yield start, current
+
+def _unescape(value: str) -> str:
+    return (value.replace("\\n", " ").replace("\\N", " ").replace("\\,", ",")
+            .replace("\\;", ";").replace("\\\\", "\\"))
+
+def _ics_start(params: Dict[str, str], value: str, tz: tzinfo = TZ) -> datetime:
+    """
+    Значение DTSTART в часовом поясе пользователя tz: UTC (…Z), с TZID, «плавающее»
+    (считается временем tz) или дата целого дня (начало дня).
+    """
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return tz.localize(datetime.strptime(value, "%Y%m%d"))
+    if value.endswith("Z"):
+        return pytz.utc.localize(datetime.strptime(value, "%Y%m%dT%H%M%SZ")).astimezone(tz)
+    naive = datetime.strptime(value, "%Y%m%dT%H%M%S")
+    try:
+        zone = pytz.timezone(params["TZID"]) if "TZID" in params else tz
+    except pytz.UnknownTimeZoneError:
+        zone = tz
+    return zone.localize(naive).astimezone(tz)
+
+def parse_rrule(value: str, tz: tzinfo = TZ) -> Optional[RawRule]:
+    """
+    Разбирает RRULE с FREQ=DAILY или WEEKLY (INTERVAL, BYDAY для WEEKLY, UNTIL, COUNT).
+    Для остальных правил возвращает None — тогда импортируется только первое вхождение.
+    """
+    parts = dict(part.split("=", 1) for part in value.upper().split(";") if "=" in part)
+    freq = parts.get("FREQ", "").lower()
+    if freq not in FREQUENCIES or set(parts) - RRULE_PARTS or (freq == "daily" and "BYDAY" in parts):
+        return None
+    try:
+        interval = int(parts.get("INTERVAL", 1))
+        weekdays = tuple(ICS_WEEKDAYS.index(day) for day in parts["BYDAY"].split(",")) if "BYDAY" in parts else ()
+        until = None
+        if "UNTIL" in parts:
+            until = int(_ics_start({}, parts["UNTIL"], tz).timestamp())
+            if len(parts["UNTIL"]) == 8:
+                until += 24 * 3600 - 1  # дата без времени включает весь день
+        count = min(int(parts["COUNT"]), MAX_COUNT) if "COUNT" in parts else None
+    except ValueError:
+        return None
+    if interval < 1 or (count is not None and count < 1):
+        return None
+    return RawRule(freq, interval, weekdays, until, count)
+
+def iter_ics(lines: Iterable[str], tz: tzinfo = TZ) -> Iterator[RawEvent]:
+    """
+    Разбирает iCalendar построчно: для каждого VEVENT берутся SUMMARY, DTSTART, CATEGORIES
+    (первая категория — тег) и RRULE. Ежедневные и еженедельные правила сохраняются как
+    повторяющиеся события, для остальных импортируется первое вхождение. Дата и время
+    событий переводятся в часовой пояс пользователя tz.
+    """
+    event: Optional[Dict[str, Tuple[Dict[str, str], str]]] = None
+    start = 0
+    for number, line in _unfold(lines):
+        name, _, value = line.partition(":")
+        name, *raw_params = name.split(";")
+        name = name.upper()
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event, start = {}, number
+        elif name == "END" and value.upper() == "VEVENT" and event is not None:
+            yield _ics_event(start, event, tz)
+            event = None
+        elif event is not None and name in ("SUMMARY", "DTSTART", "CATEGORIES", "RRULE"):
+            params = dict(p.split("=", 1) for p in raw_params if "=" in p)
+            event[name] = ({k.upper(): v.strip('"') for k, v in params.items()}, value)
+
+def _ics_event(line: int, event: Dict[str, Tuple[Dict[str, str], str]], tz: tzinfo) -> RawEvent:
+    if "DTSTART" not in event:
+        return RawEvent(line, error="нет DTSTART")
+    try:
+        starts = _ics_start(*event["DTSTART"], tz)
+    except ValueError:
+        return RawEvent(line, error=f"не удалось разобрать DTSTART {event['DTSTART'][1]}")
+    title = _unescape(event.get("SUMMARY", ({}, ""))[1])
+    categories: List[str] = event.get("CATEGORIES", ({}, ""))[1].split(",")
+    rule = parse_rrule(event["RRULE"][1], tz) if "RRULE" in event else None
+    return RawEvent(line, title, starts.strftime("%Y-%m-%d"), starts.strftime("%H:%M"), _unescape(categories[0]).strip(),
+                    rule=rule)
+
+def iter_file_events(path: str, kind: str, tz: tzinfo = TZ) -> Iterator[RawEvent]:
+    """
+    Построчно читает файл (csv или ics) с диска и отдаёт разобранные события — файл целиком
+    в память не загружается. Время событий iCalendar переводится в часовой пояс tz,
+    в CSV оно уже местное.
+    """
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+        yield from (iter_ics(f, tz) if kind == "ics" else iter_csv(f))
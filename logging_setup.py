@@ -0,0 +1,190 @@
+import atexit
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+# Пользователь и команда обрабатываемого обновления (задаются LoggingContextMiddleware)
+log_user_id: ContextVar[Optional[int]] = ContextVar("log_user_id", default=None)
+log_command: ContextVar[Optional[str]] = ContextVar("log_command", default=None)
+
+class ContextFilter(logging.Filter):
+    """
+    Добавляет в запись user_id и command текущего обновления. Работает в потоке вызова,
+    до постановки записи в очередь, поэтому видит контекст обработчика.
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "user_id"):
+            record.user_id = log_user_id.get()
+        if not hasattr(record, "command"):
+            record.command = log_command.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    Ограничивает частые однотипные записи: записи с extra={"sample_key": ...} пропускаются
+    не чаще limit раз за window секунд на ключ. Первая запись нового окна сообщает,
+    сколько записей было отброшено в предыдущем.
+    """
+    def __init__(self, limit: int, window: float) -> None:
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._windows: Dict[str, Tuple[float, int, int]] = {}  # ключ -> (начало окна, пропущено, отброшено)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample_key", None)
+        if key is None or self.limit <= 0:
+            return True
+        now = time.monotonic()
+        started, passed, dropped = self._windows.get(key, (now, 0, 0))
+        if now - started >= self.window:
+            if dropped:
+                record.msg = f"{record.msg} (за {self.window:g} с отброшено похожих записей: {dropped})"
+            started, passed, dropped = now, 0, 0
+        if passed >= self.limit:
+            self._windows[key] = (started, passed, dropped + 1)
+            return False
+        self._windows[key] = (started, passed + 1, dropped)
+        return True
+
+class TracebackQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который не вклеивает трассировку исключения в текст сообщения: она
+    форматируется в exc_text записи, и форматтер в потоке QueueListener выводит её сам
+    (JsonFormatter — отдельным полем exc). Кадры стека в очередь не попадают.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = record.exc_text or _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_EXC_FORMATTER = logging.Formatter()
+
+class JsonFormatter(logging.Formatter):
+    """
+    Одна JSON-строка на запись: время, уровень, логгер, сообщение, user_id и command.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ("user_id", "command"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False)
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    # Выполняется в потоке QueueListener, цикл событий не блокируется
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def _file_handler(path: str, rotation: str, max_bytes: int, when: str, backup_count: int) -> logging.Handler:
+    if rotation == "time":
+        handler: logging.handlers.BaseRotatingHandler = logging.handlers.TimedRotatingFileHandler(
+            path, when=when, backupCount=backup_count, encoding="utf-8"
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    return handler
+
+def setup_logging(
+    path: str,
+    level: str = "INFO",
+    fmt: str = "text",
+    rotation: str = "size",
+    max_bytes: int = 10 * 1024 * 1024,
+    when: str = "midnight",
+    backup_count: int = 14,
+    sample_limit: int = 20,
+    sample_window: float = 60.0
+) -> logging.handlers.QueueListener:
+    """
+    Настраивает корневой логгер: записи кладутся в очередь в потоке вызова, а в файл
+    (с ротацией по размеру или времени и сжатием gzip) и в консоль их пишет QueueListener
+    в отдельном потоке. fmt="json" включает структурированный вывод.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers: List[logging.Handler] = [
+        _file_handler(path, rotation, max_bytes, when, backup_count),
+        logging.StreamHandler(),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = TracebackQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(sample_limit, sample_window))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Дописываем очередь в файл при завершении процесса
+    atexit.register(listener.stop)
+    return listener
+
+class LoggingContextMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware роутера: запоминает user_id и команду (или префикс данных кнопки)
+    обновления, чтобы они попадали во все записи журнала его обработчика.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        command = None
+        if isinstance(event, Message) and event.text and event.text.startswith("/"):
+            command = event.text.split(maxsplit=1)[0].split("@", 1)[0]
+        elif isinstance(event, CallbackQuery) and event.data:
+            command = event.data.split(":", 1)[0]
+        user = getattr(event, "from_user", None)
+        user_token = log_user_id.set(user.id if user is not None else None)
+        command_token = log_command.set(command)
+        try:
+            return await handler(event, data)
+        finally:
+            log_user_id.reset(user_token)
+            log_command.reset(command_token)
@@ -1,25 +1,36 @@
 import asyncio
 import logging
 from aiogram import Dispatcher
-from config import bot
+from config import bot, BOT_MODE, METRICS_HOST, METRICS_PORT
 from bot import router
-from db import init_db
-from db import migrate_add_status_to_events
-from schedule import setup_scheduler
+from db import init_db, open_pool, close_pool
+from metrics import start_metrics_server, stop_metrics_server
+from schedule import setup_scheduler, shutdown_scheduler
+from webhook import run_webhook
 
 # Точка входа: инициализация БД, запуск планировщика и бота
 async def main() -> None:
     """
     Основная точка входа: инициализация базы данных, запуск планировщика и старт Telegram-бота.
     """
-    await migrate_add_status_to_events()  # миграция поля status, отдельно от init_db т.к. новая тестовая функция
-    await init_db()
-    setup_scheduler(bot)
-    dp = Dispatcher()
-    dp.include_router(router)
-    logging.info("Бот запущен и ожидает команды.")
-    await dp.start_polling(bot)
+    await open_pool()
+    metrics_runner = None
+    try:
+        await init_db()
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        await setup_scheduler(bot)
+        dp = Dispatcher()
+        dp.include_router(router)
+        logging.info(f"Бот запущен и ожидает команды (режим: {BOT_MODE}).")
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await shutdown_scheduler()
+        await stop_metrics_server(metrics_runner)
+        await close_pool()
     logging.info("Бот остановлен.")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main()) 
@@ -0,0 +1,235 @@
+import bisect
+import functools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """
+    Базовая метрика: имя, описание, имена меток. При создании регистрируется в REGISTRY.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        REGISTRY.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+class Counter(Metric):
+    """
+    Монотонно растущий счётчик.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, labels: LabelValues = (), amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+class Gauge(Metric):
+    """
+    Текущее значение; если задана функция, значение вычисляется при каждом чтении /metrics.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, function: Optional[Callable[[], float]] = None) -> None:
+        super().__init__(name, help_text)
+        self._value = 0.0
+        self._function = function
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def samples(self) -> List[str]:
+        value = self._function() if self._function is not None else self._value
+        return [f"{self.name} {_format_value(value)}"]
+
+class CallbackMetric(Metric):
+    """
+    Метрика с метками, значения которой вычисляются функциями при каждом чтении /metrics:
+    для счётчиков, которые ведёт сам объект (например, LRUCache).
+    """
+    def __init__(self, name: str, help_text: str, kind: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self.kind = kind
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set_function(self, labels: LabelValues, function: Callable[[], float]) -> None:
+        self._functions[labels] = function
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(function())}"
+            for labels, function in sorted(self._functions.items())
+        ]
+
+class Histogram(Metric):
+    """
+    Гистограмма с фиксированными границами корзин (кумулятивные _bucket, _sum, _count).
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}  # счётчики корзин + [+Inf, sum]
+
+    def observe(self, value: float, labels: LabelValues = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {_format_value(cumulative)}")
+        return lines
+
+# Все метрики процесса в порядке создания
+REGISTRY: List[Metric] = []
+
+def render() -> str:
+    """
+    Текстовый формат Prometheus (text/plain; version=0.0.4) для всех метрик процесса.
+    """
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+# Метрики бота
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время обработки команды или кнопки", ["handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Необработанные исключения в обработчиках", ["handler"])
+DB_QUERY_SECONDS = Histogram("db_query_seconds", "Время функции db.py, включая ожидание соединения", ["query"])
+REMINDER_LAG_SECONDS = Histogram(
+    "reminder_lag_seconds", "Отставание отправки напоминания от запланированного времени",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+REMINDER_TICK_EVENTS = Histogram(
+    "reminder_tick_events", "Число напоминаний за одно срабатывание движка",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+)
+REMINDER_SENT = Counter("reminder_sent_total", "Доставленные напоминания")
+REMINDER_FAILURES = Counter("reminder_send_failures_total", "Напоминания, которые не удалось доставить")
+REMINDER_RECONCILE_DURATION = Histogram("reminder_reconcile_duration_seconds", "Время сверки очереди напоминаний с базой")
+DIGEST_SENT = Counter("digest_sent_total", "Доставленные ежедневные сводки")
+DIGEST_SKIPPED = Counter("digest_skipped_total", "Ежедневные сводки, пропущенные из-за опоздания")
+DELIVERY_QUEUE_DEPTH = Gauge("delivery_queue_depth", "Сообщения в очереди конвейера доставки")
+PROCESS_CPU_SECONDS = Gauge("bot_process_cpu_seconds", "Процессорное время процесса с момента запуска", time.process_time)
+CACHE_HITS = CallbackMetric("cache_hits_total", "Попадания в кэш", "counter", ["cache"])
+CACHE_MISSES = CallbackMetric("cache_misses_total", "Промахи кэша", "counter", ["cache"])
+CACHE_EVICTIONS = CallbackMetric("cache_evictions_total", "Записи, вытесненные из кэша по размеру", "counter", ["cache"])
+CACHE_SIZE = CallbackMetric("cache_size", "Записи в кэше", "gauge", ["cache"])
+
+def register_cache(name: str, stats: Callable[[], Dict[str, int]]) -> None:
+    """
+    Отдаёт в /metrics счётчики кэша (LRUCache.stats) с меткой cache=name.
+    """
+    for metric, key in ((CACHE_HITS, "hits"), (CACHE_MISSES, "misses"), (CACHE_EVICTIONS, "evictions"), (CACHE_SIZE, "size")):
+        metric.set_function((name,), lambda key=key: stats()[key])
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+def timed_query(func: F) -> F:
+    """
+    Декоратор асинхронной функции db.py: время вызова попадает в db_query_seconds{query=имя функции}.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, (func.__name__,))
+    return wrapper  # type: ignore[return-value]
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware роутера: время и ошибки каждого обработчика по имени его функции
+    (имя, а не текст команды — так число меток не растёт от произвольного ввода).
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc((name,))
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, (name,))
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(body=render().encode("utf-8"),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+async def start_metrics_server(host: str, port: int) -> Optional[web.AppRunner]:
+    """
+    Поднимает отдельный HTTP-сервер с /metrics (по умолчанию только на localhost).
+    При port=0 метрики не публикуются.
+    """
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics.")
+    return runner
+
+async def stop_metrics_server(runner: Optional[web.AppRunner]) -> None:
+    if runner is not None:
+        await runner.cleanup()
@@ -0,0 +1,111 @@
+from datetime import date, datetime, timedelta, tzinfo
+from typing import Iterator, NamedTuple, Optional, Tuple
+from config import TZ
+from zones import get_zone
+
+FREQUENCIES = ("daily", "weekly")
+WEEKDAY_NAMES = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+MAX_COUNT = 1000
+# Верхняя граница для перебора вхождений правила с until или count (2100-01-01 UTC)
+FAR_FUTURE = 4102444800
+
+class Rule(NamedTuple):
+    """
+    Правило повторения события. starts_at — первое вхождение (UTC-таймстемп), его местное время
+    повторяется в каждом вхождении; freq — daily или weekly с шагом interval; weekdays — дни
+    недели для weekly (0 — понедельник, пусто — день первого вхождения); until — последний
+    допустимый момент начала (включительно); count — число вхождений; tz — часовой пояс,
+    в котором правило создано (пусто — пояс бота): в нём повторяется местное время.
+    """
+    id: int
+    user_id: int
+    title: str
+    tag: str
+    starts_at: int
+    freq: str
+    interval: int = 1
+    weekdays: Tuple[int, ...] = ()
+    until: Optional[int] = None
+    count: Optional[int] = None
+    tz: Optional[str] = None
+
+def _dates(rule: Rule, first_day: date, tz: tzinfo) -> Iterator[Tuple[int, date]]:
+    # (номер вхождения, дата) начиная с периода, в который попадает first_day:
+    # номер считается арифметически, предыдущие вхождения не перебираются
+    start = datetime.fromtimestamp(rule.starts_at, tz).date()
+    step = max(rule.interval, 1)
+    if rule.freq == "daily":
+        n = max(0, -(-(first_day - start).days // step))
+        while True:
+            yield n, start + timedelta(days=n * step)
+            n += 1
+    weekdays = sorted(set(rule.weekdays)) or [start.weekday()]
+    first_week = [weekday for weekday in weekdays if weekday >= start.weekday()]
+    week0 = start - timedelta(days=start.weekday())
+    m = max(0, (first_day - week0).days // (7 * step))
+    while True:
+        week = week0 + timedelta(weeks=m * step)
+        if m == 0:
+            for i, weekday in enumerate(first_week):
+                yield i, week + timedelta(days=weekday)
+        else:
+            base = len(first_week) + (m - 1) * len(weekdays)
+            for i, weekday in enumerate(weekdays):
+                yield base + i, week + timedelta(days=weekday)
+        m += 1
+
+def occurrences(rule: Rule, start: int, end: int, tz: Optional[tzinfo] = None) -> Iterator[int]:
+    """
+    Времена начала вхождений правила в [start, end) по возрастанию (UTC-таймстемпы).
+    Работа пропорциональна числу вхождений в окне, а не числу вхождений с начала правила.
+    tz по умолчанию — часовой пояс правила.
+    """
+    if start >= end:
+        return
+    tz = tz or get_zone(rule.tz)
+    local_time = datetime.fromtimestamp(rule.starts_at, tz).time()
+    first_day = datetime.fromtimestamp(start, tz).date() - timedelta(days=1)
+    last_day = datetime.fromtimestamp(min(end, FAR_FUTURE), tz).date() + timedelta(days=1)
+    for index, day in _dates(rule, first_day, tz):
+        if day > last_day or (rule.count is not None and index >= rule.count):
+            return
+        ts = int(tz.localize(datetime.combine(day, local_time)).timestamp())
+        if (rule.until is not None and ts > rule.until) or ts >= end:
+            return
+        if ts >= start:
+            yield ts
+
+def occurrence_on(rule: Rule, day: date, tz: Optional[tzinfo] = None) -> Optional[int]:
+    """
+    Время начала вхождения правила в указанный местный день или None, если его в этот день нет.
+    """
+    tz = tz or get_zone(rule.tz)
+    day_start = tz.localize(datetime.combine(day, datetime.min.time()))
+    day_end = tz.localize(datetime.combine(day + timedelta(days=1), datetime.min.time()))
+    return next(occurrences(rule, int(day_start.timestamp()), int(day_end.timestamp()), tz), None)
+
+def last_occurrence(rule: Rule, tz: Optional[tzinfo] = None) -> Optional[int]:
+    """
+    Время начала последнего вхождения конечного правила (с until или count); None — если
+    правило бесконечно или не даёт ни одного вхождения.
+    """
+    if rule.until is None and rule.count is None:
+        return None
+    last = None
+    for last in occurrences(rule, rule.starts_at, FAR_FUTURE, tz):
+        pass
+    return last
+
+def occurrence_ref(rule_id: int, occurrence_at: int, tz: tzinfo = TZ) -> str:
+    """
+    Идентификатор вхождения для пользователя: r<id правила>-<местная дата YYYYMMDD>
+    (в день у правила не больше одного вхождения).
+    """
+    return f"r{rule_id}-{datetime.fromtimestamp(occurrence_at, tz):%Y%m%d}"
+
+# Ключ вхождения в очереди напоминаний: отрицательное число, чтобы не пересекаться с id событий
+def occurrence_key(rule_id: int, occurrence_at: int) -> int:
+    return -((rule_id << 32) | occurrence_at)
+
+def split_occurrence_key(key: int) -> Tuple[int, int]:
+    return (-key) >> 32, (-key) & 0xFFFFFFFF
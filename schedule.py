@@ -1,38 +1,321 @@
+import asyncio
+import heapq
+import time
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from functools import partial
 from aiogram import Bot
-from db import get_events_for_reminder
-from typing import Any
+from bot import render_digest
+from config import (
+    ARCHIVE_AFTER_DAYS, DIGEST_BATCH_SIZE, DIGEST_CATCHUP_SECONDS, DIGEST_CHECK_SECONDS, LEASE_SECONDS,
+    MAINTENANCE_HOUR, REMINDER_CATCHUP_SECONDS, REMINDER_HORIZON_SECONDS, REMINDER_RECONCILE_SECONDS, TZ, WORKER_ID
+)
+from db import (
+    REMIND_GRACE_SECONDS, archive_events, claim_digests, claim_partitions, get_events_for_reminder, iter_digest_events,
+    on_events_changed, reminder_partition, release_partitions, set_events_reminded, vacuum_db
+)
+from delivery import DeliveryPipeline
+from metrics import (
+    DELIVERY_QUEUE_DEPTH, DIGEST_SENT, DIGEST_SKIPPED, REMINDER_FAILURES, REMINDER_LAG_SECONDS,
+    REMINDER_RECONCILE_DURATION, REMINDER_SENT, REMINDER_TICK_EVENTS
+)
+from typing import Dict, List, Optional, Sequence, Set, Tuple
 import logging
-from pytz import timezone
 
 # Указываем нужную временную зону для планировщика
-scheduler = AsyncIOScheduler(timezone=timezone("Europe/Moscow"))
+scheduler = AsyncIOScheduler(timezone=TZ)
 
 # Отправка напоминаний пользователям
-async def send_reminders(bot: Bot) -> None:
+async def send_reminders(pipeline: DeliveryPipeline, events: List[Tuple[int, int, str]]) -> List[int]:
     """
     Отправляет напоминания пользователям о предстоящих событиях (только один раз).
+    Возвращает id событий, напоминания по которым доставлены.
     """
-    from db import set_events_reminded  # импорт внутри функции, чтобы избежать циклических импортов
-    events = await get_events_for_reminder()
-    # Группируем по пользователю для массового обновления
-    user_events = {}
-    for user_id, event_id, title in events:
-        try:
-            await bot.send_message(user_id, f"🔔 Напоминание: {title} через час!")
-        except Exception as e:
-            logging.error(f"Ошибка отправки напоминания пользователю {user_id}: {e}")
-        user_events.setdefault(user_id, []).append(event_id)
-    # После отправки обновляем статус событий на 'reminded'
-    for user_id, event_ids in user_events.items():
-        await set_events_reminded(event_ids, user_id)
+    # Сначала одной транзакцией переводим события тика в 'reminded': отправляем только те,
+    # что перевёл этот процесс, поэтому при смене владельца раздела дублей не бывает
+    claimed = set(await set_events_reminded([event_id for _, event_id, _ in events]))
+    to_send = [(user_id, event_id, title) for user_id, event_id, title in events if event_id in claimed]
+    results = await pipeline.deliver([(user_id, f"🔔 Напоминание: {title} через час!") for user_id, _, title in to_send])
+    delivered = [event_id for (_, event_id, _), ok in zip(to_send, results) if ok]
+    REMINDER_SENT.inc(amount=len(delivered))
+    REMINDER_FAILURES.inc(amount=len(to_send) - len(delivered))
+    return delivered
+
+class ReminderEngine:
+    """
+    Очередь ближайших напоминаний в памяти: куча по времени напоминания на горизонт
+    REMINDER_HORIZON_SECONDS вперёд. Спит ровно до ближайшего напоминания, обновляется
+    точечно при изменении событий пользователя и периодически сверяется с базой.
+    Обслуживает только разделы user_id, аренду которых держит процесс worker_id.
+
+    Для каждого раздела хранится водяной знак: все напоминания с remind_at не позже него
+    уже разосланы. Очередь загружается только с (водяной знак, конец горизонта], поэтому
+    после простоя или смены владельца раздела пропущенные напоминания досылаются — если
+    они опоздали не больше чем на catchup секунд.
+    """
+    def __init__(
+        self,
+        pipeline: DeliveryPipeline,
+        horizon: int = REMINDER_HORIZON_SECONDS,
+        worker_id: str = WORKER_ID,
+        lease_seconds: int = LEASE_SECONDS,
+        catchup: int = REMINDER_CATCHUP_SECONDS
+    ) -> None:
+        self.pipeline = pipeline
+        self.horizon = horizon
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.catchup = catchup
+        self.partitions: Set[int] = set()
+        self._watermarks: Dict[int, int] = {}  # раздел -> scanned_until
+        self._heap: List[Tuple[int, int]] = []  # (remind_at, event_id)
+        self._entries: Dict[int, Tuple[int, int, str]] = {}  # event_id -> (remind_at, user_id, title)
+        self._by_user: Dict[int, Set[int]] = {}
+        self._in_flight: Set[int] = set()
+        self._horizon_end = 0
+        self._reconciled_at = 0  # начало последней успешной сверки с базой
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _push(self, user_id: int, event_id: int, title: str, remind_at: int) -> None:
+        if event_id in self._in_flight:
+            return
+        self._entries[event_id] = (remind_at, user_id, title)
+        self._by_user.setdefault(user_id, set()).add(event_id)
+        heapq.heappush(self._heap, (remind_at, event_id))
+
+    def _drop_user(self, user_id: int) -> None:
+        # Записи в куче удаляются лениво: при извлечении сверяются с _entries
+        for event_id in self._by_user.pop(user_id, ()):
+            self._entries.pop(event_id, None)
+
+    def _set_partitions(self, claimed: Dict[int, Optional[int]]) -> None:
+        # Разделы без водяного знака начинаются с REMIND_GRACE_SECONDS назад
+        default = int(time.time()) - REMIND_GRACE_SECONDS
+        self._watermarks = {
+            partition: self._watermarks.get(partition, scanned_until if scanned_until is not None else default)
+            for partition, scanned_until in claimed.items()
+        }
+        self.partitions = set(claimed)
+
+    def _since(self, now: int, partition: int) -> int:
+        # Нижняя граница поиска: водяной знак, но не старше окна досылки
+        return max(self._watermarks.get(partition, now), now - self.catchup)
+
+    async def reconcile(self) -> None:
+        """
+        Перечитывает из базы напоминания своих разделов от водяных знаков до конца горизонта
+        и пересобирает очередь.
+        """
+        started = time.perf_counter()
+        now = int(time.time())
+        horizon_end = now + self.horizon
+        partitions = sorted(self.partitions)
+        since = min((self._since(now, partition) for partition in partitions), default=now)
+        rows = await get_events_for_reminder(since=since, until=horizon_end, partitions=partitions)
+        self._heap.clear()
+        self._entries.clear()
+        self._by_user.clear()
+        for user_id, event_id, title, remind_at in rows:
+            if remind_at > self._since(now, reminder_partition(user_id)):
+                self._push(user_id, event_id, title, remind_at)
+        self._horizon_end = horizon_end
+        self._reconciled_at = now
+        self._wakeup.set()
+        REMINDER_RECONCILE_DURATION.observe(time.perf_counter() - started)
+
+    async def refresh_user(self, user_id: int, starts: Sequence[int] = ()) -> None:
+        """
+        Обновляет напоминания одного пользователя в пределах текущего горизонта.
+        Пользователи чужих разделов пропускаются — их обслуживает владелец раздела.
+        """
+        partition = reminder_partition(user_id)
+        if partition not in self.partitions:
+            return
+        rows = await get_events_for_reminder(
+            since=self._since(int(time.time()), partition), until=self._horizon_end, user_id=user_id
+        )
+        self._drop_user(user_id)
+        for _, event_id, title, remind_at in rows:
+            self._push(user_id, event_id, title, remind_at)
+        self._wakeup.set()
+
+    def _advance_watermarks(self) -> Dict[int, int]:
+        """
+        Сдвигает водяные знаки своих разделов до момента, раньше которого в очереди
+        не осталось неотправленных напоминаний. Пока идёт отправка, знаки не двигаются.
+        Знак не обгоняет начало последней сверки: события, записанные другими процессами,
+        попадают в очередь только при сверке, и до неё их напоминания должны оставаться
+        выше водяного знака.
+        """
+        if not self._in_flight:
+            now = min(int(time.time()), self._reconciled_at)
+            next_due = self._next_remind_at()
+            scanned_until = now if next_due is None else min(now, next_due - 1)
+            for partition in self.partitions:
+                self._watermarks[partition] = max(self._watermarks.get(partition, scanned_until), scanned_until)
+        return {partition: self._watermarks[partition] for partition in self.partitions}
+
+    async def renew_leases(self) -> None:
+        """
+        Сохраняет водяные знаки, продлевает аренду разделов и при изменении набора
+        разделов пересобирает очередь.
+        """
+        claimed = await claim_partitions(self.worker_id, self.lease_seconds, self._advance_watermarks())
+        if set(claimed) != self.partitions:
+            logging.info(f"Разделы напоминаний процесса {self.worker_id}: {sorted(claimed)}")
+            self._set_partitions(claimed)
+            await self.reconcile()
+
+    def _pop_due(self, now: float) -> List[Tuple[int, int, str, int]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            remind_at, event_id = heapq.heappop(self._heap)
+            entry = self._entries.get(event_id)
+            if entry is None or entry[0] != remind_at:
+                continue  # устаревшая запись
+            del self._entries[event_id]
+            _, user_id, title = entry
+            self._by_user.get(user_id, set()).discard(event_id)
+            due.append((user_id, event_id, title, remind_at))
+        return due
+
+    def _next_remind_at(self) -> Optional[int]:
+        while self._heap and self._entries.get(self._heap[0][1], (None,))[0] != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def _seconds_to_next(self, now: float) -> Optional[float]:
+        next_due = self._next_remind_at()
+        return max(next_due - now, 0) if next_due is not None else None
+
+    async def run(self) -> None:
+        """
+        Основной цикл: отправляет наступившие напоминания и спит до следующего.
+        """
+        while True:
+            self._wakeup.clear()
+            due = self._pop_due(time.time())
+            if due:
+                REMINDER_TICK_EVENTS.observe(len(due))
+                self._in_flight.update(event_id for _, event_id, _, _ in due)
+                try:
+                    delivered = set(await send_reminders(self.pipeline, [event[:3] for event in due]))
+                    sent_at = time.time()
+                    for _, event_id, _, remind_at in due:
+                        if event_id in delivered:
+                            REMINDER_LAG_SECONDS.observe(sent_at - remind_at)
+                except Exception as e:
+                    REMINDER_FAILURES.inc(amount=len(due))
+                    logging.error(f"Ошибка отправки напоминаний: {e}")
+                finally:
+                    self._in_flight.difference_update(event_id for _, event_id, _, _ in due)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._seconds_to_next(time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        # Первая сверка досылает напоминания, пропущенные за время простоя
+        self._set_partitions(await claim_partitions(self.worker_id, self.lease_seconds))
+        logging.info(f"Разделы напоминаний процесса {self.worker_id}: {sorted(self.partitions)}")
+        await self.reconcile()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await release_partitions(self.worker_id, self._advance_watermarks())
+        self._set_partitions({})
+
+# Конвейер доставки и движок напоминаний процесса (создаются в setup_scheduler)
+pipeline: Optional[DeliveryPipeline] = None
+engine: Optional[ReminderEngine] = None
+
+# Ночное обслуживание базы
+async def run_maintenance() -> None:
+    """
+    Переносит события старше ARCHIVE_AFTER_DAYS в архив, затем освобождает место и обновляет
+    статистику. При нескольких процессах выполняется только владельцем раздела 0.
+    """
+    if engine is None or 0 not in engine.partitions:
+        return
+    started = time.perf_counter()
+    moved = await archive_events(int(time.time()) - ARCHIVE_AFTER_DAYS * 86400)
+    await vacuum_db()
+    logging.info(f"Обслуживание базы: в архив перенесено {moved} событий за {time.perf_counter() - started:.1f} с.")
+
+# Ежедневные сводки
+async def send_digests(pipeline: DeliveryPipeline, batch_size: int = DIGEST_BATCH_SIZE,
+                       catchup: int = DIGEST_CATCHUP_SECONDS) -> int:
+    """
+    Рассылает наступившие ежедневные сводки пачками по batch_size: пачка забирается в базе
+    (claim_digests), её события читаются одним запросом, а сообщения идут через конвейер
+    доставки с его ограничением скорости. Следующая пачка забирается, когда предыдущая
+    отправлена, так что очередь конвейера не вытесняет напоминания, а после сбоя рассылка
+    продолжается со следующей незабранной сводки. Сводки, опоздавшие больше чем на catchup
+    секунд, пропускаются. Возвращает число доставленных сообщений.
+    """
+    delivered = 0
+    while True:
+        now = int(time.time())
+        claims = await claim_digests(now, batch_size)
+        if not claims:
+            return delivered
+        fresh = [claim for claim in claims if claim[2] >= now - catchup]
+        DIGEST_SKIPPED.inc(amount=len(claims) - len(fresh))
+        messages = []
+        async for user_id, tz, day, events in iter_digest_events(fresh):
+            messages += [(user_id, text) for text in render_digest(events, day, tz)]
+        results = await pipeline.deliver(messages)
+        DIGEST_SENT.inc(amount=sum(results))
+        delivered += sum(results)
+
+async def run_digests() -> None:
+    """
+    Периодическая проверка сводок: отправляет все наступившие к этому моменту.
+    """
+    if pipeline is None:
+        return
+    try:
+        delivered = await send_digests(pipeline)
+        if delivered:
+            logging.info(f"Ежедневные сводки: доставлено {delivered} сообщений.")
+    except Exception as e:
+        logging.error(f"Ошибка рассылки ежедневных сводок: {e}")
 
 # Запуск планировщика напоминаний
-def setup_scheduler(bot: Bot) -> None:
+async def setup_scheduler(bot: Bot) -> None:
     """
-    Запускает планировщик напоминаний для Telegram-бота.
+    Запускает движок напоминаний и периодическую сверку его очереди с базой.
     """
-    scheduler.add_job(partial(send_reminders, bot), 'interval', minutes=1)
+    global pipeline, engine
+    pipeline = DeliveryPipeline(bot)
+    pipeline.start()
+    DELIVERY_QUEUE_DEPTH.set_function(lambda: pipeline.queue_depth)
+    engine = ReminderEngine(pipeline)
+    on_events_changed(engine.refresh_user)
+    await engine.start()
+    scheduler.add_job(engine.reconcile, 'interval', seconds=REMINDER_RECONCILE_SECONDS)
+    # Аренда продлевается трижды за срок, чтобы одна задержка не отдала разделы другим
+    scheduler.add_job(engine.renew_leases, 'interval', seconds=max(LEASE_SECONDS // 3, 1))
+    scheduler.add_job(run_maintenance, 'cron', hour=MAINTENANCE_HOUR)
+    # Рассылка сводок может идти дольше интервала: следующий запуск ждёт её окончания
+    scheduler.add_job(run_digests, 'interval', seconds=DIGEST_CHECK_SECONDS, max_instances=1, coalesce=True)
     scheduler.start()
     logging.info("Планировщик напоминаний запущен.")
+
+async def shutdown_scheduler() -> None:
+    """
+    Останавливает движок напоминаний и планировщик.
+    """
+    if engine is not None:
+        await engine.stop()
+    if pipeline is not None:
+        await pipeline.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
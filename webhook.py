@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import signal
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT
+
+async def health(request: web.Request) -> web.Response:
+    """
+    Проверка живости: процесс запущен и отвечает.
+    """
+    return web.json_response({"status": "ok"})
+
+async def ready(request: web.Request) -> web.Response:
+    """
+    Проверка готовности: приложение запущено и принимает обновления.
+    """
+    if request.app["ready"]:
+        return web.json_response({"status": "ready"})
+    return web.json_response({"status": "starting"}, status=503)
+
+def build_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """
+    Создаёт aiohttp-приложение: обработчик вебхука aiogram (с проверкой секретного токена),
+    /healthz и /readyz. Обновления обрабатываются в фоне, параллельно друг другу.
+    Без WEBHOOK_SECRET не запускается: иначе любой, кто знает адрес, может слать боту обновления.
+    """
+    if not WEBHOOK_SECRET:
+        logging.error("Режим вебхука требует WEBHOOK_SECRET.")
+        raise RuntimeError("WEBHOOK_SECRET не задан")
+    app = web.Application()
+    app["ready"] = False
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=WEBHOOK_SECRET,
+    ).register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/healthz", health)
+    app.router.add_get("/readyz", ready)
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """
+    Запускает HTTP-сервер вебхука и работает до SIGINT/SIGTERM, после чего корректно останавливается.
+    Без WEBHOOK_URL вебхук в Telegram не регистрируется — удобно для локальной отправки
+    записанных обновлений POST-запросом.
+    """
+    app = build_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await site.start()
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        app["ready"] = True
+        logging.info(f"Вебхук слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}.")
+        await stop.wait()
+    finally:
+        app["ready"] = False
+        await runner.cleanup()
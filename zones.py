@@ -0,0 +1,39 @@
+import re
+from datetime import tzinfo
+from functools import lru_cache
+from typing import Optional
+import pytz
+from config import TZ
+
+# Смещение от UTC в /tz: +5, -3, UTC+5, GMT-3
+UTC_OFFSET = re.compile(r"^(?:utc|gmt)?([+-])(\d{1,2})$", re.IGNORECASE)
+
+@lru_cache(maxsize=None)
+def get_zone(name: Optional[str]) -> tzinfo:
+    """
+    Объект часового пояса по названию из базы (Europe/Moscow, Etc/GMT-5). Пустое или неизвестное
+    название — часовой пояс бота TZ. Объекты кэшируются: поясов немного, а пользователей много.
+    """
+    if not name:
+        return TZ
+    try:
+        return pytz.timezone(name)
+    except pytz.UnknownTimeZoneError:
+        return TZ
+
+def parse_zone(text: str) -> str:
+    """
+    Название часового пояса из ввода пользователя: название IANA в любом регистре
+    (Europe/Berlin, asia/yekaterinburg, UTC) или смещение от UTC в часах (+5, UTC-3).
+    При ошибке выбрасывает ValueError.
+    """
+    name = text.strip()
+    match = UTC_OFFSET.match(name)
+    if match:
+        sign, hours = match.group(1), int(match.group(2))
+        # В зонах Etc/GMT знак обратный: UTC+5 — это Etc/GMT-5
+        name = f"Etc/GMT{'-' if sign == '+' else '+'}{hours}" if hours else "UTC"
+    try:
+        return pytz.timezone(name).zone
+    except (pytz.UnknownTimeZoneError, ValueError):
+        raise ValueError(text)